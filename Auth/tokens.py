@@ -0,0 +1,49 @@
+import hashlib
+import os
+import threading
+from Cache.lru import TTLCache
+
+# Decoded tokens are cached by hash, so repeated requests with the same token skip the HMAC
+# verification. An entry never outlives the token's exp claim, and invalid tokens are not cached.
+token_cache = TTLCache(
+    maxsize=int(os.environ.get("JWT_CACHE_SIZE", "1024")),
+    ttl=float(os.environ.get("JWT_CACHE_TTL", "300")),
+)
+
+_lock = threading.Lock()
+_secret = None
+
+# The signing secret is read from the environment once per process
+def get_jwt_secret() -> str | None:
+    global _secret
+    if _secret is None:
+        with _lock:
+            if _secret is None:
+                _secret = os.environ.get("JWT_SECRET")
+    return _secret
+
+# Forget the secret and every cached token, e.g. after rotating JWT_SECRET
+def reset_token_cache():
+    global _secret
+    with _lock:
+        _secret = None
+    token_cache.clear()
+
+class InvalidToken(Exception):
+    pass
+
+# Returns (user_id, isAdmin) from the token; raises InvalidToken when the token does not verify.
+# python-jose is only imported when a token actually has to be decoded.
+def verify_token(token: str) -> tuple:
+    key = hashlib.sha256(token.encode()).digest()
+    user = token_cache.get(key)
+    if user is None:
+        from jose import JWTError, jwt
+        try:
+            payload = jwt.decode(token, get_jwt_secret(), algorithms=["HS256"])
+        except JWTError as e:
+            raise InvalidToken(str(e)) from e
+        user = (payload.get("user_id"), payload.get("isAdmin", False))
+        exp = payload.get("exp")
+        token_cache.set(key, user, expires_at=float(exp) if isinstance(exp, (int, float)) else None)
+    return user
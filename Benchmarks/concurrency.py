@@ -0,0 +1,77 @@
+# Measure how many DynamoDB round trips one process overlaps. The table is a local stand-in that
+# sleeps for a fixed latency on every call, and requests go through the full ASGI app.
+#   python -m Benchmarks.concurrency --latency-ms 20 --requests 200 --concurrency 50 --workers 1 8 50
+import argparse
+import asyncio
+import os
+import time
+import httpx
+from jose import jwt
+
+class LatencyTable:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def _wait(self):
+        time.sleep(self.latency)
+
+    def get_item(self, Key, **kwargs):
+        self._wait()
+        return {"Item": {"cart_id": Key["cart_id"], "owner_id": "bench-user", "state": "open", "items": []}}
+
+    def put_item(self, Item, **kwargs):
+        self._wait()
+        return {}
+
+    def update_item(self, Key, **kwargs):
+        self._wait()
+        return {"Attributes": {"cart_id": Key["cart_id"], "owner_id": "bench-user", "state": "PAID", "items": []}}
+
+    def delete_item(self, Key, **kwargs):
+        self._wait()
+        return {}
+
+    def query(self, **kwargs):
+        self._wait()
+        return {"Items": []}
+
+async def drive(app, token, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        async def one(i):
+            async with semaphore:
+                response = await client.post("/v1/orders", headers={"Auth-Token": token})
+                response.raise_for_status()
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8, 50])
+    args = parser.parse_args()
+    os.environ.setdefault("JWT_SECRET", "bench-secret")
+    # One metrics record per request would flood the output (set METRICS_SINK to keep them)
+    os.environ.setdefault("METRICS_SINK", "none")
+
+    from main import app
+    from Database import repository
+    from Database.idempotency import IdempotencyStore
+    from Routes.orders import get_db_connection, get_idempotency_store
+    token = jwt.encode({"user_id": "bench-user"}, os.environ["JWT_SECRET"], algorithm="HS256")
+    table = LatencyTable(args.latency_ms / 1000)
+    app.dependency_overrides[get_db_connection] = lambda: table
+    app.dependency_overrides[get_idempotency_store] = lambda: IdempotencyStore(table)
+
+    for workers in args.workers:
+        os.environ["DDB_EXECUTOR_WORKERS"] = str(workers)
+        repository.shutdown_executor()
+        elapsed = asyncio.run(drive(app, token, args.requests, args.concurrency))
+        print(f"workers={workers:<4} {args.requests / elapsed:8.1f} req/s ({elapsed:.2f}s for {args.requests} requests)")
+    repository.shutdown_executor()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# Compare the latency of building a DynamoDB resource per request with reusing the shared one.
+# Runs against moto, so the numbers measure client-side overhead only (no network round trip).
+#   python -m Benchmarks.connection --requests 500
+import argparse
+import os
+import statistics
+import time
+import boto3
+from moto import mock_dynamodb
+from Database import connection
+from Database.schema import create_table
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def run(label, get_table, requests):
+    samples = []
+    for i in range(requests):
+        start = time.perf_counter()
+        get_table().get_item(Key={"cart_id": f"cart-{i % 10}"})
+        samples.append((time.perf_counter() - start) * 1000)
+    print(f"{label:<12} mean={statistics.mean(samples):7.3f}ms p50={percentile(samples, 50):7.3f}ms p99={percentile(samples, 99):7.3f}ms")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    os.environ.setdefault("AWS_DEFAULT_REGION", "ap-southeast-2")
+
+    with mock_dynamodb():
+        create_table(boto3.resource("dynamodb"))
+        connection.reset_connection()
+        run("per-request", lambda: boto3.resource("dynamodb").Table(connection.TABLE_NAME), args.requests)
+        run("pooled", connection.get_table, args.requests)
+
+if __name__ == "__main__":
+    main()
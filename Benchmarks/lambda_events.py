@@ -0,0 +1,35 @@
+import json
+from urllib.parse import urlencode
+
+# An API Gateway REST (payload v1) proxy event, as sent to main.handler by the serverless.yml http events
+def api_gateway_event(method: str, path: str, headers: dict | None = None, query: dict | None = None, body=None) -> dict:
+    headers = headers or {}
+    return {
+        "resource": "/{proxy+}",
+        "path": path,
+        "httpMethod": method,
+        "headers": headers,
+        "multiValueHeaders": {name: [value] for name, value in headers.items()},
+        "queryStringParameters": query,
+        "multiValueQueryStringParameters": {name: [value] for name, value in query.items()} if query else None,
+        "pathParameters": {"proxy": path.lstrip("/")},
+        "stageVariables": None,
+        "requestContext": {
+            "resourcePath": "/{proxy+}",
+            "httpMethod": method,
+            "path": "/dev" + path + ("?" + urlencode(query) if query else ""),
+            "stage": "dev",
+            "identity": {"sourceIp": "127.0.0.1"},
+            "requestId": "benchmark",
+        },
+        "body": None if body is None else json.dumps(body),
+        "isBase64Encoded": False,
+    }
+
+class LambdaContext:
+    function_name = "e-commerce-handler-dev-app"
+    memory_limit_in_mb = 1024
+    aws_request_id = "benchmark"
+
+    def get_remaining_time_in_millis(self):
+        return 30000
@@ -0,0 +1,342 @@
+# Load test of every route against an in-process DynamoDB stand-in (moto).
+#
+# Seeds carts with skewed owners (a few owners hold most carts) and skewed sizes (most carts are
+# small, some have hundreds of items), then sends a weighted mix of requests at a fixed concurrency
+# through the ASGI app, the Lambda handler (Mangum) or a uvicorn server on a local port (server
+# mode, see server.py), and reports latency percentiles, requests/second and DynamoDB calls per
+# request (from the Metrics middleware records).
+#
+#   python -m Benchmarks.load --carts 20000 --requests 5000 --concurrency 32 --driver asgi
+#   python -m Benchmarks.load ... --driver server     # the same traffic over HTTP (needs uvicorn)
+#   python -m Benchmarks.load ... --save-baseline     # store the results in Benchmarks/baselines.json
+#   python -m Benchmarks.load ... --check             # exit 1 when a route regressed against the baseline
+#
+# Baselines are stored with the dataset they were measured on (--carts, --owners, --max-items,
+# --requests, --seed, --routes) and --check refuses to compare runs on a different one. Any 5xx
+# response also fails --check. Latencies depend on the machine: the committed baselines.json was
+# measured with --carts 2000 --requests 600 --concurrency 8 on a development machine, so regenerate
+# it with --save-baseline (same arguments) on the machine that runs --check before relying on it.
+#
+# moto keeps everything in memory: millions of carts work but take a while to seed. The Lambda
+# driver runs handler invocations on threads, approximating several warm containers. moto's backend
+# is not thread-safe, so DynamoDB calls run on a single executor thread (DDB_EXECUTOR_WORKERS=1);
+# moto is CPU bound, so this costs little throughput. moto copies all its tables on every
+# TransactWriteItems call, so batchDelete and batchCheckout are slow here and delay the requests
+# queued behind them; measure routes apart with --routes. The server driver runs a single uvicorn
+# worker in this process, since moto's tables only exist here.
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+SECRET = "benchmark-secret"
+
+# Route name -> (weight in the request mix, route function reported by the metrics middleware)
+ROUTES = {
+    "create": (5, "create_shopping_cart"),
+    "get": (30, "get_shopping_cart"),
+    "patch_items": (15, "patch_shopping_cart_items"),
+    "replace_items": (5, "update_shopping_cart"),
+    "checkout": (5, "checkout_shopping_cart"),
+    "delete": (3, "delete_shopping_cart"),
+    "list_user": (20, "get_orders_by_user_and_state"),
+    "list_user_state": (10, "get_orders_by_user_and_state"),
+    "list_user_time": (5, "get_orders_by_user_and_state"),
+    "list_state": (2, "get_orders_by_user_and_state"),
+    "batch_get": (5, "batch_get_shopping_carts"),
+    "batch_delete": (1, "batch_delete_shopping_carts"),
+    "batch_checkout": (1, "batch_checkout_shopping_carts"),
+}
+STATES = ["open", "open", "open", "PAID", "SHIPPED"]
+
+class CollectingSink:
+    def __init__(self):
+        self.records = []
+
+    def emit(self, record, metrics):
+        self.records.append({**record, **{name: value for name, (value, unit) in metrics.items()}})
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def random_item(rng, n):
+    return {"item_id": f"item{n}", "name": f"product {n}", "description": None, "price": str(Decimal(rng.randint(100, 100000)) / 100), "quantity": rng.randint(1, 5)}
+
+# Owners are drawn from a Zipf-like distribution; cart sizes are mostly small with a long tail.
+# Carts were created over the last 90 days, for the time-ordered listing.
+def seed(table, carts: int, owners: int, max_items: int, rng) -> dict[str, list[str]]:
+    from Database.records import derived_attributes, items_attributes, timestamp
+    now = datetime.now(timezone.utc)
+    weights = [1 / (rank + 1) for rank in range(owners)]
+    owner_ids = [f"owner{n}" for n in range(owners)]
+    carts_by_owner = defaultdict(list)
+    with table.batch_writer() as writer:
+        for n in range(carts):
+            owner_id = rng.choices(owner_ids, weights)[0]
+            size = min(max_items, int(rng.paretovariate(1.2))) if rng.random() < 0.98 else max_items
+            items = [random_item(rng, i) for i in range(size)]
+            created_at = timestamp(now - timedelta(seconds=rng.randint(0, 90 * 86400)))
+            cart = {"cart_id": f"cart{n}", "owner_id": owner_id, "state": rng.choice(STATES), "created_at": created_at, "updated_at": created_at, **items_attributes(items)}
+            writer.put_item(Item={**cart, **derived_attributes(cart)})
+            carts_by_owner[owner_id].append(cart["cart_id"])
+    return carts_by_owner
+
+class Workload:
+    def __init__(self, carts_by_owner: dict[str, list[str]], rng):
+        from jose import jwt
+        self.rng = rng
+        self.carts_by_owner = carts_by_owner
+        self.owners = list(carts_by_owner)
+        self.tokens = {owner: jwt.encode({"user_id": owner}, SECRET, algorithm="HS256") for owner in self.owners}
+        self.admin_token = jwt.encode({"user_id": "admin", "isAdmin": True}, SECRET, algorithm="HS256")
+        self.created = []
+        names, weights = zip(*((name, weight) for name, (weight, _) in ROUTES.items()))
+        self.names, self.weights = names, weights
+
+    # (route, method, path, headers, query, body)
+    def next_request(self, only: set | None = None):
+        while True:
+            route = self.rng.choices(self.names, self.weights)[0]
+            if not only or route in only:
+                break
+        owner = self.rng.choice(self.owners)
+        cart_id = self.rng.choice(self.carts_by_owner[owner])
+        headers = {"auth-token": self.tokens[owner]}
+        admin = {"auth-token": self.admin_token}
+        if route == "create":
+            return route, "POST", "/v1/orders", headers, None, None
+        if route == "get":
+            return route, "GET", f"/v1/orders/{cart_id}", headers, None, None
+        if route == "patch_items":
+            n = self.rng.randint(0, 500)
+            return route, "PATCH", f"/v1/orders/{cart_id}/items", headers, None, [{"op": "add", "item": random_item(self.rng, n)}]
+        if route == "replace_items":
+            return route, "PATCH", f"/v1/orders/{cart_id}", headers, None, [random_item(self.rng, n) for n in range(self.rng.randint(1, 20))]
+        if route == "checkout":
+            return route, "POST", f"/v1/orders/{cart_id}/checkout", headers, None, None
+        if route == "delete":
+            # Only delete carts created during the run, so the seeded data stays intact
+            if self.created:
+                owner, created_id = self.created.pop()
+                return route, "DELETE", f"/v1/orders/{created_id}", {"auth-token": self.tokens[owner]}, None, None
+            return route, "DELETE", "/v1/orders/missing", headers, None, None
+        if route == "list_user":
+            return route, "GET", "/v1/orders", headers, {"user": owner, "limit": "50"}, None
+        if route == "list_user_state":
+            return route, "GET", "/v1/orders", headers, {"user": owner, "state": self.rng.choice(STATES)}, None
+        if route == "list_user_time":
+            # "My recent orders", or the orders of the last days
+            if self.rng.random() < 0.5:
+                return route, "GET", "/v1/orders", headers, {"user": owner, "newest_first": "true", "limit": "10"}, None
+            since = datetime.now(timezone.utc) - timedelta(days=self.rng.randint(1, 30))
+            return route, "GET", "/v1/orders", headers, {"user": owner, "since": since.strftime("%Y-%m-%dT%H:%M:%SZ"), "view": "summary"}, None
+        if route == "list_state":
+            return route, "GET", "/v1/orders", admin, {"state": self.rng.choice(STATES), "limit": "100"}, None
+        if route == "batch_get":
+            ids = [self.rng.choice(self.carts_by_owner[self.rng.choice(self.owners)]) for _ in range(50)]
+            return route, "POST", "/v1/orders:batchGet", admin, None, {"cart_ids": ids}
+        if route == "batch_delete":
+            # As for delete: carts created during the run, and a missing one
+            ids = [self.created.pop()[1] for _ in range(min(10, len(self.created)))]
+            return route, "POST", "/v1/orders:batchDelete", admin, None, {"cart_ids": ids + ["missing"]}
+        if route == "batch_checkout":
+            ids = [self.rng.choice(self.carts_by_owner[self.rng.choice(self.owners)]) for _ in range(20)]
+            return route, "POST", "/v1/orders:batchCheckout", admin, None, {"cart_ids": ids}
+
+    def created_cart(self, request, status, body):
+        if request[0] == "create" and status == 200:
+            owner = next(owner for owner, token in self.tokens.items() if token == request[3]["auth-token"])
+            self.created.append((owner, body["cart_id"]))
+
+# Requests through an httpx client: in process for the ASGI app, or over TCP to a server
+async def drive_http(client_kwargs, workload, requests, concurrency, only):
+    import httpx
+    latencies = defaultdict(list)
+    statuses = defaultdict(int)
+    remaining = requests
+    async with httpx.AsyncClient(**client_kwargs) as client:
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                request = workload.next_request(only)
+                route, method, path, headers, query, body = request
+                start = time.perf_counter()
+                response = await client.request(method, path, headers=headers, params=query, json=body)
+                latencies[route].append((time.perf_counter() - start) * 1000)
+                statuses[response.status_code] += 1
+                workload.created_cart(request, response.status_code, response.json() if route == "create" else None)
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses
+
+# uvicorn serving the app on a free local port from a background thread, with lifespan events
+# as in server mode; yields the base URL
+@contextmanager
+def local_server(app):
+    import socket
+    import threading
+    import uvicorn
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, lifespan="on", access_log=False, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+def drive_lambda(handler, workload, requests, concurrency, only):
+    from Benchmarks.lambda_events import LambdaContext, api_gateway_event
+    latencies = defaultdict(list)
+    statuses = defaultdict(int)
+    requests_to_send = [workload.next_request(only) for _ in range(requests)]
+
+    def invoke(request):
+        # Mangum expects an event loop on the calling thread
+        try:
+            asyncio.get_event_loop()
+        except RuntimeError:
+            asyncio.set_event_loop(asyncio.new_event_loop())
+        route, method, path, headers, query, body = request
+        start = time.perf_counter()
+        response = handler(api_gateway_event(method, path, headers, query, body), LambdaContext())
+        return route, (time.perf_counter() - start) * 1000, response["statusCode"]
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for route, latency, status in pool.map(invoke, requests_to_send):
+            latencies[route].append(latency)
+            statuses[status] += 1
+    return latencies, statuses
+
+# Metrics records only carry the route function, so the three listing routes report their combined
+# DynamoDB calls per request; run them on their own with --routes to separate them
+def summarize(latencies, records, elapsed) -> dict:
+    calls = defaultdict(list)
+    for record in records:
+        calls[record["Operation"]].append(record["ddb_calls"])
+    results = {}
+    for route, samples in sorted(latencies.items()):
+        operation_calls = calls.get(ROUTES[route][1], [0])
+        results[route] = {
+            "requests": len(samples),
+            "p50_ms": round(percentile(samples, 50), 3),
+            "p95_ms": round(percentile(samples, 95), 3),
+            "p99_ms": round(percentile(samples, 99), 3),
+            "ddb_calls_per_request": round(statistics.mean(operation_calls), 3),
+        }
+    total = sum(len(samples) for samples in latencies.values())
+    results["_all"] = {"requests": total, "requests_per_second": round(total / elapsed, 1)}
+    return results
+
+# A route regresses when it needs more DynamoDB calls per request, or when its p95 latency (or the
+# overall throughput) is worse than the baseline by more than the tolerance
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    failures = []
+    for route, result in results.items():
+        expected = baseline.get(route)
+        if expected is None:
+            continue
+        if route == "_all":
+            if result["requests_per_second"] < expected["requests_per_second"] * (1 - tolerance):
+                failures.append(f"throughput {result['requests_per_second']} req/s < baseline {expected['requests_per_second']}")
+            continue
+        if result["ddb_calls_per_request"] > expected["ddb_calls_per_request"] + 0.05:
+            failures.append(f"{route}: {result['ddb_calls_per_request']} DynamoDB calls/request > baseline {expected['ddb_calls_per_request']}")
+        if result["p95_ms"] > expected["p95_ms"] * (1 + tolerance):
+            failures.append(f"{route}: p95 {result['p95_ms']}ms > baseline {expected['p95_ms']}ms")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--carts", type=int, default=5000)
+    parser.add_argument("--owners", type=int, default=500)
+    parser.add_argument("--max-items", type=int, default=300, help="size of the largest carts")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--driver", choices=["asgi", "lambda", "server"], default="asgi")
+    parser.add_argument("--routes", nargs="*", choices=list(ROUTES), help="only send these routes")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed relative slowdown for --check")
+    args = parser.parse_args()
+
+    os.environ.update({"AWS_DEFAULT_REGION": "ap-southeast-2", "JWT_SECRET": SECRET, "AWS_ACCESS_KEY_ID": "benchmark", "AWS_SECRET_ACCESS_KEY": "benchmark"})
+    # Serialize moto access (see above)
+    os.environ["DDB_EXECUTOR_WORKERS"] = "1"
+    import boto3
+    from moto import mock_dynamodb
+    from Database.schema import create_table
+    from Metrics.middleware import set_settings
+    import main as application
+
+    rng = random.Random(args.seed)
+    sink = CollectingSink()
+    set_settings(1.0, sink)
+    with mock_dynamodb():
+        start = time.perf_counter()
+        carts_by_owner = seed(create_table(boto3.resource("dynamodb")), args.carts, args.owners, args.max_items, rng)
+        print(f"seeded {args.carts} carts for {len(carts_by_owner)} owners in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+        workload = Workload(carts_by_owner, rng)
+        only = set(args.routes) if args.routes else None
+        start = time.perf_counter()
+        if args.driver == "asgi":
+            latencies, statuses = asyncio.run(drive_http({"app": application.app, "base_url": "http://benchmark"}, workload, args.requests, args.concurrency, only))
+        elif args.driver == "server":
+            import httpx
+            with local_server(application.app) as url:
+                start = time.perf_counter()
+                client = {"base_url": url, "limits": httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)}
+                latencies, statuses = asyncio.run(drive_http(client, workload, args.requests, args.concurrency, only))
+        else:
+            latencies, statuses = drive_lambda(application.handler, workload, args.requests, args.concurrency, only)
+        elapsed = time.perf_counter() - start
+
+    results = summarize(latencies, sink.records, elapsed)
+    print(f"{'route':<16}{'requests':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ddb calls':>11}")
+    for route, result in results.items():
+        if route != "_all":
+            print(f"{route:<16}{result['requests']:>9}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['ddb_calls_per_request']:>11.2f}")
+    print(f"{results['_all']['requests']} requests in {elapsed:.2f}s: {results['_all']['requests_per_second']} req/s, status codes {dict(statuses)}")
+
+    key = f"{args.driver}-c{args.concurrency}"
+    dataset = {"carts": args.carts, "owners": args.owners, "max_items": args.max_items, "requests": args.requests, "seed": args.seed, "routes": sorted(only) if only else None}
+    baselines = json.load(open(BASELINES)) if os.path.exists(BASELINES) else {}
+    if args.save_baseline:
+        baselines[key] = {**results, "_dataset": dataset}
+        with open(BASELINES, "w") as output:
+            json.dump(baselines, output, indent=2, sort_keys=True)
+            output.write("\n")
+        print(f"saved baseline {key}")
+    if args.check:
+        if key not in baselines:
+            sys.exit(f"No baseline for {key}, run with --save-baseline first")
+        if baselines[key].get("_dataset") != dataset:
+            sys.exit(f"Baseline {key} was measured on {baselines[key].get('_dataset')}, not {dataset}; run with the same arguments or --save-baseline")
+        failures = compare(results, baselines[key], args.tolerance)
+        server_errors = sum(count for code, count in statuses.items() if code >= 500)
+        if server_errors:
+            failures.insert(0, f"{server_errors} requests failed with a 5xx status")
+        if failures:
+            sys.exit("Performance regression:\n  " + "\n  ".join(failures))
+        print(f"no regression against baseline {key}")
+
+if __name__ == "__main__":
+    main()
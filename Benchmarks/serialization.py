@@ -0,0 +1,47 @@
+# Compare the cost of turning a stored cart into a response body per cart size: validating it
+# against response_model=ShoppingCart and encoding it with jsonable_encoder + json.dumps (what
+# FastAPI does when a route returns a dict), versus the trusted cart_content + orjson path.
+#   python -m Benchmarks.serialization --sizes 1 10 100 1000 --repeat 200
+import argparse
+import json
+import statistics
+import time
+from decimal import Decimal
+from fastapi.encoders import jsonable_encoder
+from Database.records import items_attributes, public_record
+from Models.ShoppingCart import ShoppingCart
+from Routes.responses import cart_content, dumps
+
+def stored_cart(size: int) -> dict:
+    items = [{"item_id": f"item{n}", "name": f"product {n}", "description": None, "price": Decimal(n * 101) / 100, "quantity": Decimal(n % 5 + 1)} for n in range(size)]
+    return {"cart_id": "cart", "owner_id": "owner", "state": "open", **items_attributes(items), "state_shard": "open#0"}
+
+def validated(record: dict) -> bytes:
+    return json.dumps(jsonable_encoder(ShoppingCart(**public_record(record))), separators=(",", ":")).encode()
+
+def trusted(record: dict) -> bytes:
+    return dumps(cart_content(public_record(record)))
+
+def measure(render, record, repeat) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        render(record)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'items':>6}{'validated ms':>14}{'trusted ms':>12}{'speedup':>9}")
+    for size in args.sizes:
+        record = stored_cart(size)
+        assert json.loads(validated(record)) == json.loads(trusted(record))
+        slow, fast = measure(validated, record, args.repeat), measure(trusted, record, args.repeat)
+        print(f"{size:>6}{slow:>14.3f}{fast:>12.3f}{slow / fast:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
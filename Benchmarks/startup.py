@@ -0,0 +1,74 @@
+# Cold start benchmark: in fresh interpreters, time `import main` and the first two invocations of
+# main.handler with an API Gateway event (GET /v1/orders/{cart_id}, which decodes a JWT and reads
+# DynamoDB). DynamoDB is served by moto, imported after `import main` so it isn't counted there.
+#   python -m Benchmarks.startup --runs 10 [--max-import-ms 400 --max-first-invocation-ms 300]
+# The --max-* options make the run fail when the median goes over budget, e.g. in CI.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, os, time
+start = time.perf_counter()
+import main
+import_ms = (time.perf_counter() - start) * 1000
+
+import boto3
+from jose import jwt
+from moto import mock_dynamodb
+from Benchmarks.lambda_events import LambdaContext, api_gateway_event
+from Database.schema import create_table
+
+with mock_dynamodb():
+    table = create_table(boto3.resource("dynamodb", region_name="ap-southeast-2"))
+    table.put_item(Item={"cart_id": "cart-1", "owner_id": "user-1", "state": "open", "items": {}})
+    token = jwt.encode({"user_id": "user-1"}, os.environ["JWT_SECRET"], algorithm="HS256")
+    event = api_gateway_event("GET", "/v1/orders/cart-1", headers={"auth-token": token})
+    timings = []
+    for _ in range(2):
+        start = time.perf_counter()
+        response = main.handler(event, LambdaContext())
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response["statusCode"] == 200, response
+print(json.dumps({"import_ms": import_ms, "first_invocation_ms": timings[0], "warm_invocation_ms": timings[1]}))
+"""
+
+def run_once() -> dict:
+    env = {
+        **os.environ,
+        "AWS_LAMBDA_FUNCTION_NAME": "e-commerce-handler-dev-app",
+        "AWS_DEFAULT_REGION": "ap-southeast-2",
+        "JWT_SECRET": "benchmark-secret",
+        "CART_CACHE_BACKEND": "none",
+        "PYTHONDONTWRITEBYTECODE": "1",
+    }
+    result = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import-ms", type=float, default=None)
+    parser.add_argument("--max-first-invocation-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    medians = {name: statistics.median(run[name] for run in runs) for name in runs[0]}
+    for name, value in medians.items():
+        print(f"{name:<22} median={value:8.1f}ms  min={min(run[name] for run in runs):8.1f}ms")
+
+    failures = []
+    if args.max_import_ms is not None and medians["import_ms"] > args.max_import_ms:
+        failures.append(f"import_ms {medians['import_ms']:.1f} > {args.max_import_ms}")
+    if args.max_first_invocation_ms is not None and medians["first_invocation_ms"] > args.max_first_invocation_ms:
+        failures.append(f"first_invocation_ms {medians['first_invocation_ms']:.1f} > {args.max_first_invocation_ms}")
+    if failures:
+        sys.exit("Startup regression: " + "; ".join(failures))
+
+if __name__ == "__main__":
+    main()
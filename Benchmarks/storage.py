@@ -0,0 +1,43 @@
+# Estimated DynamoDB item size of a cart per item encoding (ITEMS_ENCODING full / compact) and cart
+# size, following DynamoDB's item size rules. Capacity units are billed per 4 KB read / 1 KB
+# written, and an item can't exceed 400 KB.
+#   python -m Benchmarks.storage --sizes 1 10 100 1000
+import argparse
+import math
+from decimal import Decimal
+from Database.records import COMPACT_ITEMS, FULL_ITEMS, derived_attributes, items_attributes
+
+def value_size(value) -> int:
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, str):
+        return len(value.encode())
+    if isinstance(value, (int, Decimal)):
+        digits = len(Decimal(value).normalize().as_tuple().digits)
+        return math.ceil(digits / 2) + 1
+    if isinstance(value, dict):
+        return 3 + sum(len(name.encode()) + value_size(element) + 1 for name, element in value.items())
+    if isinstance(value, list):
+        return 3 + sum(value_size(element) + 1 for element in value)
+    raise TypeError(type(value))
+
+def item_size(record: dict) -> int:
+    return sum(len(name.encode()) + value_size(value) for name, value in record.items())
+
+def cart(size: int, version: int) -> dict:
+    items = [{"item_id": f"sku-{n:06d}", "name": f"product {n}", "description": None, "price": Decimal(n * 101 + 99) / 100, "quantity": n % 5 + 1} for n in range(size)]
+    record = {"cart_id": "9b2f7c1e-0d4a-4b8e-9a51-3c6f2e8d7a10", "owner_id": "owner-42", "state": "open", **items_attributes(items, version)}
+    return {**record, **derived_attributes(record)}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000])
+    args = parser.parse_args()
+
+    print(f"{'items':>6}{'full bytes':>12}{'compact bytes':>15}{'ratio':>7}{'full WCU':>10}{'compact WCU':>13}")
+    for size in args.sizes:
+        full, compact = item_size(cart(size, FULL_ITEMS)), item_size(cart(size, COMPACT_ITEMS))
+        print(f"{size:>6}{full:>12}{compact:>15}{full / compact:>6.1f}x{math.ceil(full / 1024):>10}{math.ceil(compact / 1024):>13}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import json
+import os
+import threading
+from Cache.lru import TTLCache
+from Database.records import deserialize_record, serialize_record
+
+# Read-through cache of stored carts keyed by cart_id. Writers put the record DynamoDB returns
+# (ReturnValues=ALL_NEW) and deletes invalidate it. Cached carts only serve reads and reject
+# requests early when the owner doesn't match (owner_id never changes); every mutation is still
+# a conditional write, so a stale entry can never authorize one.
+class MemoryCartCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.carts = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, cart_id: str) -> dict | None:
+        return self.carts.get(cart_id)
+
+    def set(self, cart_id: str, cart: dict):
+        self.carts.set(cart_id, cart)
+
+    def delete(self, cart_id: str):
+        self.carts.delete(cart_id)
+
+    def clear(self):
+        self.carts.clear()
+
+# Shared between processes/containers through a Redis compatible server (needs the redis package)
+class RedisCartCache:
+    # Network calls: the repository runs them on its executor instead of the event loop
+    blocking = True
+
+    def __init__(self, url: str, ttl: float, prefix: str = "cart:", client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("CART_CACHE_BACKEND=redis requires the 'redis' package") from e
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, cart_id: str) -> dict | None:
+        value = self.client.get(self.prefix + cart_id)
+        return None if value is None else deserialize_record(json.loads(value))
+
+    def set(self, cart_id: str, cart: dict):
+        self.client.set(self.prefix + cart_id, json.dumps(serialize_record(cart)), px=int(self.ttl * 1000))
+
+    def delete(self, cart_id: str):
+        self.client.delete(self.prefix + cart_id)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + "*"):
+            self.client.delete(key)
+
+class NullCartCache:
+    def get(self, cart_id: str) -> dict | None:
+        return None
+
+    def set(self, cart_id: str, cart: dict):
+        pass
+
+    def delete(self, cart_id: str):
+        pass
+
+    def clear(self):
+        pass
+
+_lock = threading.Lock()
+_cache = None
+
+# One cache per process, configured with CART_CACHE_BACKEND (memory, redis or none)
+def get_cart_cache():
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                backend = os.environ.get("CART_CACHE_BACKEND", "memory")
+                ttl = float(os.environ.get("CART_CACHE_TTL", "30"))
+                if backend == "memory":
+                    _cache = MemoryCartCache(int(os.environ.get("CART_CACHE_SIZE", "10000")), ttl)
+                elif backend == "redis":
+                    _cache = RedisCartCache(os.environ.get("CART_CACHE_REDIS_URL", "redis://localhost:6379/0"), ttl)
+                elif backend == "none":
+                    _cache = NullCartCache()
+                else:
+                    raise ValueError(f"Unknown CART_CACHE_BACKEND: {backend}")
+    return _cache
+
+def reset_cart_cache():
+    global _cache
+    with _lock:
+        _cache = None
@@ -0,0 +1,58 @@
+import os
+import threading
+
+TABLE_NAME = os.environ.get("DDB_TABLE_NAME", "e-commerce")
+# Responses of requests sent with an Idempotency-Key (see Database.idempotency)
+IDEMPOTENCY_TABLE_NAME = os.environ.get("DDB_IDEMPOTENCY_TABLE_NAME", "e-commerce-idempotency")
+
+# One DynamoDB resource per process (i.e. per warm Lambda container), created on first use.
+# Building a resource loads the botocore service model, resolves the endpoint and opens a new
+# connection pool, so doing it once per container instead of once per request matters.
+_lock = threading.Lock()
+_resource = None
+_tables = {}
+
+# boto3/botocore are imported on first use rather than at import time, to keep them out of the
+# Lambda cold start path until a request actually needs DynamoDB
+def get_client_config():
+    from botocore.config import Config
+    return Config(
+        max_pool_connections=int(os.environ.get("DDB_MAX_POOL_CONNECTIONS", "50")),
+        tcp_keepalive=os.environ.get("DDB_TCP_KEEPALIVE", "true").lower() == "true",
+        connect_timeout=float(os.environ.get("DDB_CONNECT_TIMEOUT", "2")),
+        read_timeout=float(os.environ.get("DDB_READ_TIMEOUT", "5")),
+        retries={
+            "mode": os.environ.get("DDB_RETRY_MODE", "standard"),
+            "max_attempts": int(os.environ.get("DDB_MAX_ATTEMPTS", "3")),
+        },
+    )
+
+def get_resource():
+    global _resource
+    if _resource is None:
+        with _lock:
+            if _resource is None:
+                import boto3
+                session = boto3.session.Session()
+                _resource = session.resource("dynamodb", config=get_client_config())
+    return _resource
+
+# Tables share the resource, and so its connection pool
+def _get_named_table(name: str):
+    table = _tables.get(name)
+    if table is None:
+        table = _tables.setdefault(name, get_resource().Table(name))
+    return table
+
+def get_table():
+    return _get_named_table(TABLE_NAME)
+
+def get_idempotency_table():
+    return _get_named_table(IDEMPOTENCY_TABLE_NAME)
+
+# Drop the shared resource, e.g. between tests or after changing the connection settings
+def reset_connection():
+    global _resource
+    with _lock:
+        _resource = None
+        _tables.clear()
@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from Cache.lru import TTLCache
+from Database.records import EXPIRES_AT
+from Database.repository import ConditionFailed, TableRepository
+
+# Responses of requests sent with an Idempotency-Key header, so a retried create or checkout gets
+# the first response back instead of writing again. The first request claims its key with a
+# conditional put, runs, and stores its response, which is kept for IDEMPOTENCY_TTL_HOURS
+# (expires_at is the table's TTL attribute). Claims of requests that never finished expire after
+# PENDING_SECONDS, so a crashed request doesn't block its key for the whole TTL. Every claim has
+# its own token, so a request whose claim was taken over can't release the new one.
+PENDING, COMPLETED = "pending", "completed"
+PENDING_SECONDS = 60
+
+def get_idempotency_ttl() -> float:
+    return float(os.environ.get("IDEMPOTENCY_TTL_HOURS", "24")) * 3600
+
+class IdempotencyStore(TableRepository):
+    def __init__(self, table, executor: ThreadPoolExecutor | None = None, cache: TTLCache | None = None):
+        super().__init__(table, executor)
+        self.cache = cache
+
+    # The record of a key, or None. Completed responses never change, so they are served from the
+    # per process cache when possible; otherwise this is one (eventually consistent) read.
+    async def get(self, key: str, consistent: bool = False) -> dict | None:
+        record = self.cache.get(key) if self.cache is not None else None
+        if record is not None:
+            return record
+        record = (await self._call("get_item", Key={"idempotency_key": key}, ConsistentRead=consistent)).get("Item")
+        # Expired records DynamoDB hasn't deleted yet
+        if record is None or record[EXPIRES_AT] <= time.time():
+            return None
+        if record["status"] == COMPLETED and self.cache is not None:
+            self.cache.set(key, record, expires_at=float(record[EXPIRES_AT]))
+        return record
+
+    # The token of the claim when this request may run; None when another request holds or
+    # completed the key
+    async def claim(self, key: str) -> str | None:
+        now = int(time.time())
+        token = uuid.uuid4().hex
+        try:
+            await self._call(
+                "put_item",
+                Item={"idempotency_key": key, "status": PENDING, "claim": token, EXPIRES_AT: now + PENDING_SECONDS},
+                ConditionExpression="attribute_not_exists(idempotency_key) OR #expires_at <= :now",
+                ExpressionAttributeNames={"#expires_at": EXPIRES_AT},
+                ExpressionAttributeValues={":now": now},
+            )
+            return token
+        except ConditionFailed:
+            return None
+
+    async def complete(self, key: str, status_code: int, body: str, etag: str | None = None):
+        record = {"idempotency_key": key, "status": COMPLETED, "status_code": status_code, "body": body, EXPIRES_AT: int(time.time() + get_idempotency_ttl())}
+        if etag is not None:
+            record["etag"] = etag
+        await self._call("put_item", Item=record)
+        if self.cache is not None:
+            self.cache.set(key, record, expires_at=record[EXPIRES_AT])
+
+    # Give up a claim, e.g. when the request failed, so a retry runs again. Only while it is still
+    # this request's claim: after a takeover the key belongs to the other request.
+    async def release(self, key: str, token: str):
+        try:
+            await self._call(
+                "delete_item",
+                Key={"idempotency_key": key},
+                ConditionExpression="#status = :pending AND #claim = :token",
+                ExpressionAttributeNames={"#status": "status", "#claim": "claim"},
+                ExpressionAttributeValues={":pending": PENDING, ":token": token},
+            )
+        except ConditionFailed:
+            pass
+
+_lock = threading.Lock()
+_cache = None
+
+# Completed responses kept per process (IDEMPOTENCY_CACHE_SIZE, 0 disables the cache)
+def get_idempotency_cache() -> TTLCache:
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = TTLCache(maxsize=int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", "10000")), ttl=get_idempotency_ttl())
+    return _cache
+
+def reset_idempotency_cache():
+    global _cache
+    with _lock:
+        _cache = None
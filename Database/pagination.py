@@ -0,0 +1,47 @@
+import base64
+import hashlib
+import json
+from Database.records import deserialize_record, serialize_record
+from Database.schema import key_attributes
+
+# next_token is an opaque, URL-safe encoding of a query cursor: for every partition of the query
+# (one per index shard) that still has results, the LastEvaluatedKey to resume from, or null when
+# that partition was not read yet. Keys are kept in DynamoDB JSON so their types round-trip exactly.
+# The token also carries the scope of the query it belongs to (see query_scope) and is only
+# accepted by the same query.
+def encode_token(cursor: dict[int, dict | None], scope: str = "") -> str:
+    payload = {
+        "q": scope,
+        "c": {str(partition): None if key is None else serialize_record(key) for partition, key in cursor.items()},
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_token(token: str, scope: str = "") -> dict[int, dict | None]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        cursor = {
+            int(partition): None if key is None else deserialize_record(key)
+            for partition, key in payload["c"].items()
+        }
+    except Exception as e:
+        raise ValueError("Invalid next_token.") from e
+    if payload.get("q") != scope:
+        raise ValueError("next_token does not belong to this query.")
+    return cursor
+
+# Identifies a query: the indexes of its partitions and the request parameters it was built from
+def query_scope(partitions: list[tuple], *parameters) -> str:
+    description = json.dumps([[partition[0] for partition in partitions], [str(parameter) for parameter in parameters]])
+    return hashlib.sha256(description.encode()).hexdigest()[:16]
+
+# A decoded cursor can only resume the partitions of the query: every key must have exactly the
+# key attributes of the partition's index (and the table), as strings
+def check_cursor(cursor: dict[int, dict | None], partitions: list[tuple]):
+    if not cursor or any(not 0 <= i < len(partitions) for i in cursor):
+        raise ValueError("Invalid next_token.")
+    for i, key in cursor.items():
+        if key is None:
+            continue
+        expected = key_attributes(partitions[i][0])
+        if not isinstance(key, dict) or (expected is not None and set(key) != expected) or not all(isinstance(value, str) for value in key.values()):
+            raise ValueError("Invalid next_token.")
@@ -0,0 +1,132 @@
+import os
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+from functools import lru_cache
+from Database.sharding import UNINDEXED_STATES, state_shard
+
+# Created on first use so importing this module doesn't import boto3
+@lru_cache(maxsize=None)
+def _type_converters():
+    from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+    return TypeSerializer(), TypeDeserializer()
+
+# Storage format of a cart's items map, recorded in its "iv" attribute. FULL_ITEMS stores every
+# item under the Item field names; COMPACT_ITEMS uses one-letter keys and leaves out empty
+# descriptions, which makes stored items smaller. Carts without the marker use
+# FULL_ITEMS (or the list of items written before items were a map).
+ITEMS_VERSION = "iv"
+FULL_ITEMS, COMPACT_ITEMS = 1, 2
+COMPACT_KEYS = {"name": "n", "description": "d", "price": "p", "quantity": "q"}
+
+# Open carts expire CART_TTL_DAYS (default 30, 0 disables expiry) after their last change:
+# expires_at (epoch seconds) is the table's TTL attribute. Checkout removes it, so only open carts
+# expire. Carts DynamoDB hasn't deleted yet, and older carts without it, are left to Tools/sweep.py.
+EXPIRES_AT = "expires_at"
+
+def cart_expiry(now: float | None = None) -> int | None:
+    days = float(os.environ.get("CART_TTL_DAYS", "30"))
+    if days <= 0:
+        return None
+    return int((now or time.time()) + days * 86400)
+
+# Attributes only used for indexing, storage or expiry, never returned by the API
+INTERNAL_ATTRIBUTES = ("state_shard", ITEMS_VERSION, EXPIRES_AT)
+
+# The format new items are written in: ITEMS_ENCODING=full (default) or compact. Existing carts
+# are converted when their items are next changed, or by Tools/backfill.py.
+def get_items_version() -> int:
+    return COMPACT_ITEMS if os.environ.get("ITEMS_ENCODING", "full").lower() == "compact" else FULL_ITEMS
+
+# created_at / updated_at values: UTC, ISO 8601 with milliseconds, so they sort as strings.
+# Naive datetimes are taken as UTC.
+def timestamp(moment: datetime | None = None) -> str:
+    moment = moment or datetime.now(timezone.utc)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc)
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.") + f"{moment.microsecond // 1000:03d}Z"
+
+# Attributes that are not part of the API model but are derived from it on every write
+DERIVED_ATTRIBUTES = ("state_shard",)
+
+def derived_attributes(cart: dict) -> dict:
+    derived = {}
+    if cart.get("state") is not None and cart["state"] not in UNINDEXED_STATES:
+        derived["state_shard"] = state_shard(cart["state"], cart["cart_id"])
+    return derived
+
+# Items are stored as a map keyed by item_id, so a single item can be added, removed or changed
+# with a targeted UpdateExpression instead of rewriting the whole list
+def encode_item(item: dict, version: int | None = None) -> dict:
+    if (version or get_items_version()) == COMPACT_ITEMS:
+        return {COMPACT_KEYS.get(name, name): value for name, value in item.items() if name != "item_id" and not (name == "description" and value is None)}
+    return {name: value for name, value in item.items() if name != "item_id"}
+
+def encode_items(items: list[dict], version: int | None = None) -> dict:
+    return {item["item_id"]: encode_item(item, version) for item in items}
+
+# Name of an item field inside a stored item, e.g. to update it with a document path
+def item_key(name: str, version: int | None = None) -> str:
+    return COMPACT_KEYS[name] if (version or get_items_version()) == COMPACT_ITEMS else name
+
+# Totals kept next to the items, so reading them doesn't need the item list
+TOTALS = ("subtotal", "item_count", "line_count")
+TIMESTAMPS = ("created_at", "updated_at")
+SUMMARY_ATTRIBUTES = ("cart_id", "owner_id", "state", *TOTALS, *TIMESTAMPS)
+
+def line_total(price, quantity) -> Decimal:
+    return Decimal(price) * Decimal(quantity)
+
+def item_totals(items: list[dict]) -> dict:
+    return {
+        "subtotal": sum((line_total(item["price"], item["quantity"]) for item in items), Decimal(0)),
+        "item_count": sum(int(item["quantity"]) for item in items),
+        "line_count": len(items),
+    }
+
+# The items attributes of a record: the items map, its format marker and the totals. The map
+# keeps one line per item_id (the last one), and the totals are computed from those lines, so
+# they always match what is stored.
+def items_attributes(items: list[dict], version: int | None = None) -> dict:
+    version = version or get_items_version()
+    items = list({item["item_id"]: item for item in items}.values())
+    return {"items": encode_items(items, version), ITEMS_VERSION: version, **item_totals(items)}
+
+def items_version(record: dict) -> int:
+    return int(record.get(ITEMS_VERSION, FULL_ITEMS))
+
+# Whether a stored cart's items can be changed in place: a map in the current format, with totals
+def items_current(record: dict) -> bool:
+    return isinstance(record.get("items"), dict) and items_version(record) == get_items_version() and all(name in record for name in TOTALS)
+
+def decode_item(item_id: str, item: dict, version: int = FULL_ITEMS) -> dict:
+    if version == COMPACT_ITEMS:
+        return {"item_id": item_id, **{name: item.get(key) for name, key in COMPACT_KEYS.items()}}
+    return {"item_id": item_id, **item}
+
+# Carts written before the map format still store a list, which is returned unchanged
+def decode_items(items, version: int = FULL_ITEMS) -> list[dict]:
+    if items is None:
+        return []
+    if isinstance(items, dict):
+        return [decode_item(item_id, items[item_id], version) for item_id in sorted(items)]
+    return items
+
+# A stored cart as returned by the API
+def public_record(record: dict) -> dict:
+    public = {name: value for name, value in record.items() if name not in INTERNAL_ATTRIBUTES}
+    if "items" in public:
+        public["items"] = decode_items(public["items"], items_version(record))
+        # Carts written before the totals were stored
+        if "subtotal" not in public:
+            public.update(item_totals(public["items"]))
+    return public
+
+# DynamoDB JSON ({"S": ...}, {"N": ...}), for storing records outside DynamoDB with their exact types
+def serialize_record(record: dict) -> dict:
+    serializer = _type_converters()[0]
+    return {name: serializer.serialize(value) for name, value in record.items()}
+
+def deserialize_record(record: dict) -> dict:
+    deserializer = _type_converters()[1]
+    return {name: deserializer.deserialize(value) for name, value in record.items()}
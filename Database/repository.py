@@ -0,0 +1,495 @@
+import asyncio
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from functools import partial
+from Cache.carts import NullCartCache
+from Database.records import ITEMS_VERSION, FULL_ITEMS, decode_items, derived_attributes, encode_item, get_items_version, item_key, items_attributes, items_version, line_total, timestamp, EXPIRES_AT, cart_expiry
+from Database.schema import index_covers
+from Database.sharding import state_shard
+from Metrics.timing import current_metrics, phase, record_ddb_call
+
+# boto3 is blocking, so DynamoDB calls run on a dedicated, bounded pool instead of the event loop
+# (or the small default thread pool shared with every sync dependency). Size it to match the
+# botocore connection pool so workers never queue for a connection.
+_lock = threading.Lock()
+_executor = None
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                workers = int(os.environ.get("DDB_EXECUTOR_WORKERS", os.environ.get("DDB_MAX_POOL_CONNECTIONS", "50")))
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ddb")
+    return _executor
+
+def shutdown_executor(wait: bool = True):
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+        _executor = None
+
+# DynamoDB limits per BatchGetItem and TransactWriteItems request
+BATCH_GET_SIZE = 100
+TRANSACTION_SIZE = 100
+
+# Errors worth retrying with backoff in batch operations
+RETRYABLE_ERRORS = ("ProvisionedThroughputExceededException", "ThrottlingException", "RequestLimitExceeded", "TransactionInProgressException", "InternalServerError")
+
+# Raised when a conditional write is rejected by DynamoDB (ConditionalCheckFailedException)
+class ConditionFailed(Exception):
+    pass
+
+# Error code of a botocore ClientError (None for other exceptions); avoids importing botocore here
+def error_code(e: Exception) -> str | None:
+    return (getattr(e, "response", None) or {}).get("Error", {}).get("Code")
+
+def chunked(values: list, size: int) -> list[list]:
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+# Async access to one table: the blocking boto3 calls run on the executor
+class TableRepository:
+    def __init__(self, table, executor: ThreadPoolExecutor | None = None):
+        self.table = table
+        self.executor = executor or get_executor()
+
+    # Every DynamoDB call goes through here. On requests sampled by Metrics.middleware the call is
+    # timed (including the wait for a worker) and its consumed capacity and retries are recorded.
+    async def _run(self, method, **kwargs):
+        loop = asyncio.get_running_loop()
+        if current_metrics() is not None:
+            kwargs.setdefault("ReturnConsumedCapacity", "TOTAL")
+        try:
+            with phase("ddb"):
+                response = await loop.run_in_executor(self.executor, partial(method, **kwargs))
+        except Exception as e:
+            record_ddb_call(getattr(e, "response", None))
+            raise
+        record_ddb_call(response)
+        return response
+
+    async def _call(self, operation: str, **kwargs):
+        try:
+            return await self._run(getattr(self.table, operation), **kwargs)
+        except Exception as e:
+            if error_code(e) == "ConditionalCheckFailedException":
+                raise ConditionFailed(str(e)) from e
+            raise
+
+    # Table-less operations (batches, transactions) go through the resource's client, which still
+    # converts between Python and DynamoDB types
+    async def _client_call(self, operation: str, **kwargs):
+        return await self._run(getattr(self.table.meta.client, operation), **kwargs)
+
+class CartRepository(TableRepository):
+    def __init__(self, table, executor: ThreadPoolExecutor | None = None, cache=None):
+        super().__init__(table, executor)
+        self.cache = cache or NullCartCache()
+        self.batch_parallelism = int(os.environ.get("BATCH_MAX_PARALLEL", "8"))
+        self.batch_retries = int(os.environ.get("BATCH_MAX_RETRIES", "8"))
+
+    # Cache failures never fail a request; they only cost the DynamoDB read
+    async def _cache(self, operation: str, *args):
+        try:
+            method = getattr(self.cache, operation)
+            if getattr(self.cache, "blocking", False):
+                return await asyncio.get_running_loop().run_in_executor(self.executor, partial(method, *args))
+            return method(*args)
+        except Exception:
+            return None
+
+    # The cached copy of a cart, without reading DynamoDB (None when it is not cached)
+    async def cached_cart(self, cart_id: str) -> dict | None:
+        return await self._cache("get", cart_id)
+
+    # Read-through: served from the cache when possible. use_cache=False always reads DynamoDB
+    # (and refreshes the cache), e.g. to explain why a conditional write failed; consistent=True
+    # makes that a strongly consistent read.
+    async def get_cart(self, cart_id: str, use_cache: bool = True, consistent: bool = False) -> dict | None:
+        if use_cache:
+            cart = await self._cache("get", cart_id)
+            if cart is not None:
+                return cart
+        kwargs = {"ConsistentRead": True} if consistent else {}
+        cart = (await self._call("get_item", Key={"cart_id": cart_id}, **kwargs)).get("Item")
+        if cart is None:
+            await self._cache("delete", cart_id)
+        else:
+            await self._cache("set", cart_id, cart)
+        return cart
+
+    # One small read, to check that the table answers (see Routes.health)
+    async def ping(self):
+        await self._call("get_item", Key={"cart_id": "readyz"}, ProjectionExpression="cart_id")
+
+    async def put_cart(self, cart: dict) -> dict:
+        now = timestamp()
+        record = {**cart, **items_attributes(cart.get("items", [])), **derived_attributes(cart), "created_at": cart.get("created_at") or now, "updated_at": now, "version": 1}
+        expiry = cart_expiry()
+        if expiry and record.get("state") == "open":
+            record[EXPIRES_AT] = expiry
+        await self._call("put_item", Item=record)
+        await self._cache("set", cart["cart_id"], record)
+        return record
+
+    # Add "SET updated_at" and "ADD version 1" to an update (UpdateExpression and its names and
+    # values). Every change to a cart increments its version (carts written before versions
+    # existed count as version 0); new_version=False keeps it, for writes that only change how a
+    # cart is stored.
+    @staticmethod
+    def _touched(update: dict, new_version: bool = True) -> dict:
+        expression = update["UpdateExpression"]
+        touch = "#updated_at = :updated_at"
+        expression = expression.replace("SET ", f"SET {touch}, ", 1) if expression.startswith("SET ") else f"SET {touch} {expression}"
+        names = {**update.get("ExpressionAttributeNames", {}), "#updated_at": "updated_at"}
+        values = {**update.get("ExpressionAttributeValues", {}), ":updated_at": timestamp()}
+        if new_version:
+            expression = expression.replace(" ADD ", " ADD #version :one, ", 1) if " ADD " in expression else f"{expression} ADD #version :one"
+            names["#version"] = "version"
+            values[":one"] = 1
+        return {**update, "UpdateExpression": expression, "ExpressionAttributeNames": names, "ExpressionAttributeValues": values}
+
+    # Add a condition that the cart is at one of the given versions (e.g. from an If-Match header)
+    @staticmethod
+    def _at_versions(update: dict, versions: list[int]) -> dict:
+        names = {**update.get("ExpressionAttributeNames", {}), "#version": "version"}
+        values = {**update.get("ExpressionAttributeValues", {}), **{f":version{i}": version for i, version in enumerate(versions)}}
+        condition = "#version IN (" + ", ".join(f":version{i}" for i in range(len(versions))) + ")"
+        if 0 in versions:
+            condition = f"(attribute_not_exists(#version) OR {condition})"
+        if update.get("ConditionExpression"):
+            condition = f"{update['ConditionExpression']} AND {condition}"
+        return {**update, "ConditionExpression": condition, "ExpressionAttributeNames": names, "ExpressionAttributeValues": values}
+
+    # Run a conditional update, which also sets updated_at and the version, and keep the cache in
+    # sync with its outcome. versions (None: any) are the versions the cart must be at.
+    async def _update_cart(self, cart_id: str, versions: list[int] | None = None, new_version: bool = True, **kwargs) -> dict:
+        if versions is not None:
+            kwargs = self._at_versions(kwargs, versions)
+        try:
+            updated = (await self._call("update_item", Key={"cart_id": cart_id}, ReturnValues="ALL_NEW", **self._touched(kwargs, new_version))).get("Attributes")
+        except Exception:
+            await self._cache("delete", cart_id)
+            raise
+        await self._cache("set", cart_id, updated)
+        return updated
+
+    # The writes below are single round trips: ownership, existence and state are checked by
+    # DynamoDB in the same request, and ConditionFailed is raised when any of them does not hold.
+    async def delete_cart(self, cart_id: str, owner_id: str):
+        try:
+            await self._call(
+                "delete_item",
+                Key={"cart_id": cart_id},
+                ConditionExpression="attribute_exists(cart_id) AND owner_id = :owner",
+                ExpressionAttributeValues={":owner": owner_id}
+            )
+        finally:
+            await self._cache("delete", cart_id)
+
+    # Update that checks out a cart; without owner_id (admin batches) any owner is accepted
+    def _checkout_update(self, cart_id: str, owner_id: str | None = None) -> dict:
+        condition = "attribute_exists(cart_id) AND (attribute_not_exists(#state) OR #state <> :new_state)"
+        values = {':new_state': 'PAID', ':new_state_shard': state_shard('PAID', cart_id)}
+        if owner_id is not None:
+            condition += " AND owner_id = :owner"
+            values[':owner'] = owner_id
+        return {
+            "UpdateExpression": "SET #state = :new_state, #state_shard = :new_state_shard REMOVE #expires_at",
+            "ConditionExpression": condition,
+            "ExpressionAttributeNames": {'#state': 'state', '#state_shard': 'state_shard', '#expires_at': EXPIRES_AT},
+            "ExpressionAttributeValues": values,
+        }
+
+    async def checkout_cart(self, cart_id: str, owner_id: str, versions: list[int] | None = None) -> dict:
+        return await self._update_cart(cart_id, versions, **self._checkout_update(cart_id, owner_id))
+
+    # SET clause, names and values writing the given attributes
+    @staticmethod
+    def _set_attributes(attributes: dict) -> tuple[str, dict, dict]:
+        names = {f"#s{i}": name for i, name in enumerate(attributes)}
+        values = {f":s{i}": value for i, value in enumerate(attributes.values())}
+        return "SET " + ", ".join(f"#s{i} = :s{i}" for i in range(len(attributes))), names, values
+
+    # Open carts get a new expiry. open_cart is the state the caller expects the cart to be in,
+    # checked by the condition, since the expiry must not be set on other carts.
+    async def set_items(self, cart_id: str, owner_id: str, items: list[dict], open_cart: bool = True, versions: list[int] | None = None) -> dict:
+        attributes = items_attributes(items)
+        condition = "attribute_exists(cart_id) AND owner_id = :owner"
+        expiry = cart_expiry()
+        if expiry and open_cart:
+            attributes[EXPIRES_AT] = expiry
+        update, names, values = self._set_attributes(attributes)
+        if expiry:
+            condition += " AND #state = :open" if open_cart else " AND (attribute_not_exists(#state) OR #state <> :open)"
+            names["#state"] = "state"
+            values[":open"] = "open"
+        return await self._update_cart(
+            cart_id,
+            versions,
+            UpdateExpression=update,
+            ConditionExpression=condition,
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues={**values, ":owner": owner_id}
+        )
+
+    # Apply item operations (see Models.ItemOperation) in one UpdateExpression that only touches
+    # the affected entries of the items map, and ADDs the change of each line to the totals. cart
+    # is the stored cart the changes are computed from (e.g. the cached one): the condition checks
+    # that every affected line is still as it was, and fails when the cart's items can't be changed
+    # in place yet (see items_current and migrate_items).
+    async def patch_items(self, cart_id: str, owner_id: str, operations: list[dict], cart: dict, versions: list[int] | None = None) -> dict:
+        version = get_items_version()
+        price_key, quantity_key = item_key("price", version), item_key("quantity", version)
+        stored_items = cart.get("items") if isinstance(cart.get("items"), dict) else {}
+        names = {"#items": "items", "#iv": ITEMS_VERSION, "#subtotal": "subtotal", "#item_count": "item_count", "#line_count": "line_count"}
+        values = {":owner": owner_id, ":map": "M", ":iv": version}
+        sets, removes = [], []
+        conditions = ["attribute_exists(cart_id)", "owner_id = :owner", "attribute_type(#items, :map)", "attribute_exists(#subtotal)"]
+        conditions.append("(attribute_not_exists(#iv) OR #iv = :iv)" if version == FULL_ITEMS else "#iv = :iv")
+        subtotal, item_count, line_count = Decimal(0), 0, 0
+        for n, operation in enumerate(operations):
+            names[f"#i{n}"] = operation["item_id"]
+            old = stored_items.get(operation["item_id"])
+            if old is None:
+                conditions.append(f"attribute_not_exists(#items.#i{n})" if operation["op"] != "set_quantity" else f"attribute_exists(#items.#i{n})")
+            else:
+                conditions.append(f"#items.#i{n} = :o{n}")
+                values[f":o{n}"] = old
+                subtotal -= line_total(old[price_key], old[quantity_key])
+                item_count -= int(old[quantity_key])
+                line_count -= 1
+            if operation["op"] == "add":
+                item = operation["item"]
+                sets.append(f"#items.#i{n} = :i{n}")
+                values[f":i{n}"] = encode_item(item, version)
+                subtotal += line_total(item["price"], item["quantity"])
+                item_count += item["quantity"]
+                line_count += 1
+            elif operation["op"] == "remove":
+                if old is not None:
+                    removes.append(f"#items.#i{n}")
+            elif operation["op"] == "set_quantity" and old is not None:
+                names["#quantity"] = quantity_key
+                sets.append(f"#items.#i{n}.#quantity = :q{n}")
+                values[f":q{n}"] = operation["quantity"]
+                subtotal += line_total(old[price_key], operation["quantity"])
+                item_count += operation["quantity"]
+                line_count += 1
+        values.update({":subtotal": subtotal, ":item_count": item_count, ":line_count": line_count})
+        expiry = cart_expiry()
+        if expiry:
+            # Activity on an open cart pushes its expiry back
+            names["#state"] = "state"
+            values[":open"] = "open"
+            if cart.get("state") == "open":
+                sets.append("#expires_at = :expires_at")
+                names["#expires_at"] = EXPIRES_AT
+                values[":expires_at"] = expiry
+                conditions.append("#state = :open")
+            else:
+                conditions.append("(attribute_not_exists(#state) OR #state <> :open)")
+        update_expression = " ".join(part for part in (
+            "SET " + ", ".join(sets) if sets else "",
+            "REMOVE " + ", ".join(removes) if removes else "",
+            "ADD #subtotal :subtotal, #item_count :item_count, #line_count :line_count",
+        ) if part)
+        return await self._update_cart(
+            cart_id,
+            versions,
+            UpdateExpression=update_expression,
+            ConditionExpression=" AND ".join(conditions),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+
+    # Rewrite a cart's items as a map in the current format, with its totals, unless they changed
+    # since it was read. The cart's content doesn't change, so neither does its version.
+    async def migrate_items(self, cart_id: str, cart: dict) -> dict:
+        items = cart.get("items")
+        update, names, values = self._set_attributes(items_attributes(decode_items(items, items_version(cart))))
+        names["#items"] = "items"
+        if items is None:
+            condition = "attribute_exists(cart_id) AND attribute_not_exists(#items)"
+        else:
+            condition = "#items = :old_items"
+            values[":old_items"] = items
+        return await self._update_cart(cart_id, new_version=False, UpdateExpression=update, ConditionExpression=condition, ExpressionAttributeNames=names, ExpressionAttributeValues=values)
+
+    # Read one page of a partition (index, condition[, options]): a query of an index, or with
+    # index None a scan of the table filtered by the condition. options are extra Query arguments,
+    # e.g. ScanIndexForward or a FilterExpression.
+    async def _query(self, partition: tuple, limit: int | None, start_key: dict | None, projection: tuple[str, ...] | None = None) -> tuple[list[dict], dict | None]:
+        index_name, condition, *options = partition
+        kwargs = {"IndexName": index_name, "KeyConditionExpression": condition} if index_name else {"FilterExpression": condition}
+        if options:
+            kwargs.update(options[0])
+        if limit:
+            kwargs["Limit"] = limit
+        if start_key:
+            kwargs["ExclusiveStartKey"] = start_key
+        if projection:
+            kwargs["ProjectionExpression"] = ", ".join(f"#p{i}" for i in range(len(projection)))
+            kwargs["ExpressionAttributeNames"] = {f"#p{i}": name for i, name in enumerate(projection)}
+        try:
+            response = await self._call("query" if index_name else "scan", **kwargs)
+        except Exception as e:
+            # A start key that passed Database.pagination.check_cursor but not DynamoDB's checks,
+            # e.g. one from another partition of the index
+            if start_key and error_code(e) == "ValidationException":
+                raise ValueError("Invalid next_token.") from e
+            raise
+        return response.get("Items", []), response.get("LastEvaluatedKey")
+
+    # One page of a query over one or more partitions (see _query), e.g. the shards of
+    # the state index. Partitions are read in parallel and merged; limit is split between them.
+    # The returned cursor maps each partition that still has results to the key to resume from
+    # (None when it was not read yet), and is None once everything was read. projection limits
+    # the attributes returned; carts from indexes that don't project them are read in full with
+    # BatchGetItem (see Database.schema).
+    async def query_page(self, partitions: list[tuple], limit: int | None = None, cursor: dict[int, dict | None] | None = None, projection: tuple[str, ...] | None = None) -> tuple[list[dict], dict | None]:
+        pending = dict(cursor) if cursor is not None else {i: None for i in range(len(partitions))}
+        if any(i < 0 or i >= len(partitions) for i in pending):
+            raise ValueError("Cursor does not match the query partitions.")
+
+        order = sorted(pending)
+        quotas = {i: None for i in order}
+        if limit:
+            share, extra = divmod(limit, len(order))
+            quotas = {i: share + (1 if n < extra else 0) for n, i in enumerate(order)}
+        active = [i for i in order if quotas[i] != 0]
+
+        results = await asyncio.gather(*(self._query(partitions[i], quotas[i], pending[i], projection) for i in active))
+        items, incomplete = [], []
+        for i, (page, last_key) in zip(active, results):
+            items.extend(page)
+            if not index_covers(partitions[i][0], projection):
+                incomplete.extend(item["cart_id"] for item in page)
+            if last_key:
+                pending[i] = last_key
+            else:
+                del pending[i]
+        if incomplete:
+            items = await self._complete(items, incomplete)
+        return items, pending or None
+
+    # Replace index entries by the full carts, in the same order. Carts deleted in the meantime
+    # are left out. The index entries are eventually consistent already, so are these reads.
+    async def _complete(self, items: list[dict], cart_ids: list[str]) -> list[dict]:
+        carts, unprocessed = await self.batch_get_carts(cart_ids, consistent=False)
+        if unprocessed:
+            raise RuntimeError(f"Could not read {len(unprocessed)} carts because of throttling.")
+        incomplete = set(cart_ids)
+        return [
+            carts[item["cart_id"]] if item["cart_id"] in incomplete else item
+            for item in items if item["cart_id"] not in incomplete or item["cart_id"] in carts
+        ]
+
+    # Walk every page of a query lazily, so callers only hold one page per partition at a time
+    async def iter_query(self, partitions: list[tuple], page_size: int | None = None, cursor: dict[int, dict | None] | None = None, projection: tuple[str, ...] | None = None):
+        while True:
+            items, cursor = await self.query_page(partitions, page_size, cursor, projection)
+            yield items
+            if cursor is None:
+                return
+
+    async def query_carts(self, partitions: list[tuple], projection: tuple[str, ...] | None = None) -> list[dict]:
+        carts = []
+        async for items in self.iter_query(partitions, projection=projection):
+            carts.extend(items)
+        return carts
+
+    # Batch operations: requests are split into chunks of the DynamoDB limit, chunks run
+    # concurrently (at most BATCH_MAX_PARALLEL at a time) and unprocessed keys are retried with
+    # exponential backoff and jitter, up to BATCH_MAX_RETRIES times.
+    async def _backoff(self, attempt: int):
+        await asyncio.sleep(random.uniform(0, min(2.0, 0.05 * 2 ** attempt)))
+
+    async def _bounded_gather(self, coroutines):
+        semaphore = asyncio.Semaphore(self.batch_parallelism)
+
+        async def run(coroutine):
+            async with semaphore:
+                return await coroutine
+        return await asyncio.gather(*(run(coroutine) for coroutine in coroutines))
+
+    async def _batch_get_chunk(self, cart_ids: list[str], consistent: bool = True) -> tuple[list[dict], list[str]]:
+        found = []
+        request = {self.table.name: {"Keys": [{"cart_id": cart_id} for cart_id in cart_ids], "ConsistentRead": consistent}}
+        for attempt in range(self.batch_retries + 1):
+            response = await self._client_call("batch_get_item", RequestItems=request)
+            found.extend(response.get("Responses", {}).get(self.table.name, []))
+            request = response.get("UnprocessedKeys") or {}
+            if not request:
+                return found, []
+            await self._backoff(attempt)
+        return found, [key["cart_id"] for key in request[self.table.name]["Keys"]]
+
+    # Returns the carts found by cart_id, and the ids that stayed unprocessed after all retries.
+    # Eventually consistent reads cost half as much but may be stale, so only consistent ones are cached.
+    async def batch_get_carts(self, cart_ids: list[str], consistent: bool = True) -> tuple[dict[str, dict], list[str]]:
+        carts, unprocessed = {}, []
+        for found, failed in await self._bounded_gather(self._batch_get_chunk(chunk, consistent) for chunk in chunked(cart_ids, BATCH_GET_SIZE)):
+            for cart in found:
+                carts[cart["cart_id"]] = cart
+                if consistent:
+                    await self._cache("set", cart["cart_id"], cart)
+            unprocessed.extend(failed)
+        return carts, unprocessed
+
+    # Run one conditional write per cart (operation(cart_id) is its TransactItem) in a transaction.
+    # Returns the ids written, the ids whose condition failed and the ids left unprocessed.
+    async def _transact_chunk(self, cart_ids: list[str], operation) -> tuple[list[str], list[str], list[str]]:
+        pending, rejected = list(cart_ids), []
+        attempt = 0
+        while pending and attempt <= self.batch_retries:
+            try:
+                await self._client_call("transact_write_items", TransactItems=[operation(cart_id) for cart_id in pending])
+                return pending, rejected, []
+            except Exception as e:
+                code = error_code(e)
+                if code is None:
+                    raise
+                reasons = e.response.get("CancellationReasons") or []
+                failed = {cart_id for cart_id, reason in zip(pending, reasons) if reason.get("Code") == "ConditionalCheckFailed"}
+                if code == "TransactionCanceledException" and failed:
+                    # Drop the carts whose condition failed and commit the rest right away
+                    rejected.extend(cart_id for cart_id in pending if cart_id in failed)
+                    pending = [cart_id for cart_id in pending if cart_id not in failed]
+                    continue
+                if code != "TransactionCanceledException" and code not in RETRYABLE_ERRORS:
+                    raise
+            await self._backoff(attempt)
+            attempt += 1
+        return [], rejected, pending
+
+    async def _batch_transact(self, cart_ids: list[str], operation) -> tuple[list[str], list[str], list[str]]:
+        written, rejected, unprocessed = [], [], []
+        for done, failed, left in await self._bounded_gather(self._transact_chunk(chunk, operation) for chunk in chunked(cart_ids, TRANSACTION_SIZE)):
+            written.extend(done)
+            rejected.extend(failed)
+            unprocessed.extend(left)
+        return written, rejected, unprocessed
+
+    # Delete carts in transactions of up to 100 carts, each conditional on the cart existing.
+    # Returns the ids that were deleted, the ids of missing carts and the ids left unprocessed.
+    async def batch_delete_carts(self, cart_ids: list[str]) -> tuple[list[str], list[str], list[str]]:
+        for cart_id in cart_ids:
+            await self._cache("delete", cart_id)
+        return await self._batch_transact(cart_ids, lambda cart_id: {
+            "Delete": {"TableName": self.table.name, "Key": {"cart_id": cart_id}, "ConditionExpression": "attribute_exists(cart_id)"}
+        })
+
+    # Check out carts in transactions of up to 100 carts. Returns the ids that were checked out,
+    # the ids whose condition failed (missing or already paid) and the ids left unprocessed.
+    async def batch_checkout_carts(self, cart_ids: list[str]) -> tuple[list[str], list[str], list[str]]:
+        checked_out, rejected, unprocessed = await self._batch_transact(cart_ids, lambda cart_id: {
+            "Update": {"TableName": self.table.name, "Key": {"cart_id": cart_id}, **self._touched(self._checkout_update(cart_id))}
+        })
+        for cart_id in checked_out:
+            await self._cache("delete", cart_id)
+        return checked_out, rejected, unprocessed
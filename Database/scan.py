@@ -0,0 +1,23 @@
+from concurrent.futures import ThreadPoolExecutor
+
+# Parallel scan for bulk jobs (Tools/): each of `segments` threads reads its segment of the table
+# page by page and passes the items of every page to handle_page, from several threads at once.
+# With a limiter (see Tools.throttle.RateLimiter) every page is charged the read capacity it
+# consumed, so the scan stays within a budget of read units per second.
+def parallel_scan(table, segments: int, handle_page, limiter=None, **kwargs):
+    def scan_segment(segment: int):
+        scan_kwargs = {**kwargs, "Segment": segment, "TotalSegments": segments}
+        if limiter is not None:
+            scan_kwargs["ReturnConsumedCapacity"] = "TOTAL"
+        while True:
+            response = table.scan(**scan_kwargs)
+            if limiter is not None:
+                limiter.acquire((response.get("ConsumedCapacity") or {}).get("CapacityUnits", 1))
+            handle_page(response.get("Items", []))
+            if "LastEvaluatedKey" not in response:
+                return
+            scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        for future in [pool.submit(scan_segment, segment) for segment in range(segments)]:
+            future.result()
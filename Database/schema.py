@@ -0,0 +1,83 @@
+from Database.connection import IDEMPOTENCY_TABLE_NAME, TABLE_NAME
+from Database.records import EXPIRES_AT, TIMESTAMPS, TOTALS
+from Database.sharding import STATE_INDEX
+
+OWNER_INDEX = "owner_id-state-index"
+# An owner's carts by creation time (carts created before timestamps existed are not in it)
+OWNER_TIME_INDEX = "owner_id-created_at-index"
+
+# The global secondary indexes only copy the keys and the cart totals, not the items, so an items
+# write only adds a few bytes of index writes. Full carts are read from the table afterwards.
+INDEXES = {
+    OWNER_INDEX: {
+        "KeySchema": [{"AttributeName": "owner_id", "KeyType": "HASH"}, {"AttributeName": "state", "KeyType": "RANGE"}],
+        "Projection": {"ProjectionType": "INCLUDE", "NonKeyAttributes": [*TOTALS, *TIMESTAMPS]},
+    },
+    OWNER_TIME_INDEX: {
+        "KeySchema": [{"AttributeName": "owner_id", "KeyType": "HASH"}, {"AttributeName": "created_at", "KeyType": "RANGE"}],
+        "Projection": {"ProjectionType": "INCLUDE", "NonKeyAttributes": ["state", *TOTALS, "updated_at"]},
+    },
+    STATE_INDEX: {
+        "KeySchema": [{"AttributeName": "state_shard", "KeyType": "HASH"}],
+        "Projection": {"ProjectionType": "INCLUDE", "NonKeyAttributes": ["owner_id", "state", *TOTALS, *TIMESTAMPS]},
+    },
+}
+
+# Attributes an index returns; None for the table itself (index_name None), ALL projections and
+# indexes not defined here
+def index_attributes(index_name: str | None) -> set[str] | None:
+    index = INDEXES.get(index_name)
+    if index is None or index["Projection"]["ProjectionType"] == "ALL":
+        return None
+    return {"cart_id", *(key["AttributeName"] for key in index["KeySchema"]), *index["Projection"].get("NonKeyAttributes", [])}
+
+# Attributes of the keys an index returns (e.g. in LastEvaluatedKey): the table key plus the index
+# key. None for indexes not defined here.
+def key_attributes(index_name: str | None) -> set[str] | None:
+    if index_name is None:
+        return {"cart_id"}
+    index = INDEXES.get(index_name)
+    if index is None:
+        return None
+    return {"cart_id", *(key["AttributeName"] for key in index["KeySchema"])}
+
+# Whether reading these attributes (None: the whole cart) from the index is enough
+def index_covers(index_name: str | None, attributes: tuple[str, ...] | None) -> bool:
+    projected = index_attributes(index_name)
+    return projected is None or (attributes is not None and set(attributes) <= projected)
+
+# Arguments of CreateTable for the orders table, shared by the tests, benchmarks and Tools/create_table.py
+def table_definition(table_name: str = TABLE_NAME) -> dict:
+    return {
+        "TableName": table_name,
+        "KeySchema": [{"AttributeName": "cart_id", "KeyType": "HASH"}],
+        "AttributeDefinitions": [{"AttributeName": name, "AttributeType": "S"} for name in ("cart_id", "owner_id", "state", "state_shard", "created_at")],
+        "BillingMode": "PAY_PER_REQUEST",
+        "GlobalSecondaryIndexes": [{"IndexName": name, **index} for name, index in INDEXES.items()],
+    }
+
+# Responses of idempotent requests, keyed by "<scope>#<Idempotency-Key>" (see Database.idempotency)
+def idempotency_table_definition(table_name: str = IDEMPOTENCY_TABLE_NAME) -> dict:
+    return {
+        "TableName": table_name,
+        "KeySchema": [{"AttributeName": "idempotency_key", "KeyType": "HASH"}],
+        "AttributeDefinitions": [{"AttributeName": "idempotency_key", "AttributeType": "S"}],
+        "BillingMode": "PAY_PER_REQUEST",
+    }
+
+# TTL is not part of CreateTable. DynamoDB deletes open carts, and idempotency records, some
+# time after their expires_at.
+def ttl_specification() -> dict:
+    return {"Enabled": True, "AttributeName": EXPIRES_AT}
+
+def _create(dynamodb, definition: dict):
+    table = dynamodb.create_table(**definition)
+    table.wait_until_exists()
+    dynamodb.meta.client.update_time_to_live(TableName=definition["TableName"], TimeToLiveSpecification=ttl_specification())
+    return table
+
+def create_table(dynamodb, table_name: str = TABLE_NAME):
+    return _create(dynamodb, table_definition(table_name))
+
+def create_idempotency_table(dynamodb, table_name: str = IDEMPOTENCY_TABLE_NAME):
+    return _create(dynamodb, idempotency_table_definition(table_name))
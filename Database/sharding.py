@@ -0,0 +1,26 @@
+import os
+import zlib
+
+STATE_INDEX = "state_shard-index"
+
+# States left out of the (sparse) state index: carts in them get no state_shard, so the many
+# abandoned open carts cost nothing to index. Queries for them scan the table instead.
+UNINDEXED_STATES = ("open",)
+
+# Carts in the same state are spread over STATE_INDEX_SHARDS partitions of the state index by
+# writing "<state>#<n>" instead of the bare state. Changing the shard count moves carts between
+# shards, so run Tools/backfill.py after changing it.
+def get_shard_count() -> int:
+    return int(os.environ.get("STATE_INDEX_SHARDS", "8"))
+
+# Stable across processes (unlike hash()), so every writer picks the same shard for a cart
+def state_shard(state: str, cart_id: str, shards: int | None = None) -> str:
+    return f"{state}#{zlib.crc32(cart_id.encode()) % (shards or get_shard_count())}"
+
+# One (index, key condition) pair per shard; reads fan out over all of them. Unindexed states are
+# read with a filtered scan of the table (index None, filter condition).
+def state_partitions(state: str, shards: int | None = None) -> list[tuple[str | None, object]]:
+    from boto3.dynamodb.conditions import Attr, Key
+    if state in UNINDEXED_STATES:
+        return [(None, Attr("state").eq(state))]
+    return [(STATE_INDEX, Key("state_shard").eq(f"{state}#{n}")) for n in range(shards or get_shard_count())]
@@ -0,0 +1,75 @@
+import os
+import random
+import threading
+from Metrics.sink import create_sink
+from Metrics.timing import end_request, start_request
+
+_lock = threading.Lock()
+_settings = None
+
+# (sample rate, sink), read from the environment once per process
+def get_settings() -> tuple[float, object]:
+    global _settings
+    if _settings is None:
+        with _lock:
+            if _settings is None:
+                _settings = (float(os.environ.get("METRICS_SAMPLE_RATE", "1")), create_sink())
+    return _settings
+
+# Replace the environment settings, e.g. to collect records in memory in a benchmark
+def set_settings(sample_rate: float, sink):
+    global _settings
+    with _lock:
+        _settings = (sample_rate, sink)
+
+def reset_settings():
+    global _settings
+    with _lock:
+        _settings = None
+
+# Plain ASGI middleware (BaseHTTPMiddleware would buffer streaming responses). A sampled request
+# gets a Server-Timing header with its phase timings and one EMF record in the metrics sink;
+# requests that are not sampled only pay for one random() call.
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        sample_rate, sink = get_settings()
+        if sample_rate <= 0 or (sample_rate < 1 and random.random() >= sample_rate):
+            return await self.app(scope, receive, send)
+
+        metrics, token = start_request()
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", metrics.server_timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            end_request(token)
+            endpoint = scope.get("endpoint")
+            total = metrics.elapsed_ms()
+            values = {name: (duration, "Milliseconds") for name, duration in metrics.phases.items()}
+            values["total"] = (total, "Milliseconds")
+            values["ddb_calls"] = (metrics.ddb_calls, "Count")
+            values["consumed_capacity"] = (metrics.consumed_capacity, "Count")
+            values["retries"] = (metrics.retries, "Count")
+            try:
+                sink.emit({
+                    "Operation": getattr(endpoint, "__name__", "unmatched"),
+                    "method": scope.get("method"),
+                    "path": scope.get("path"),
+                    "status": status_code,
+                }, values)
+            except Exception:
+                pass
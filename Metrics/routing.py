@@ -0,0 +1,36 @@
+import json
+from fastapi import Request
+from fastapi.routing import APIRoute
+from Metrics.timing import phase
+
+# Decoding the JSON body is part of the "validation" phase; receiving it is not
+class TimedRequest(Request):
+    async def json(self):
+        if not hasattr(self, "_json"):
+            body = await self.body()
+            with phase("validation"):
+                self._json = json.loads(body)
+        return self._json
+
+# A body parameter whose pydantic validation is measured; everything else is read from the field
+class TimedBodyField:
+    def __init__(self, field):
+        self._field = field
+
+    def __getattr__(self, name):
+        return getattr(self._field, name)
+
+    def validate(self, *args, **kwargs):
+        with phase("validation"):
+            return self._field.validate(*args, **kwargs)
+
+# Route class measuring the "validation" phase of a request: decoding and validating its body.
+# Path, query and header parameters are cheap and stay in "app".
+class TimedRoute(APIRoute):
+    def get_route_handler(self):
+        self.dependant.body_params = [TimedBodyField(field) for field in self.dependant.body_params]
+        handler = super().get_route_handler()
+
+        async def timed_handler(request: Request):
+            return await handler(TimedRequest(request.scope, request.receive))
+        return timed_handler
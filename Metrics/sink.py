@@ -0,0 +1,52 @@
+import json
+import os
+import sys
+import threading
+import time
+
+NAMESPACE = os.environ.get("METRICS_NAMESPACE", "ECommerceAPI")
+
+# Writes one CloudWatch Embedded Metric Format (EMF) record per sampled request. On Lambda, records
+# printed to stdout become metrics without any API call; locally they can go to a file instead.
+class EMFSink:
+    def __init__(self, stream=None, path: str | None = None):
+        self._lock = threading.Lock()
+        self._stream = stream
+        self._path = path
+
+    def emit(self, record: dict, metrics: dict[str, tuple[float, str]]):
+        line = json.dumps({
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": NAMESPACE,
+                    "Dimensions": [["Operation"]],
+                    "Metrics": [{"Name": name, "Unit": unit} for name, (value, unit) in metrics.items()],
+                }],
+            },
+            **record,
+            **{name: value for name, (value, unit) in metrics.items()},
+        }, default=str)
+        with self._lock:
+            if self._path:
+                with open(self._path, "a") as output:
+                    output.write(line + "\n")
+            else:
+                stream = self._stream or sys.stdout
+                stream.write(line + "\n")
+                stream.flush()
+
+class NullSink:
+    def emit(self, record: dict, metrics: dict[str, tuple[float, str]]):
+        pass
+
+# METRICS_SINK: stdout (default), file (appends to METRICS_EMF_PATH) or none
+def create_sink():
+    sink = os.environ.get("METRICS_SINK", "stdout")
+    if sink == "stdout":
+        return EMFSink()
+    if sink == "file":
+        return EMFSink(path=os.environ.get("METRICS_EMF_PATH", "metrics.jsonl"))
+    if sink == "none":
+        return NullSink()
+    raise ValueError(f"Unknown METRICS_SINK: {sink}")
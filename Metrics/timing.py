@@ -0,0 +1,65 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Per-request measurements, set by Metrics.middleware for sampled requests. Code that wants to be
+# measured uses phase() / record_ddb_call(), which do nothing when the request isn't sampled.
+class RequestMetrics:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = defaultdict(float)
+        self.ddb_calls = 0
+        self.consumed_capacity = 0.0
+        self.retries = 0
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.start) * 1000
+
+    # Server-Timing header value: every measured phase, the rest of the request as "app", and the total
+    def server_timing(self) -> str:
+        total = self.elapsed_ms()
+        entries = [f"{name};dur={duration:.2f}" for name, duration in self.phases.items()]
+        entries.append(f"app;dur={max(total - sum(self.phases.values()), 0):.2f}")
+        if self.ddb_calls:
+            entries.append(f'ddb_calls;desc="{self.ddb_calls} calls, {self.consumed_capacity:g} capacity units, {self.retries} retries"')
+        entries.append(f"total;dur={total:.2f}")
+        return ", ".join(entries)
+
+_current = ContextVar("request_metrics", default=None)
+
+def current_metrics() -> RequestMetrics | None:
+    return _current.get()
+
+def start_request():
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+def end_request(token):
+    _current.reset(token)
+
+@contextmanager
+def phase(name: str):
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.phases[name] += (time.perf_counter() - start) * 1000
+
+# Capacity and retries of one DynamoDB response. ConsumedCapacity is a dict for single-item
+# operations and a list (one entry per table) for batches and transactions.
+def record_ddb_call(response: dict | None):
+    metrics = _current.get()
+    if metrics is None:
+        return
+    metrics.ddb_calls += 1
+    if not response:
+        return
+    consumed = response.get("ConsumedCapacity")
+    for entry in consumed if isinstance(consumed, list) else [consumed] if consumed else []:
+        metrics.consumed_capacity += float(entry.get("CapacityUnits", 0))
+    metrics.retries += response.get("ResponseMetadata", {}).get("RetryAttempts", 0)
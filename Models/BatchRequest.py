@@ -0,0 +1,5 @@
+from typing import List
+from pydantic import BaseModel, Field
+
+class BatchRequest(BaseModel):
+    cart_ids: List[str] = Field(..., min_items=1, max_items=10000)
@@ -0,0 +1,9 @@
+from pydantic import BaseModel
+from Models.ShoppingCart import ShoppingCart
+
+# Outcome of one cart in a batch request, with the status code the single-cart route would return
+class BatchResult(BaseModel):
+    cart_id: str
+    status: int
+    detail: str | None = None
+    cart: ShoppingCart | None = None
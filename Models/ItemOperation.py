@@ -0,0 +1,23 @@
+from typing import Literal
+from pydantic import BaseModel, Field, root_validator
+from Models.Item import Item
+
+# One change to a cart's items: add (or replace) an item, remove it, or change its quantity
+class ItemOperation(BaseModel):
+    op: Literal["add", "remove", "set_quantity"]
+    item: Item | None = None
+    item_id: str | None = None
+    quantity: int | None = Field(None, ge=1)
+
+    @root_validator(skip_on_failure=True)
+    def check_fields(cls, values):
+        op = values.get("op")
+        if op == "add":
+            if values.get("item") is None:
+                raise ValueError("'add' requires 'item'")
+            values["item_id"] = values["item"].item_id
+        elif values.get("item_id") is None:
+            raise ValueError(f"'{op}' requires 'item_id'")
+        if op == "set_quantity" and values.get("quantity") is None:
+            raise ValueError("'set_quantity' requires 'quantity'")
+        return values
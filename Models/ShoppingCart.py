@@ -1,3 +1,4 @@
+from decimal import Decimal
 from typing import List
 from pydantic import BaseModel
 from Models.Item import Item
@@ -7,3 +8,12 @@ class ShoppingCart(BaseModel):
     owner_id: str
     items: List[Item] = []
     state: str = "open"
+    # Maintained by every write of the items
+    subtotal: Decimal = Decimal(0)
+    item_count: int = 0
+    line_count: int = 0
+    # Set by the writers (see Database.records.timestamp); missing on carts created before
+    created_at: str | None = None
+    updated_at: str | None = None
+    # Incremented by every write, sent as the ETag (0 for carts written before versions existed)
+    version: int = 0
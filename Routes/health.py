@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from Auth.tokens import get_jwt_secret
+from Database.repository import CartRepository
+from Routes.orders import get_cart_repository
+
+router = APIRouter()
+
+# GET /healthz : liveness, the process serves requests (nothing else is checked, so a slow
+# DynamoDB doesn't get every container restarted)
+@router.get("/healthz", include_in_schema=False)
+async def healthz():
+    return {"status": "ok"}
+
+# GET /readyz : readiness, the process can serve the API: the JWT secret is set and the orders
+# table answers a read
+@router.get("/readyz", include_in_schema=False)
+async def readyz(repo: CartRepository = Depends(get_cart_repository)):
+    if not get_jwt_secret():
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="JWT_SECRET is not set")
+    try:
+        await repo.ping()
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"DynamoDB is not available: {e}")
+    return {"status": "ready"}
@@ -1,177 +1,501 @@
-import os
-from typing import Annotated, List
-from fastapi import APIRouter, HTTPException, Header, status, Depends
-from jose import JWTError, jwt
+from datetime import datetime
+from typing import Annotated, List, Literal
+from fastapi import APIRouter, HTTPException, Header, Query, status, Depends
+from fastapi.responses import Response, StreamingResponse
+from Auth.tokens import InvalidToken, verify_token
 from Models.Item import Item
+from Models.BatchRequest import BatchRequest
+from Models.BatchResult import BatchResult
+from Models.ItemOperation import ItemOperation
 from Models.ShoppingCart import ShoppingCart
 import uuid
-from boto3.dynamodb.conditions import Key
-import boto3
-from dotenv import load_dotenv
+from Cache.carts import get_cart_cache
+from Database.connection import get_idempotency_table, get_table
+from Database.idempotency import COMPLETED, IdempotencyStore, get_idempotency_cache
+from Database.records import SUMMARY_ATTRIBUTES, items_current, public_record, timestamp
+from Database.pagination import check_cursor, decode_token, encode_token, query_scope
+from Database.schema import OWNER_INDEX, OWNER_TIME_INDEX
+from Database.sharding import state_partitions
+from Database.repository import CartRepository, ConditionFailed
+from Metrics.routing import TimedRoute
+from Metrics.timing import phase
+from Routes.responses import CartJSONResponse, cart_content, dumps
 
-load_dotenv()
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
+
+# Dependency for getting the shared DynamoDB table (override it in tests through app.dependency_overrides)
 def get_db_connection():
-    ddb = boto3.resource('dynamodb').Table('e-commerce')
-    return ddb
+    return get_table()
+
+# Dependency for the async cart repository on top of the table and the shared cart cache
+def get_cart_repository(ddb = Depends(get_db_connection), cache = Depends(get_cart_cache)) -> CartRepository:
+    return CartRepository(ddb, cache=cache)
+
+# Idempotency-Key request header (at most 255 characters), e.g. a UUID the client sends again when it retries
+IdempotencyKey = Annotated[str | None, Header(max_length=255)]
+
+# Dependency for the store of idempotent responses (override it in tests through app.dependency_overrides).
+# Only requests with an Idempotency-Key need it, so the idempotency table is resolved for those only.
+def get_idempotency_store(idempotency_key: IdempotencyKey = None) -> IdempotencyStore | None:
+    if idempotency_key is None:
+        return None
+    return IdempotencyStore(get_idempotency_table(), cache=get_idempotency_cache())
+
+# Run a request once per Idempotency-Key: a retry with the same key gets the stored response back
+# (with an Idempotent-Replayed header), read from the process cache or DynamoDB, without running
+# again. Keys are scoped to the user and operation. Only successful responses are stored; a
+# failed request releases its key so the retry runs again.
+async def idempotent(store: IdempotencyStore | None, idempotency_key: str | None, scope: str, run) -> Response:
+    if idempotency_key is None:
+        return await run()
+    key = f"{scope}#{idempotency_key}"
+    try:
+        record = await store.get(key)
+        claim = await store.claim(key) if record is None else None
+        if claim is not None:
+            try:
+                response = await run()
+            except BaseException:
+                await store.release(key, claim)
+                raise
+            try:
+                await store.complete(key, response.status_code, response.body.decode(), response.headers.get("etag"))
+            except Exception:
+                # The request did succeed; a retry after the claim expires runs it again
+                pass
+            return response
+        if record is None:
+            record = await store.get(key, consistent=True)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+    if record is None or record["status"] != COMPLETED:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A request with this Idempotency-Key is still in progress, please retry.")
+    headers = {"Idempotent-Replayed": "true"}
+    if record.get("etag"):
+        headers["ETag"] = record["etag"]
+    return Response(record["body"], status_code=int(record["status_code"]), media_type="application/json", headers=headers)
 
 # Dependency for getting the current user
 def get_current_user(auth_token: Annotated[str, Header()]) -> (str, bool):
-    secret_key = os.environ.get("JWT_SECRET")
     try:
-        payload = jwt.decode(auth_token, secret_key, algorithms=["HS256"])
-        user_id = payload.get("user_id")
-        isAdmin = payload.get("isAdmin", False)
+        with phase("auth"):
+            user_id, isAdmin = verify_token(auth_token)
         if user_id is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token.")
         return user_id, isAdmin
-    except JWTError:
+    except InvalidToken:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
 
-# POST /v1/orders : Create an empty shopping cart for the user
+# POST /v1/orders : Create an empty shopping cart for the user (once per Idempotency-Key)
 @router.post("/v1/orders", response_model=ShoppingCart)
-async def create_shopping_cart(user: tuple = Depends(get_current_user)):
+async def create_shopping_cart(idempotency_key: IdempotencyKey = None, user: tuple = Depends(get_current_user), repo: CartRepository = Depends(get_cart_repository), store: IdempotencyStore | None = Depends(get_idempotency_store)):
     user_id, isAdmin = user
-    cart_id = str(uuid.uuid4())
-    shopping_cart = ShoppingCart(cart_id=cart_id, owner_id=user_id)
-    
-    ddb = get_db_connection()
+
+    async def create():
+        cart_id = str(uuid.uuid4())
+        shopping_cart = ShoppingCart(cart_id=cart_id, owner_id=user_id)
+
+        try:
+            record = await repo.put_cart(shopping_cart.dict())
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+        return cart_response(record)
+
+    return await idempotent(store, idempotency_key, f"{user_id}#create", create)
+
+# A cart's ETag is its version, which every write increments (see CartRepository._touched).
+# Carts written before versions existed are at version 0.
+def cart_etag(record: dict) -> str:
+    return f'"{int(record.get("version", 0))}"'
+
+def cart_response(record: dict) -> CartJSONResponse:
+    return CartJSONResponse(cart_content(public_record(record)), headers={"ETag": cart_etag(record)})
+
+PRECONDITION_FAILED_DETAIL = "Shopping cart was changed since it was read, please read it again."
+
+# The versions an If-Match header accepts (None without the header or with "*", i.e. any).
+# Weak and malformed ETags never match, as If-Match uses the strong comparison.
+def if_match_versions(if_match: str | None) -> list[int] | None:
+    if if_match is None or if_match.strip() == "*":
+        return None
+    versions = [int(tag[1:-1]) for tag in (tag.strip() for tag in if_match.split(",")) if len(tag) > 2 and tag[0] == tag[-1] == '"' and tag[1:-1].isdigit()]
+    if not versions:
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail=PRECONDITION_FAILED_DETAIL)
+    # DynamoDB accepts up to 100 values in an IN condition
+    return versions[:100]
+
+# After a rejected conditional write: the cart is no longer at a version the client accepts
+def reject_changed_cart(existing_item: dict, versions: list[int] | None):
+    if versions is not None and int(existing_item.get("version", 0)) not in versions:
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail=PRECONDITION_FAILED_DETAIL)
+
+# Whether an If-None-Match header matches a cart's ETag (weak comparison)
+def none_match_matches(if_none_match: str | None, etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+# A conditional write was rejected: read the cart once to tell the client why
+async def get_cart_after_failed_write(repo: CartRepository, cart_id: str, not_found_detail: str) -> dict:
     try:
-        ddb.put_item(Item=shopping_cart.dict())
+        existing_item = await repo.get_cart(cart_id, use_cache=False)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
-    
-    return shopping_cart
-   
-# DELETE /v1/orders/uuid
-@router.delete("/v1/orders/{cart_id}", response_description="Shopping cart deleted successfully")
-def delete_shopping_cart(cart_id: str, user: tuple = Depends(get_current_user)):
+
+    if existing_item is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=not_found_detail)
+    return existing_item
+
+# A cached cart owned by someone else is rejected without touching DynamoDB. The owner of a cart
+# never changes, so this is safe with stale entries; anything else is left to the conditional write.
+async def reject_cached_non_owner(repo: CartRepository, cart_id: str, user_id: str, status_code: int, detail: str):
+    cached_item = await repo.cached_cart(cart_id)
+    if cached_item is not None and cached_item.get("owner_id") != user_id:
+        raise HTTPException(status_code=status_code, detail=detail)
+
+# GET /v1/orders/uuid : Get a single shopping cart (served from the cart cache when possible)
+# With If-None-Match a client that already has the current version gets 304 without the cart.
+# A cached cart at another version may be behind the client (e.g. written through another
+# process), so then the cart is read from DynamoDB before answering.
+@router.get("/v1/orders/{cart_id}", response_model=ShoppingCart)
+async def get_shopping_cart(cart_id: str, if_none_match: Annotated[str | None, Header()] = None, user: tuple = Depends(get_current_user), repo: CartRepository = Depends(get_cart_repository)):
     user_id, isAdmin = user
-    ddb = get_db_connection()
-    try:    
-        existing_item = ddb.get_item(Key={"cart_id": cart_id}).get("Item")
+    try:
+        existing_item = await repo.cached_cart(cart_id)
+        if existing_item is None or (if_none_match is not None and not none_match_matches(if_none_match, cart_etag(existing_item))):
+            existing_item = await repo.get_cart(cart_id, use_cache=False)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
-    
+
     if existing_item is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Shopping cart not found.")
-    
-    if existing_item.get("owner_id") != user_id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not authorized to delete this shopping cart.")
-    
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Shopping cart not found")
+
+    if existing_item.get("owner_id") != user_id and not isAdmin:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="You are not authorized to access this resource")
+
+    if none_match_matches(if_none_match, cart_etag(existing_item)):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": cart_etag(existing_item)})
+    return cart_response(existing_item)
+
+# DELETE /v1/orders/uuid
+@router.delete("/v1/orders/{cart_id}", response_description="Shopping cart deleted successfully")
+async def delete_shopping_cart(cart_id: str, user: tuple = Depends(get_current_user), repo: CartRepository = Depends(get_cart_repository)):
+    user_id, isAdmin = user
+    await reject_cached_non_owner(repo, cart_id, user_id, status.HTTP_403_FORBIDDEN, "You are not authorized to delete this shopping cart.")
     try:
-        ddb.delete_item(Key={"cart_id": cart_id})
+        await repo.delete_cart(cart_id, user_id)
+    except ConditionFailed:
+        existing_item = await get_cart_after_failed_write(repo, cart_id, "Shopping cart not found.")
+        if existing_item.get("owner_id") != user_id:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not authorized to delete this shopping cart.")
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Shopping cart was modified concurrently, please retry.")
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
     return {"detail": "Shopping cart deleted successfully"}
 
 # POST /v1/orders/uuid/checkout : Checkout an entire shopping cart that changes the state to PAID and freezes it to go through shipment
+# (once per Idempotency-Key; with If-Match only at the given version)
 @router.post("/v1/orders/{cart_id}/checkout", response_model=ShoppingCart)
-def checkout_shopping_cart(cart_id: str, user: tuple = Depends(get_current_user)):
+async def checkout_shopping_cart(cart_id: str, idempotency_key: IdempotencyKey = None, if_match: Annotated[str | None, Header()] = None, user: tuple = Depends(get_current_user), repo: CartRepository = Depends(get_cart_repository), store: IdempotencyStore | None = Depends(get_idempotency_store)):
+    user_id, isAdmin = user
+
+    versions = if_match_versions(if_match)
+
+    async def checkout():
+        await reject_cached_non_owner(repo, cart_id, user_id, status.HTTP_401_UNAUTHORIZED, "You are not authorized to checkout this shopping cart")
+
+        # Additional logic for processing payment, billing, and freezing the cart for shipment can be added here.
+
+        try:
+            updated_item = await repo.checkout_cart(cart_id, user_id, versions)
+        except ConditionFailed:
+            existing_item = await get_cart_after_failed_write(repo, cart_id, "Shopping cart not found")
+            if existing_item.get("owner_id") != user_id:
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="You are not authorized to checkout this shopping cart")
+            reject_changed_cart(existing_item, versions)
+            if existing_item.get("state") == "PAID":
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Shopping cart is already checked out")
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Shopping cart was modified concurrently, please retry.")
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+        return cart_response(updated_item)
+
+    return await idempotent(store, idempotency_key, f"{user_id}#checkout#{cart_id}", checkout)
+
+# PATCH /v1/orders/uuid : Add/remove an item to/from the cart
+# With If-Match the items are only replaced if the cart is still at the given version (else 412),
+# so concurrent clients can't overwrite each other's changes.
+@router.patch("/v1/orders/{cart_id}", response_model=ShoppingCart)
+async def update_shopping_cart(cart_id: str, items: List[Item], if_match: Annotated[str | None, Header()] = None, user: tuple = Depends(get_current_user), repo: CartRepository = Depends(get_cart_repository)):
+    user_id, isAdmin = user
+    versions = if_match_versions(if_match)
+    # Items are stored in a map keyed by item_id, so a repeated id would silently drop a line
+    item_ids = [item.item_id for item in items]
+    if len(set(item_ids)) != len(item_ids):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Each item_id can only appear once in a shopping cart.")
+    await reject_cached_non_owner(repo, cart_id, user_id, status.HTTP_401_UNAUTHORIZED, "You are not authorized to use this shopping cart")
+    serialized_items = [item.dict() for item in items]
+    # Open carts get a new expiry. Their state is taken from the cache (or assumed open) and checked
+    # by the write, which is repeated once if it was wrong.
+    cached_item = await repo.cached_cart(cart_id)
+    open_cart = cached_item is None or cached_item.get("state") == "open"
+    for attempt in range(2):
+        try:
+            updated_item = await repo.set_items(cart_id, user_id, serialized_items, open_cart, versions)
+            return cart_response(updated_item)
+        except ConditionFailed:
+            pass
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+        existing_item = await get_cart_after_failed_write(repo, cart_id, "Shopping cart not found")
+        if existing_item.get("owner_id") != user_id:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="You are not authorized to use this shopping cart")
+        reject_changed_cart(existing_item, versions)
+        if (existing_item.get("state") == "open") == open_cart:
+            break
+        open_cart = not open_cart
+    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Shopping cart was modified concurrently, please retry.")
+
+# PATCH /v1/orders/uuid/items : Add, remove or change the quantity of individual items
+# Only the affected entries of the cart are written, so the cost doesn't grow with the cart size.
+# If-Match works as for PATCH /v1/orders/uuid.
+@router.patch("/v1/orders/{cart_id}/items", response_model=ShoppingCart)
+async def patch_shopping_cart_items(cart_id: str, operations: List[ItemOperation], if_match: Annotated[str | None, Header()] = None, user: tuple = Depends(get_current_user), repo: CartRepository = Depends(get_cart_repository)):
     user_id, isAdmin = user
-    ddb = get_db_connection()
+    versions = if_match_versions(if_match)
+    if not operations:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="At least one item operation is required.")
+    item_ids = [operation.item_id for operation in operations]
+    if len(set(item_ids)) != len(item_ids):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Each item can only be changed once per request.")
+    serialized_operations = [{**operation.dict(exclude={"item"}), "item": operation.item.dict() if operation.item else None} for operation in operations]
+    # The changes to the totals are computed from the cart as read, from the cache when possible.
+    # When it is stale the conditional write fails and the cart is read again from DynamoDB. An
+    # item missing from a possibly stale copy is only reported after a strongly consistent read.
     try:
-        existing_item = ddb.get_item(Key={"cart_id": cart_id}).get("Item")
+        existing_item = await repo.get_cart(cart_id)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
-        
-    if existing_item is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Shopping cart not found")
-    
-    if existing_item.get("owner_id") != user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="You are not authorized to checkout this shopping cart")
-    
-    if existing_item.get("state") == "PAID":
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Shopping cart is already checked out")
+    consistent = False
+    for attempt in range(3):
+        if existing_item is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Shopping cart not found")
+        if existing_item.get("owner_id") != user_id:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="You are not authorized to use this shopping cart")
+        try:
+            if not items_current(existing_item):
+                # Carts written before items were stored as a map, in another format than
+                # ITEMS_ENCODING or without totals are converted once, then patched
+                existing_item = await repo.migrate_items(cart_id, existing_item)
+                continue
+            missing = [operation.item_id for operation in operations if operation.op == "set_quantity" and operation.item_id not in existing_item["items"]]
+            if missing and not consistent:
+                existing_item = await repo.get_cart(cart_id, use_cache=False, consistent=True)
+                consistent = True
+                continue
+            if missing:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Item {missing[0]} not found in shopping cart")
+            updated_item = await repo.patch_items(cart_id, user_id, serialized_operations, existing_item, versions)
+            return cart_response(updated_item)
+        except ConditionFailed:
+            pass
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+        existing_item = await get_cart_after_failed_write(repo, cart_id, "Shopping cart not found")
+        consistent = False
+        if existing_item.get("owner_id") == user_id:
+            # Otherwise rejected as above. A stale cached cart (read before the write) is retried.
+            reject_changed_cart(existing_item, versions)
+    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Shopping cart was modified concurrently, please retry.")
+
+# Batch endpoints for admin and back-office tools: one JWT check and a few DynamoDB batch calls
+# for up to thousands of carts, with one result per cart (in request order, duplicates removed).
+def require_admin(user: tuple = Depends(get_current_user)) -> tuple:
+    user_id, isAdmin = user
+    if not isAdmin:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="You are not authorized to access this resource")
+    return user
 
-    # Additional logic for processing payment, billing, and freezing the cart for shipment can be added here.
+UNPROCESSED_DETAIL = "Not processed because of throttling, please retry."
 
+# POST /v1/orders:batchGet
+@router.post("/v1/orders:batchGet", response_model=List[BatchResult])
+async def batch_get_shopping_carts(request: BatchRequest, user: tuple = Depends(require_admin), repo: CartRepository = Depends(get_cart_repository)):
+    cart_ids = list(dict.fromkeys(request.cart_ids))
     try:
-        updated_item = ddb.update_item(
-            Key={"cart_id": cart_id},
-            UpdateExpression="SET #state = :new_state",
-            ExpressionAttributeNames={'#state': 'state'},
-            ExpressionAttributeValues={':new_state': 'PAID'},
-            ReturnValues='ALL_NEW'
-        ).get("Attributes")
+        carts, unprocessed = await repo.batch_get_carts(cart_ids)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
-    
-    return updated_item
-        
-# PATCH /v1/orders/uuid : Add/remove an item to/from the cart
-@router.patch("/v1/orders/{cart_id}", response_model=ShoppingCart)
-def update_shopping_cart(cart_id: str, items: List[Item], user: tuple = Depends(get_current_user)):
-    user_id, isAdmin = user
-    ddb = get_db_connection()
+
+    results = []
+    for cart_id in cart_ids:
+        if cart_id in carts:
+            results.append({"cart_id": cart_id, "status": status.HTTP_200_OK, "detail": None, "cart": cart_content(public_record(carts[cart_id]))})
+        elif cart_id in unprocessed:
+            results.append({"cart_id": cart_id, "status": status.HTTP_503_SERVICE_UNAVAILABLE, "detail": UNPROCESSED_DETAIL, "cart": None})
+        else:
+            results.append({"cart_id": cart_id, "status": status.HTTP_404_NOT_FOUND, "detail": "Shopping cart not found", "cart": None})
+    return CartJSONResponse(results)
+
+# POST /v1/orders:batchDelete
+@router.post("/v1/orders:batchDelete", response_model=List[BatchResult], response_model_exclude_none=True)
+async def batch_delete_shopping_carts(request: BatchRequest, user: tuple = Depends(require_admin), repo: CartRepository = Depends(get_cart_repository)):
+    cart_ids = list(dict.fromkeys(request.cart_ids))
     try:
-        existing_item = ddb.get_item(Key={"cart_id": cart_id}).get("Item")
+        deleted, missing, unprocessed = await repo.batch_delete_carts(cart_ids)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
-        
-    if existing_item is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Shopping cart not found")
-    
-    if existing_item.get("owner_id") != user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="You are not authorized to use this shopping cart")
 
-    serialized_items = [item.dict() for item in items]
+    deleted, unprocessed = set(deleted), set(unprocessed)
+    return [
+        {"cart_id": cart_id, "status": status.HTTP_200_OK, "detail": "Shopping cart deleted successfully"} if cart_id in deleted
+        else {"cart_id": cart_id, "status": status.HTTP_503_SERVICE_UNAVAILABLE, "detail": UNPROCESSED_DETAIL} if cart_id in unprocessed
+        else {"cart_id": cart_id, "status": status.HTTP_404_NOT_FOUND, "detail": "Shopping cart not found."}
+        for cart_id in cart_ids
+    ]
+
+# POST /v1/orders:batchCheckout
+@router.post("/v1/orders:batchCheckout", response_model=List[BatchResult], response_model_exclude_none=True)
+async def batch_checkout_shopping_carts(request: BatchRequest, user: tuple = Depends(require_admin), repo: CartRepository = Depends(get_cart_repository)):
+    cart_ids = list(dict.fromkeys(request.cart_ids))
     try:
-        updated_item = ddb.update_item(
-            Key={"cart_id": cart_id},
-            UpdateExpression="SET #items = :new_items",
-            ExpressionAttributeNames={'#items': 'items'},
-            ExpressionAttributeValues={":new_items": serialized_items},
-            ReturnValues="ALL_NEW"
-        ).get("Attributes")
+        checked_out, rejected, unprocessed = await repo.batch_checkout_carts(cart_ids)
+        # Only carts whose condition failed are read, to tell missing carts from paid ones
+        existing, _ = await repo.batch_get_carts(rejected) if rejected else ({}, [])
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
-    
-    return updated_item
+
+    checked_out, unprocessed = set(checked_out), set(unprocessed)
+    results = []
+    for cart_id in cart_ids:
+        if cart_id in checked_out:
+            results.append({"cart_id": cart_id, "status": status.HTTP_200_OK, "detail": "Shopping cart checked out"})
+        elif cart_id in unprocessed:
+            results.append({"cart_id": cart_id, "status": status.HTTP_503_SERVICE_UNAVAILABLE, "detail": UNPROCESSED_DETAIL})
+        elif cart_id not in existing:
+            results.append({"cart_id": cart_id, "status": status.HTTP_404_NOT_FOUND, "detail": "Shopping cart not found"})
+        elif existing[cart_id].get("state") == "PAID":
+            results.append({"cart_id": cart_id, "status": status.HTTP_400_BAD_REQUEST, "detail": "Shopping cart is already checked out"})
+        else:
+            results.append({"cart_id": cart_id, "status": status.HTTP_409_CONFLICT, "detail": "Shopping cart was modified concurrently, please retry."})
+    return results
+
+# Newline-delimited JSON, one cart per line, produced page by page
+async def stream_orders(first_page: list[dict], pages):
+    for order in first_page:
+        yield dumps(public_record(order)) + b"\n"
+    async for page in pages:
+        for order in page:
+            yield dumps(public_record(order)) + b"\n"
+
+# An owner's carts in creation order (newest first on request), optionally created between since
+# and until, and in one state (filtered, so a page can hold fewer than limit carts)
+def owner_time_partition(user: str, state: str | None, since: str | None, until: str | None, newest_first: bool) -> tuple:
+    from boto3.dynamodb.conditions import Attr, Key
+    condition = Key('owner_id').eq(user)
+    if since and until:
+        condition &= Key('created_at').between(since, until)
+    elif since:
+        condition &= Key('created_at').gte(since)
+    elif until:
+        condition &= Key('created_at').lte(until)
+    options = {"ScanIndexForward": not newest_first}
+    if state:
+        options["FilterExpression"] = Attr('state').eq(state)
+    return (OWNER_TIME_INDEX, condition, options)
 
 # Endpoint to get orders based on user and/or state
+# Without limit/next_token every page is returned. With them a single page is returned and the
+# token for the following one is sent in the X-Next-Token header. stream=true sends NDJSON instead.
+# view=summary only reads the totals of each cart (see SUMMARY_ATTRIBUTES), not its items.
+# since/until/newest_first read a user's carts by creation time, e.g. ?user=uuid&newest_first=true&limit=10
 @router.get("/v1/orders")
-def get_orders_by_user_and_state(userToken: tuple = Depends(get_current_user), state: str | None = None, user: str | None = None):
+async def get_orders_by_user_and_state(
+    userToken: tuple = Depends(get_current_user),
+    state: str | None = None,
+    user: str | None = None,
+    limit: int | None = Query(None, ge=1, le=1000),
+    next_token: str | None = None,
+    stream: bool = False,
+    view: Literal["full", "summary"] = "full",
+    since: datetime | None = None,
+    until: datetime | None = None,
+    newest_first: bool = False,
+    repo: CartRepository = Depends(get_cart_repository),
+):
+    # Imported here rather than at module level to keep boto3 out of the cold start import path
+    from boto3.dynamodb.conditions import Key
     user_id, isAdmin = userToken
-    ddb = get_db_connection()
+    since, until = (timestamp(moment) if moment else None for moment in (since, until))
+    by_time = since is not None or until is not None or newest_first
+    if by_time and not user:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Query parameters 'since', 'until' and 'newest_first' require 'user'.")
+    if since and until and since > until:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="'since' must not be after 'until'.")
+
+    #GET /v1/orders?user=uuid&since=2024-01-01T00:00:00Z&newest_first=true  Get the orders of a user by creation time
+    if by_time:
+        if user_id != user and not isAdmin:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="You are not authorized to access this resource")
+        partitions = [owner_time_partition(user, state, since, until, newest_first)]
+
     #GET /v1/orders?user=uuid&state=SHIPPED|PAID|etc  Get all shipped orders for a user by state
-    if user and state:
+    elif user and state:
         if user_id != user and not isAdmin:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="You are not authorized to access this resource")
-        try:
-            filtered_orders = ddb.query(
-                IndexName='owner_id-state-index', 
-                KeyConditionExpression=Key('owner_id').eq(user) & Key('state').eq(state)
-            ).get("Items")
-        except Exception as e:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+        partitions = [(OWNER_INDEX, Key('owner_id').eq(user) & Key('state').eq(state))]
 
     # GET /v1/orders?user=uuid  Get all orders of a user
     elif user:
         if user_id != user and not isAdmin:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="You are not authorized to access this resource")
-        try:
-            filtered_orders = ddb.query(
-                IndexName='owner_id-state-index', 
-                KeyConditionExpression=Key('owner_id').eq(user)
-            ).get("Items")
-        except Exception as e:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+        partitions = [(OWNER_INDEX, Key('owner_id').eq(user))]
         
     #GET /v1/orders?state=PAID  Get all “Paid” orders for ALL users
     elif state:
         if not isAdmin:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="You are not authorized to access this resource")
-        try:
-            filtered_orders = ddb.query(
-                IndexName='state-index', 
-                KeyConditionExpression=Key('state').eq(state)
-            ).get("Items")
-        except Exception as e:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+        # The state index is sharded: query every shard in parallel and merge the results.
+        # States left out of the sparse index are read with a filtered scan.
+        partitions = state_partitions(state)
 
     else:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Query parameter 'user' or 'state' is required.")
+
+    scope = query_scope(partitions, user, state, since, until, newest_first, view)
+    try:
+        cursor = decode_token(next_token, scope) if next_token else None
+        if cursor is not None:
+            check_cursor(cursor, partitions)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    try:
+        projection = SUMMARY_ATTRIBUTES if view == "summary" else None
+        if stream:
+            pages = repo.iter_query(partitions, limit, cursor, projection)
+            # Read the first page before the response starts, so DynamoDB errors still become a 500
+            first_page = await pages.__anext__()
+            return StreamingResponse(stream_orders(first_page, pages), media_type="application/x-ndjson")
+        headers = {}
+        if limit or cursor:
+            filtered_orders, cursor = await repo.query_page(partitions, limit, cursor, projection)
+            if cursor:
+                headers["X-Next-Token"] = encode_token(cursor, scope)
+        else:
+            filtered_orders = await repo.query_carts(partitions, projection)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
     
-    return filtered_orders
+    return CartJSONResponse([public_record(order) for order in filtered_orders], headers=headers)
@@ -0,0 +1,34 @@
+from decimal import Decimal
+import orjson
+from fastapi.responses import JSONResponse
+from Metrics.timing import phase
+from Models.Item import Item
+from Models.ShoppingCart import ShoppingCart
+
+# DynamoDB returns every number as a Decimal: integral values become ints, the rest floats, like
+# the encoder FastAPI uses for Decimal fields of a response model
+def _default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default)
+
+# JSON response rendered by orjson, with Decimal support. Routes return it directly, which skips
+# FastAPI's response_model validation and jsonable_encoder pass; response_model still documents it.
+class CartJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        with phase("serialization"):
+            return dumps(content)
+
+_CART_DEFAULTS = {name: field.default for name, field in ShoppingCart.__fields__.items()}
+_ITEM_DEFAULTS = {name: field.default for name, field in Item.__fields__.items()}
+
+# The ShoppingCart fields of a cart read back from DynamoDB (see public_record), built without
+# validation the same way ShoppingCart.construct() would: the cart was validated when it was written
+def cart_content(record: dict) -> dict:
+    with phase("serialization"):
+        cart = {name: record.get(name, default) for name, default in _CART_DEFAULTS.items()}
+        cart["items"] = [{name: item.get(name, default) for name, default in _ITEM_DEFAULTS.items()} for item in cart["items"] or []]
+        return cart
@@ -0,0 +1,56 @@
+import time
+from decimal import Decimal
+from Cache.carts import MemoryCartCache, RedisCartCache
+from Cache.lru import TTLCache
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats() == {"hits": 3, "misses": 1, "size": 2}
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("a", 1, expires_at=time.time() - 1)
+    cache.set("b", 2, expires_at=time.time() + 60)
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert len(cache) == 1
+
+def test_memory_cart_cache():
+    cache = MemoryCartCache(maxsize=10, ttl=60)
+    cache.set("10", {"cart_id": "10"})
+    assert cache.get("10") == {"cart_id": "10"}
+    cache.delete("10")
+    assert cache.get("10") is None
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, px=None):
+        self.values[key] = value
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+    def scan_iter(self, match):
+        return [key for key in list(self.values) if key.startswith(match.rstrip("*"))]
+
+def test_redis_cart_cache_round_trips_types():
+    client = FakeRedis()
+    cache = RedisCartCache("redis://unused", ttl=30, client=client)
+    cart = {"cart_id": "10", "items": [{"item_id": "a", "price": Decimal("1.25"), "quantity": Decimal(2)}]}
+    cache.set("10", cart)
+    assert list(client.values) == ["cart:10"]
+    assert cache.get("10") == cart
+    cache.clear()
+    assert cache.get("10") is None
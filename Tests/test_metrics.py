@@ -0,0 +1,81 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from moto import mock_dynamodb
+from Auth.tokens import reset_token_cache
+from Cache.carts import reset_cart_cache
+from Database.connection import reset_connection
+from Metrics.middleware import reset_settings
+from Tests.test_orders import dynamodb_setup, generate_token
+from main import app
+
+client = TestClient(app)
+
+@pytest.fixture
+def metrics_file(monkeypatch, tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    monkeypatch.setenv("JWT_SECRET", "test_secret_key")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "ap-southeast-2")
+    monkeypatch.setenv("METRICS_SINK", "file")
+    monkeypatch.setenv("METRICS_EMF_PATH", str(path))
+    for reset in (reset_settings, reset_connection, reset_token_cache, reset_cart_cache):
+        reset()
+    yield path
+    for reset in (reset_settings, reset_connection, reset_token_cache, reset_cart_cache):
+        reset()
+
+def read_records(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+@mock_dynamodb
+def test_request_metrics(metrics_file):
+    ddb = dynamodb_setup()
+    ddb.put_item(Item={'cart_id': '10', 'owner_id': 'id5', 'state': 'open', 'items': {}})
+    response = client.post("/v1/orders/10/checkout", headers={"Auth-Token": generate_token('id5')})
+    assert response.status_code == 200
+    timing = response.headers['server-timing']
+    for name in ('auth;dur=', 'ddb;dur=', 'app;dur=', 'total;dur='):
+        assert name in timing
+    assert '1 calls' in timing
+
+    [record] = read_records(metrics_file)
+    assert record['Operation'] == 'checkout_shopping_cart'
+    assert record['status'] == 200
+    assert record['ddb_calls'] == 1
+    assert record['consumed_capacity'] > 0
+    assert record['retries'] == 0
+    assert {metric['Name'] for metric in record['_aws']['CloudWatchMetrics'][0]['Metrics']} >= {'auth', 'ddb', 'total', 'ddb_calls'}
+
+@mock_dynamodb
+def test_failed_requests_are_recorded(metrics_file):
+    dynamodb_setup()
+    response = client.post("/v1/orders/10/checkout", headers={"Auth-Token": generate_token('id5')})
+    assert response.status_code == 404
+    [record] = read_records(metrics_file)
+    assert record['status'] == 404
+    assert record['ddb_calls'] == 2
+
+def test_unsampled_requests(metrics_file, monkeypatch):
+    monkeypatch.setenv("METRICS_SAMPLE_RATE", "0")
+    reset_settings()
+    response = client.get("/v1/orders", headers={"Auth-Token": "invalid"})
+    assert response.status_code == 401
+    assert 'server-timing' not in response.headers
+    assert not metrics_file.exists()
+
+@mock_dynamodb
+def test_validation_and_serialization_phases(metrics_file):
+    ddb = dynamodb_setup()
+    ddb.put_item(Item={'cart_id': '10', 'owner_id': 'id5', 'state': 'open', 'items': {}})
+    response = client.patch("/v1/orders/10", headers={"Auth-Token": generate_token('id5')}, json=[{'item_id': 'a', 'name': 'tv', 'price': '1', 'quantity': 2}])
+    assert response.status_code == 200
+    for name in ('validation;dur=', 'serialization;dur='):
+        assert name in response.headers['server-timing']
+    [record] = read_records(metrics_file)
+    assert record['validation'] > 0 and record['serialization'] > 0
+    assert {metric['Name'] for metric in record['_aws']['CloudWatchMetrics'][0]['Metrics']} >= {'validation', 'serialization'}
+
+    # Invalid bodies are measured too
+    response = client.patch("/v1/orders/10", headers={"Auth-Token": generate_token('id5')}, json=[{'item_id': 'a'}])
+    assert response.status_code == 422
+    assert 'validation;dur=' in response.headers['server-timing']
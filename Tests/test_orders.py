@@ -1,7 +1,18 @@
+import json
+from decimal import Decimal
 import pytest
 from jose import jwt 
 from fastapi import HTTPException, status
-from Routes.orders import get_current_user
+from fastapi.encoders import jsonable_encoder
+from Routes.orders import get_current_user, get_db_connection
+from Auth.tokens import reset_token_cache, token_cache
+from Cache.carts import reset_cart_cache
+from Database.idempotency import reset_idempotency_cache
+from Database.connection import get_table, reset_connection
+from Metrics.middleware import reset_settings
+from Database.records import derived_attributes, public_record
+from Database.schema import create_idempotency_table, create_table
+from Models.ShoppingCart import ShoppingCart
 from fastapi.testclient import TestClient
 from moto import mock_dynamodb
 import boto3
@@ -18,6 +29,23 @@ def generate_token(user_id, isAdmin=False, secret_key="test_secret_key"):
 def mock_env(monkeypatch):
     monkeypatch.setenv("JWT_SECRET", "test_secret_key")
     monkeypatch.setenv("AWS_DEFAULT_REGION", "ap-southeast-2")
+    # No metric records on stdout (Tests/test_metrics.py checks them)
+    monkeypatch.setenv("METRICS_SINK", "none")
+
+@pytest.fixture(autouse=True)
+def fresh_process_state():
+    # The DynamoDB resource, JWT secret and caches are shared per process, so start every test with new ones
+    reset_connection()
+    reset_token_cache()
+    reset_cart_cache()
+    reset_idempotency_cache()
+    reset_settings()
+    yield
+    reset_connection()
+    reset_token_cache()
+    reset_cart_cache()
+    reset_idempotency_cache()
+    reset_settings()
 
 def test_valid_token(mock_env):
     user_id = "123"
@@ -50,77 +78,101 @@ def test_jwt_error(mock_env, monkeypatch):
     assert exc_info.value.status_code == status.HTTP_401_UNAUTHORIZED
     assert "Could not validate credentials" in str(exc_info.value.detail)
 
+def test_token_cache_hits(mock_env):
+    token = generate_token("123")
+    assert get_current_user(token) == ("123", False)
+    assert get_current_user(token) == ("123", False)
+    assert token_cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+def test_token_cache_honors_exp(mock_env):
+    import time
+    exp = int(time.time()) + 1
+    token = jwt.encode({"user_id": "123", "exp": exp}, "test_secret_key", algorithm="HS256")
+    assert get_current_user(token) == ("123", False)
+    # python-jose compares exp with whole seconds, so wait until it is a full second in the past
+    time.sleep(exp + 1.1 - time.time())
+    with pytest.raises(HTTPException) as exc_info:
+        get_current_user(token)
+    assert exc_info.value.status_code == status.HTTP_401_UNAUTHORIZED
+    assert len(token_cache) == 0
+
+def test_invalid_token_is_not_cached(mock_env):
+    for _ in range(2):
+        with pytest.raises(HTTPException):
+            get_current_user("invalid_token")
+    assert len(token_cache) == 0
+
 #-----------------------------------------------------------------------------------------------------------------------------
 # Mock DynamoDB setup
 @mock_dynamodb
 def dynamodb_setup():
-    ddb = boto3.resource('dynamodb', region_name='ap-southeast-2')
-    ddb.create_table(
-        TableName='e-commerce',
-        KeySchema=[
-            {
-                'AttributeName': 'cart_id',
-                'KeyType': 'HASH'
-            }
-        ],
-        AttributeDefinitions=[
-            {
-                'AttributeName': 'cart_id',
-                'AttributeType': 'S'
-            },
-            {
-                'AttributeName': 'owner_id',
-                'AttributeType': 'S'
-            },
-            {
-                'AttributeName': 'state',
-                'AttributeType': 'S'  
-            }
-        ],
-        ProvisionedThroughput={
-            'ReadCapacityUnits': 10,
-            'WriteCapacityUnits': 10
-        },
-        GlobalSecondaryIndexes=[
-            {
-                'IndexName': 'owner_id-state-index',
-                'KeySchema': [
-                    {
-                        'AttributeName': 'owner_id',
-                        'KeyType': 'HASH'  
-                    },
-                    {
-                        'AttributeName': 'state',
-                        'KeyType': 'RANGE'  
-                    }
-                ],
-                'Projection': {
-                    'ProjectionType': 'ALL'  
-                },
-                'ProvisionedThroughput': {
-                    'ReadCapacityUnits': 10,
-                    'WriteCapacityUnits': 10
-                }
-            },
-            {
-                'IndexName': 'state-index',
-                'KeySchema': [
-                    {
-                        'AttributeName': 'state',
-                        'KeyType': 'HASH'  
-                    }
-                ],
-                'Projection': {
-                    'ProjectionType': 'ALL'
-                },
-                'ProvisionedThroughput': {
-                    'ReadCapacityUnits': 10,
-                    'WriteCapacityUnits': 10
-                }
-            }
-        ]
-    )
-    return ddb.Table('e-commerce')
+    return create_table(boto3.resource('dynamodb', region_name='ap-southeast-2'))
+
+# Store a cart the way the API writes it, including the derived index attributes
+def with_derived(cart):
+    return {**cart, **derived_attributes(cart)}
+
+# Shared connection tests
+@mock_dynamodb
+def test_get_table_is_reused(mock_env):
+    dynamodb_setup()
+    assert get_table() is get_table()
+    reset_connection()
+    assert get_table().name == 'e-commerce'
+
+@mock_dynamodb
+def test_db_connection_dependency_override(mock_env):
+    ddb = dynamodb_setup()
+    app.dependency_overrides[get_db_connection] = lambda: ddb
+    try:
+        response = client.post("/v1/orders", headers={"Auth-Token": generate_token('id5')})
+    finally:
+        app.dependency_overrides.clear()
+    assert response.status_code == 200
+    assert ddb.get_item(Key={'cart_id': response.json()['cart_id']}).get('Item')['owner_id'] == 'id5'
+
+# Wraps a table and records the DynamoDB operations the routes issue, including the batch and
+# transaction calls made through table.meta.client
+class CountingTable:
+    def __init__(self, table):
+        self.table = table
+        self.calls = []
+        self.meta = CountingTable.Meta(self)
+
+    class Meta:
+        def __init__(self, counting):
+            self.client = CountingTable.Client(counting)
+
+    class Client:
+        def __init__(self, counting):
+            self.counting = counting
+
+        def __getattr__(self, name):
+            attribute = getattr(self.counting.table.meta.client, name)
+            if name in ('batch_get_item', 'batch_write_item', 'transact_write_items'):
+                def wrapper(**kwargs):
+                    self.counting.calls.append(name)
+                    return attribute(**kwargs)
+                return wrapper
+            return attribute
+
+    def __getattr__(self, name):
+        attribute = getattr(self.table, name)
+        if name in ('get_item', 'put_item', 'update_item', 'delete_item', 'query', 'scan'):
+            def wrapper(**kwargs):
+                self.calls.append(name)
+                return attribute(**kwargs)
+            return wrapper
+        return attribute
+
+@pytest.fixture
+def counting_table():
+    def install(ddb):
+        table = CountingTable(ddb)
+        app.dependency_overrides[get_db_connection] = lambda: table
+        return table
+    yield install
+    app.dependency_overrides.clear()
 
 # Create shopping cart tests: (POST /v1/orders)
 @mock_dynamodb
@@ -147,6 +199,95 @@ def test_create_shopping_cart_DB_error(mock_env):
     response = client.post("/v1/orders", headers={"Auth-Token": generate_token('id10', True)})
     assert response.status_code == 500
  
+#-----------------------------------------------------------------------------------------------------------------------------
+# Get a single shopping cart tests: (GET /v1/orders/{cart_id})
+@mock_dynamodb
+def test_get_shopping_cart_valid(mock_env):
+    ddb = dynamodb_setup()
+    ddb.put_item(Item={'cart_id': '10', 'owner_id': 'id5', 'state': 'open', 'items': [{'item_id': 'item10', 'name':'tv', 'price': '12500.52', 'quantity':'80'}]})
+    response = client.get("/v1/orders/10", headers={"Auth-Token": generate_token('id5')})
+    assert response.status_code == 200
+    assert response.json()['items'][0]['item_id'] == 'item10'
+    # Admins can read any cart
+    response = client.get("/v1/orders/10", headers={"Auth-Token": generate_token('adminID', True)})
+    assert response.status_code == 200
+
+@mock_dynamodb
+def test_get_shopping_cart_matches_response_model(mock_env):
+    ddb = dynamodb_setup()
+    cart = {'cart_id': '10', 'owner_id': 'id5', 'state': 'open', 'items': {
+        'a': {'name': 'tv', 'price': Decimal('12500.52'), 'quantity': Decimal(80)},
+        'b': {'name': 'cable', 'description': 'HDMI', 'price': Decimal('10'), 'quantity': Decimal(1)},
+    }}
+    ddb.put_item(Item=with_derived(cart))
+    response = client.get("/v1/orders/10", headers={"Auth-Token": generate_token('id5')})
+    assert response.status_code == 200
+    # Served without validation, but identical to what response_model=ShoppingCart produced
+    expected = jsonable_encoder(ShoppingCart(**public_record(cart)))
+    assert response.json() == expected
+    assert response.json()['items'][0] == {'item_id': 'a', 'name': 'tv', 'description': None, 'price': 12500.52, 'quantity': 80}
+
+@mock_dynamodb
+def test_get_shopping_cart_not_found(mock_env):
+    dynamodb_setup()
+    response = client.get("/v1/orders/10", headers={"Auth-Token": generate_token('id5')})
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Shopping cart not found"}
+
+@mock_dynamodb
+def test_get_shopping_cart_not_authorized(mock_env):
+    ddb = dynamodb_setup()
+    ddb.put_item(Item={'cart_id': '10', 'owner_id': 'id5', 'state': 'open'})
+    response = client.get("/v1/orders/10", headers={"Auth-Token": generate_token('id10')})
+    assert response.status_code == 401
+    assert response.json() == {"detail": "You are not authorized to access this resource"}
+
+@mock_dynamodb
+def test_get_shopping_cart_DB_error(mock_env):
+    dynamodb_setup().delete() # delete table to simulate DB error
+    response = client.get("/v1/orders/10", headers={"Auth-Token": generate_token('id5')})
+    assert response.status_code == 500
+
+@mock_dynamodb
+def test_get_shopping_cart_is_cached(mock_env, counting_table):
+    ddb = dynamodb_setup()
+    ddb.put_item(Item={'cart_id': '10', 'owner_id': 'id5', 'state': 'open', 'items': []})
+    table = counting_table(ddb)
+    headers = {"Auth-Token": generate_token('id5')}
+    for _ in range(3):
+        assert client.get("/v1/orders/10", headers=headers).status_code == 200
+    assert table.calls == ['get_item']
+    # Writes refresh the cached cart
+    client.patch("/v1/orders/10", headers=headers, json=[{'item_id': 'item10', 'name':'tv', 'price': '1', 'quantity':'2'}])
+    assert client.get("/v1/orders/10", headers=headers).json()['items'][0]['item_id'] == 'item10'
+    assert table.calls == ['get_item', 'update_item']
+    # Deletes invalidate it
+    client.delete("/v1/orders/10", headers=headers)
+    assert client.get("/v1/orders/10", headers=headers).status_code == 404
+    assert table.calls == ['get_item', 'update_item', 'delete_item', 'get_item']
+
+@mock_dynamodb
+def test_cached_cart_rejects_non_owner_without_writing(mock_env, counting_table):
+    ddb = dynamodb_setup()
+    ddb.put_item(Item={'cart_id': '10', 'owner_id': 'id5', 'state': 'open', 'items': []})
+    table = counting_table(ddb)
+    client.get("/v1/orders/10", headers={"Auth-Token": generate_token('id5')})
+    response = client.post("/v1/orders/10/checkout", headers={"Auth-Token": generate_token('id10')})
+    assert response.status_code == 401
+    assert table.calls == ['get_item']
+
+@mock_dynamodb
+def test_stale_cached_cart_cannot_authorize_write(mock_env):
+    ddb = dynamodb_setup()
+    ddb.put_item(Item={'cart_id': '10', 'owner_id': 'id5', 'state': 'open', 'items': []})
+    headers = {"Auth-Token": generate_token('id5')}
+    client.get("/v1/orders/10", headers=headers)
+    # Checked out behind the cache's back: the cached cart still says "open"
+    ddb.put_item(Item={'cart_id': '10', 'owner_id': 'id5', 'state': 'PAID', 'items': []})
+    response = client.post("/v1/orders/10/checkout", headers=headers)
+    assert response.status_code == 400
+    assert client.get("/v1/orders/10", headers=headers).json()['state'] == 'PAID'
+
 #-----------------------------------------------------------------------------------------------------------------------------
 # Delete shopping cart tests: (DELETE /v1/orders/{cart_id})
 @mock_dynamodb
@@ -158,6 +299,15 @@ def test_delete_shopping_cart_valid(mock_env):
     assert response.status_code == 200
     assert response.json() == {"detail": "Shopping cart deleted successfully"}
 
+@mock_dynamodb
+def test_delete_shopping_cart_single_write(mock_env, counting_table):
+    ddb = dynamodb_setup()
+    ddb.put_item(Item={'cart_id': '10', 'owner_id': 'id5', 'state': 'full'})
+    table = counting_table(ddb)
+    response = client.delete("/v1/orders/10", headers={"Auth-Token": generate_token('id5')})
+    assert response.status_code == 200
+    assert table.calls == ['delete_item']
+
 @mock_dynamodb
 def test_delete_shopping_cart_not_found(mock_env):
     dynamodb_setup()
@@ -190,6 +340,19 @@ def test_checkout_shopping_cart_valid(mock_env):
     data = response.json()
     assert data['state'] == "PAID"
 
+@mock_dynamodb
+def test_checkout_shopping_cart_single_write(mock_env, counting_table):
+    ddb = dynamodb_setup()
+    ddb.put_item(Item={'cart_id': 'CartID100', 'owner_id': 'OwnerID100', 'state': 'OPEN'})
+    table = counting_table(ddb)
+    response = client.post("/v1/orders/CartID100/checkout", headers={"Auth-Token": generate_token('OwnerID100')})
+    assert response.status_code == 200
+    assert table.calls == ['update_item']
+    # The cart is only read when the conditional write is rejected
+    response = client.post("/v1/orders/CartID100/checkout", headers={"Auth-Token": generate_token('OwnerID100')})
+    assert response.status_code == 400
+    assert table.calls == ['update_item', 'update_item', 'get_item']
+
 @mock_dynamodb
 def test_checkout_shopping_cart_not_found(mock_env):
     dynamodb_setup()
@@ -231,6 +394,17 @@ def test_update_shopping_cart_valid(mock_env):
     assert len(data['items']) == 2
     assert data['items'][0]['item_id'] == "item10"
     assert data['items'][1]['name'] == "tv2"
+    assert set(ddb.get_item(Key={'cart_id': 'CartID100'})['Item']['items']) == {'item10', 'item20'}
+
+@mock_dynamodb
+def test_update_shopping_cart_single_write(mock_env, counting_table):
+    ddb = dynamodb_setup()
+    ddb.put_item(Item={'cart_id': 'CartID100', 'owner_id': 'OwnerID100', 'state': 'open', 'items': []})
+    table = counting_table(ddb)
+    response = client.patch("/v1/orders/CartID100", headers={"Auth-Token": generate_token('OwnerID100')}, json=[{'item_id': 'item10', 'name':'tv', 'price': '12500.52', 'quantity':'80'}])
+    assert response.status_code == 200
+    assert table.calls == ['update_item']
+    assert 'expires_at' in ddb.get_item(Key={'cart_id': 'CartID100'})['Item']
 
 @mock_dynamodb
 def test_update_shopping_cart_not_found(mock_env):
@@ -252,7 +426,256 @@ def test_update_shopping_cart_not_authorized(mock_env):
 @mock_dynamodb
 def test_update_shopping_cart_DB_error(mock_env):
     dynamodb_setup().delete() # delete table to simulate DB error 
-    response = client.patch("/v1/orders/CartID100", headers={"Auth-Token": generate_token('OwnerID100')}, json=[{'item_id': 'XXXXXX', 'name':'tv', 'price': '12500.52', 'quantity':'80'}, {'item_id': 'XXXXXX', 'name':'tv2', 'price': '12500.52', 'quantity':'80'}])
+    response = client.patch("/v1/orders/CartID100", headers={"Auth-Token": generate_token('OwnerID100')}, json=[{'item_id': 'XXXXXX', 'name':'tv', 'price': '12500.52', 'quantity':'80'}, {'item_id': 'YYYYYY', 'name':'tv2', 'price': '12500.52', 'quantity':'80'}])
+    assert response.status_code == 500
+
+@mock_dynamodb
+def test_update_shopping_cart_duplicate_item_ids(mock_env):
+    ddb = dynamodb_setup()
+    Item = {'cart_id': 'CartID100', 'owner_id': 'OwnerID100', 'state': 'open', 'items': {}, 'subtotal': 0, 'item_count': 0, 'line_count': 0}
+    ddb.put_item(Item=Item)
+    # Items are stored by item_id: a repeated id is rejected instead of dropping a line
+    response = client.patch("/v1/orders/CartID100", headers={"Auth-Token": generate_token('OwnerID100')}, json=[{'item_id': 'a', 'name':'tv', 'price': '1', 'quantity':'1'}, {'item_id': 'a', 'name':'tv', 'price': '2', 'quantity':'3'}])
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Each item_id can only appear once in a shopping cart."}
+    assert ddb.get_item(Key={'cart_id': 'CartID100'})['Item'] == Item
+
+    # The totals stay in step with the stored items through later item operations
+    headers = {"Auth-Token": generate_token('OwnerID100')}
+    response = client.patch("/v1/orders/CartID100", headers=headers, json=[{'item_id': 'a', 'name':'tv', 'price': '2', 'quantity':'3'}, {'item_id': 'b', 'name':'tv', 'price': '1', 'quantity':'1'}])
+    assert (response.json()['subtotal'], response.json()['item_count'], response.json()['line_count']) == (7, 4, 2)
+    response = client.patch("/v1/orders/CartID100/items", headers=headers, json=[{"op": "remove", "item_id": "a"}])
+    assert [item['item_id'] for item in response.json()['items']] == ['b']
+    assert (response.json()['subtotal'], response.json()['item_count'], response.json()['line_count']) == (1, 1, 1)
+
+#-----------------------------------------------------------------------------------------------------------------------------
+# Change individual items of a cart: PATCH /v1/orders/uuid/items
+@mock_dynamodb
+def test_patch_items_valid(mock_env, counting_table):
+    ddb = dynamodb_setup()
+    headers = {"Auth-Token": generate_token('OwnerID100')}
+    cart_id = client.post("/v1/orders", headers=headers).json()['cart_id']
+    table = counting_table(ddb)
+    response = client.patch(f"/v1/orders/{cart_id}/items", headers=headers, json=[
+        {'op': 'add', 'item': {'item_id': 'item10', 'name':'tv', 'price': '12500.52', 'quantity': 1}},
+        {'op': 'add', 'item': {'item_id': 'item20', 'name':'tv2', 'price': '10', 'quantity': 2}},
+    ])
+    assert response.status_code == 200
+    assert [item['item_id'] for item in response.json()['items']] == ['item10', 'item20']
+    response = client.patch(f"/v1/orders/{cart_id}/items", headers=headers, json=[
+        {'op': 'remove', 'item_id': 'item10'},
+        {'op': 'set_quantity', 'item_id': 'item20', 'quantity': 5},
+    ])
+    assert response.status_code == 200
+    assert response.json()['items'] == [{'item_id': 'item20', 'name': 'tv2', 'description': None, 'price': 10, 'quantity': 5}]
+    # One targeted write per request, stored as a map keyed by item_id
+    assert table.calls == ['update_item', 'update_item']
+    assert ddb.get_item(Key={'cart_id': cart_id})['Item']['items'] == {'item20': {'name': 'tv2', 'description': None, 'price': 10, 'quantity': 5}}
+
+@mock_dynamodb
+def test_patch_items_migrates_list_cart(mock_env):
+    ddb = dynamodb_setup()
+    ddb.put_item(Item={'cart_id': 'CartID100', 'owner_id': 'OwnerID100', 'state': 'OPEN', 'items': [{'item_id': 'Old10', 'name':'Old', 'price': '1', 'quantity':'10'}]})
+    ddb.put_item(Item={'cart_id': 'CartID200', 'owner_id': 'OwnerID100', 'state': 'OPEN'})
+    headers = {"Auth-Token": generate_token('OwnerID100')}
+    response = client.patch("/v1/orders/CartID100/items", headers={**headers, "If-Match": '"0"'}, json=[{'op': 'set_quantity', 'item_id': 'Old10', 'quantity': 3}])
+    assert response.status_code == 200
+    assert response.json()['items'][0]['quantity'] == 3
+    # Converting the items doesn't change the cart, so only the patch counts as a new version
+    assert response.json()['version'] == 1
+    assert ddb.get_item(Key={'cart_id': 'CartID100'})['Item']['items'] == {'Old10': {'name': 'Old', 'price': '1', 'quantity': 3}}
+    response = client.patch("/v1/orders/CartID200/items", headers=headers, json=[{'op': 'add', 'item': {'item_id': 'a', 'name': 'tv', 'price': '1', 'quantity': 1}}])
+    assert response.status_code == 200
+    assert [item['item_id'] for item in response.json()['items']] == ['a']
+
+@mock_dynamodb
+def test_patch_items_compact_encoding(mock_env, monkeypatch):
+    ddb = dynamodb_setup()
+    headers = {"Auth-Token": generate_token('OwnerID100')}
+    cart_id = client.post("/v1/orders", headers=headers).json()['cart_id']
+    client.patch(f"/v1/orders/{cart_id}", headers=headers, json=[{'item_id': 'item10', 'name': 'tv', 'price': '12500.52', 'quantity': 1}])
+    full = client.get(f"/v1/orders/{cart_id}", headers=headers).json()
+
+    # A full-format cart is rewritten with short keys on its next change, and reads the same
+    monkeypatch.setenv("ITEMS_ENCODING", "compact")
+    response = client.patch(f"/v1/orders/{cart_id}/items", headers=headers, json=[
+        {'op': 'add', 'item': {'item_id': 'item20', 'name': 'tv2', 'price': '10', 'quantity': 2}},
+        {'op': 'set_quantity', 'item_id': 'item10', 'quantity': 3},
+    ])
+    assert response.status_code == 200
+    assert response.json()['items'] == [{**full['items'][0], 'quantity': 3}, {'item_id': 'item20', 'name': 'tv2', 'description': None, 'price': 10, 'quantity': 2}]
+    stored = ddb.get_item(Key={'cart_id': cart_id})['Item']
+    assert stored['iv'] == 2
+    assert stored['items'] == {'item10': {'n': 'tv', 'p': Decimal('12500.52'), 'q': 3}, 'item20': {'n': 'tv2', 'p': 10, 'q': 2}}
+    assert client.get(f"/v1/orders/{cart_id}", headers=headers).json() == response.json()
+    response = client.get(f"/v1/orders?user=OwnerID100", headers=headers)
+    assert response.json()[0]['items'] == [{**full['items'][0], 'quantity': 3}, {'item_id': 'item20', 'name': 'tv2', 'description': None, 'price': 10, 'quantity': 2}]
+
+@mock_dynamodb
+def test_cart_totals_maintained_on_write(mock_env):
+    ddb = dynamodb_setup()
+    headers = {"Auth-Token": generate_token('OwnerID100')}
+    cart = client.post("/v1/orders", headers=headers).json()
+    assert (cart['subtotal'], cart['item_count'], cart['line_count']) == (0, 0, 0)
+    cart_id = cart['cart_id']
+
+    def totals(response):
+        assert response.status_code == 200
+        data = response.json()
+        stored = ddb.get_item(Key={'cart_id': cart_id})['Item']
+        assert (stored['subtotal'], stored['item_count'], stored['line_count']) == (Decimal(str(data['subtotal'])), data['item_count'], data['line_count'])
+        # moto applies ADD with float arithmetic, DynamoDB with exact decimals
+        return pytest.approx(data['subtotal']), data['item_count'], data['line_count']
+
+    assert totals(client.patch(f"/v1/orders/{cart_id}", headers=headers, json=[
+        {'item_id': 'a', 'name': 'tv', 'price': '12500.52', 'quantity': 2},
+        {'item_id': 'b', 'name': 'cable', 'price': '9.99', 'quantity': 3},
+    ])) == (25031.01, 5, 2)
+    assert totals(client.patch(f"/v1/orders/{cart_id}/items", headers=headers, json=[
+        {'op': 'set_quantity', 'item_id': 'a', 'quantity': 1},
+        {'op': 'add', 'item': {'item_id': 'b', 'name': 'cable', 'price': '5', 'quantity': 1}},
+        {'op': 'add', 'item': {'item_id': 'c', 'name': 'plug', 'price': '0.5', 'quantity': 4}},
+        {'op': 'remove', 'item_id': 'missing'},
+    ])) == (12507.52, 6, 3)
+    assert totals(client.patch(f"/v1/orders/{cart_id}/items", headers=headers, json=[{'op': 'remove', 'item_id': 'a'}])) == (7, 5, 2)
+
+    # A stale cached cart fails the per-line condition; the cart is read again and the totals stay exact
+    ddb.update_item(Key={'cart_id': cart_id}, UpdateExpression="SET #items.#b.#q = :q, subtotal = :s, item_count = :c",
+        ExpressionAttributeNames={'#items': 'items', '#b': 'b', '#q': 'quantity'}, ExpressionAttributeValues={':q': 3, ':s': Decimal(17), ':c': 7})
+    assert totals(client.patch(f"/v1/orders/{cart_id}/items", headers=headers, json=[{'op': 'set_quantity', 'item_id': 'b', 'quantity': 2}])) == (12, 6, 2)
+
+@mock_dynamodb
+def test_get_orders_summary_view(mock_env):
+    ddb = dynamodb_setup()
+    headers = {"Auth-Token": generate_token('id100')}
+    cart_id = client.post("/v1/orders", headers=headers).json()['cart_id']
+    cart = client.patch(f"/v1/orders/{cart_id}", headers=headers, json=[{'item_id': 'a', 'name': 'tv', 'price': '10', 'quantity': 2}]).json()
+    # Carts written before the totals were stored: computed from the items in the full view
+    ddb.put_item(Item={'cart_id': 'old', 'owner_id': 'id100', 'state': 'open', 'items': {'a': {'name': 'tv', 'price': 3, 'quantity': 1}}})
+
+    response = client.get("/v1/orders?user=id100&view=summary", headers=headers)
+    assert response.status_code == 200
+    assert sorted(response.json(), key=lambda cart: cart['cart_id']) == sorted([
+        {'cart_id': cart_id, 'owner_id': 'id100', 'state': 'open', 'subtotal': 20, 'item_count': 2, 'line_count': 1, 'created_at': cart['created_at'], 'updated_at': cart['updated_at']},
+        {'cart_id': 'old', 'owner_id': 'id100', 'state': 'open'},
+    ], key=lambda cart: cart['cart_id'])
+    full = {cart['cart_id']: cart for cart in client.get("/v1/orders?user=id100", headers=headers).json()}
+    assert (full['old']['subtotal'], full['old']['item_count'], full['old']['line_count']) == (3, 1, 1)
+    assert client.get("/v1/orders?user=id100&view=items", headers=headers).status_code == 422
+
+@mock_dynamodb
+def test_patch_items_unknown_item(mock_env):
+    ddb = dynamodb_setup()
+    headers = {"Auth-Token": generate_token('OwnerID100')}
+    cart_id = client.post("/v1/orders", headers=headers).json()['cart_id']
+    response = client.patch(f"/v1/orders/{cart_id}/items", headers=headers, json=[{'op': 'set_quantity', 'item_id': 'nope', 'quantity': 3}])
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Item nope not found in shopping cart"}
+    assert ddb.get_item(Key={'cart_id': cart_id})['Item']['items'] == {}
+
+@mock_dynamodb
+def test_patch_items_item_missing_from_stale_cache(mock_env, counting_table):
+    ddb = dynamodb_setup()
+    headers = {"Auth-Token": generate_token('OwnerID100')}
+    cart_id = client.post("/v1/orders", headers=headers).json()['cart_id']
+    # Added through another container: the cached cart doesn't have the item yet
+    client.patch(f"/v1/orders/{cart_id}/items", headers=headers, json=[{'op': 'add', 'item': {'item_id': 'b', 'name': 'tv', 'price': '1', 'quantity': 1}}])
+    ddb.update_item(Key={'cart_id': cart_id}, UpdateExpression="SET #items.#a = :item, subtotal = subtotal + :two, item_count = item_count + :one, line_count = line_count + :one",
+                    ExpressionAttributeNames={'#items': 'items', '#a': 'a'}, ExpressionAttributeValues={':item': {'name': 'radio', 'description': None, 'price': 2, 'quantity': 1}, ':two': 2, ':one': 1})
+    table = counting_table(ddb)
+    response = client.patch(f"/v1/orders/{cart_id}/items", headers=headers, json=[{'op': 'set_quantity', 'item_id': 'a', 'quantity': 3}])
+    assert response.status_code == 200
+    assert {item['item_id']: item['quantity'] for item in response.json()['items']} == {'a': 3, 'b': 1}
+    assert (response.json()['subtotal'], response.json()['item_count']) == (7, 4)
+    assert table.calls == ['get_item', 'update_item']
+
+@mock_dynamodb
+def test_patch_items_not_found_and_not_authorized(mock_env):
+    ddb = dynamodb_setup()
+    ddb.put_item(Item={'cart_id': 'CartID100', 'owner_id': 'OwnerID100', 'state': 'OPEN', 'items': {}})
+    operations = [{'op': 'remove', 'item_id': 'a'}]
+    response = client.patch("/v1/orders/CartID999/items", headers={"Auth-Token": generate_token('OwnerID100')}, json=operations)
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Shopping cart not found"}
+    response = client.patch("/v1/orders/CartID100/items", headers={"Auth-Token": generate_token('NotOwnerID')}, json=operations)
+    assert response.status_code == 401
+    assert response.json() == {"detail": "You are not authorized to use this shopping cart"}
+
+@mock_dynamodb
+def test_patch_items_bad_request(mock_env):
+    dynamodb_setup()
+    headers = {"Auth-Token": generate_token('OwnerID100')}
+    response = client.patch("/v1/orders/CartID100/items", headers=headers, json=[])
+    assert response.status_code == 400
+    response = client.patch("/v1/orders/CartID100/items", headers=headers, json=[{'op': 'remove', 'item_id': 'a'}, {'op': 'set_quantity', 'item_id': 'a', 'quantity': 1}])
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Each item can only be changed once per request."}
+    response = client.patch("/v1/orders/CartID100/items", headers=headers, json=[{'op': 'add'}])
+    assert response.status_code == 422
+    response = client.patch("/v1/orders/CartID100/items", headers=headers, json=[{'op': 'set_quantity', 'item_id': 'a', 'quantity': 0}])
+    assert response.status_code == 422
+
+#-----------------------------------------------------------------------------------------------------------------------------
+# Batch endpoints: POST /v1/orders:batchGet, :batchDelete, :batchCheckout
+@mock_dynamodb
+def test_batch_get_shopping_carts(mock_env):
+    ddb = dynamodb_setup()
+    for i in range(150):
+        ddb.put_item(Item={'cart_id': f'cart{i}', 'owner_id': f'owner{i}', 'state': 'open', 'items': {}})
+    cart_ids = [f'cart{i}' for i in range(150)] + ['missing', 'cart0']
+    response = client.post("/v1/orders:batchGet", headers={"Auth-Token": generate_token('adminID', True)}, json={'cart_ids': cart_ids})
+    assert response.status_code == 200
+    results = response.json()
+    assert [result['cart_id'] for result in results] == cart_ids[:-1]
+    assert all(result['status'] == 200 and result['cart']['owner_id'] == f'owner{i}' for i, result in enumerate(results[:150]))
+    assert results[150] == {'cart_id': 'missing', 'status': 404, 'detail': 'Shopping cart not found', 'cart': None}
+
+@mock_dynamodb
+def test_batch_delete_shopping_carts(mock_env):
+    ddb = dynamodb_setup()
+    for i in range(60):
+        ddb.put_item(Item={'cart_id': f'cart{i}', 'owner_id': 'owner', 'state': 'open'})
+    response = client.post("/v1/orders:batchDelete", headers={"Auth-Token": generate_token('adminID', True)}, json={'cart_ids': [f'cart{i}' for i in range(50)] + ['missing']})
+    assert response.status_code == 200
+    assert {result['status'] for result in response.json()[:50]} == {200}
+    assert len(response.json()) == 51
+    # As DELETE /v1/orders/missing would answer
+    assert response.json()[50] == {'cart_id': 'missing', 'status': 404, 'detail': 'Shopping cart not found.'}
+    assert sorted(item['cart_id'] for item in ddb.scan()['Items']) == sorted(f'cart{i}' for i in range(50, 60))
+
+@mock_dynamodb
+def test_batch_checkout_shopping_carts(mock_env):
+    ddb = dynamodb_setup()
+    ddb.put_item(Item={'cart_id': 'open1', 'owner_id': 'owner1', 'state': 'open'})
+    ddb.put_item(Item={'cart_id': 'open2', 'owner_id': 'owner2', 'state': 'open'})
+    ddb.put_item(Item={'cart_id': 'paid', 'owner_id': 'owner1', 'state': 'PAID'})
+    response = client.post("/v1/orders:batchCheckout", headers={"Auth-Token": generate_token('adminID', True)}, json={'cart_ids': ['open1', 'paid', 'missing', 'open2']})
+    assert response.status_code == 200
+    assert response.json() == [
+        {'cart_id': 'open1', 'status': 200, 'detail': 'Shopping cart checked out'},
+        {'cart_id': 'paid', 'status': 400, 'detail': 'Shopping cart is already checked out'},
+        {'cart_id': 'missing', 'status': 404, 'detail': 'Shopping cart not found'},
+        {'cart_id': 'open2', 'status': 200, 'detail': 'Shopping cart checked out'},
+    ]
+    for cart_id in ('open1', 'open2'):
+        cart = ddb.get_item(Key={'cart_id': cart_id})['Item']
+        assert cart['state'] == 'PAID'
+        assert cart['state_shard'].startswith('PAID#')
+
+@mock_dynamodb
+def test_batch_endpoints_require_admin(mock_env):
+    dynamodb_setup()
+    for path in ("/v1/orders:batchGet", "/v1/orders:batchDelete", "/v1/orders:batchCheckout"):
+        response = client.post(path, headers={"Auth-Token": generate_token('id5')}, json={'cart_ids': ['10']})
+        assert response.status_code == 401
+        assert response.json() == {"detail": "You are not authorized to access this resource"}
+    response = client.post("/v1/orders:batchGet", headers={"Auth-Token": generate_token('adminID', True)}, json={'cart_ids': []})
+    assert response.status_code == 422
+
+@mock_dynamodb
+def test_batch_get_DB_error(mock_env):
+    dynamodb_setup().delete() # delete table to simulate DB error
+    response = client.post("/v1/orders:batchGet", headers={"Auth-Token": generate_token('adminID', True)}, json={'cart_ids': ['10']})
     assert response.status_code == 500
 
 #-----------------------------------------------------------------------------------------------------------------------------
@@ -326,20 +749,22 @@ def test_get_orders_by_user_DB_error(mock_env):
 @mock_dynamodb
 def test_get_orders_by_state_valid(mock_env):
     ddb = dynamodb_setup()
-    ddb.put_item(Item={'cart_id': 'id1', 'owner_id': 'id100', 'state': 'PAID', 'items':[ {'item_id': '123', 'name':'tv', 'price': '12500.52', 'quantity':'80'}, {'item_id': '456', 'name':'tv2', 'price': '12500.52', 'quantity':'80'} ]})
-    ddb.put_item(Item={'cart_id': 'id2', 'owner_id': 'id200', 'state': 'PAID', 'items':[ {'item_id': '2123', 'name':'tv', 'price': '12500.52', 'quantity':'80'}, {'item_id': '2456', 'name':'tv2', 'price': '12500.52', 'quantity':'80'} ]})
+    ddb.put_item(Item=with_derived({'cart_id': 'id1', 'owner_id': 'id100', 'state': 'PAID', 'items':[ {'item_id': '123', 'name':'tv', 'price': '12500.52', 'quantity':'80'}, {'item_id': '456', 'name':'tv2', 'price': '12500.52', 'quantity':'80'} ]}))
+    ddb.put_item(Item=with_derived({'cart_id': 'id2', 'owner_id': 'id200', 'state': 'PAID', 'items':[ {'item_id': '2123', 'name':'tv', 'price': '12500.52', 'quantity':'80'}, {'item_id': '2456', 'name':'tv2', 'price': '12500.52', 'quantity':'80'} ]}))
     response = client.get("/v1/orders?state=PAID", headers={"Auth-Token": generate_token('adminID', True)})
     assert response.status_code == 200
     orders = response.json()
     assert len(orders) == 2
-    assert orders[0]['items'][0]['item_id'] == '123'
-    assert orders[1]['items'][1]['item_id'] == '2456'
+    # Results are merged from several index shards, so look them up by cart
+    orders = {order['cart_id']: order for order in orders}
+    assert orders['id1']['items'][0]['item_id'] == '123'
+    assert orders['id2']['items'][1]['item_id'] == '2456'
 
 @mock_dynamodb
 def test_get_orders_by_state_invalid(mock_env):
     ddb = dynamodb_setup()
-    ddb.put_item(Item={'cart_id': 'id1', 'owner_id': 'id100', 'state': 'PAID', 'items':[ {'item_id': '123', 'name':'tv', 'price': '12500.52', 'quantity':'80'}, {'item_id': '456', 'name':'tv2', 'price': '12500.52', 'quantity':'80'} ]})
-    ddb.put_item(Item={'cart_id': 'id2', 'owner_id': 'id200', 'state': 'PAID', 'items':[ {'item_id': '2123', 'name':'tv', 'price': '12500.52', 'quantity':'80'}, {'item_id': '2456', 'name':'tv2', 'price': '12500.52', 'quantity':'80'} ]})
+    ddb.put_item(Item=with_derived({'cart_id': 'id1', 'owner_id': 'id100', 'state': 'PAID', 'items':[ {'item_id': '123', 'name':'tv', 'price': '12500.52', 'quantity':'80'}, {'item_id': '456', 'name':'tv2', 'price': '12500.52', 'quantity':'80'} ]}))
+    ddb.put_item(Item=with_derived({'cart_id': 'id2', 'owner_id': 'id200', 'state': 'PAID', 'items':[ {'item_id': '2123', 'name':'tv', 'price': '12500.52', 'quantity':'80'}, {'item_id': '2456', 'name':'tv2', 'price': '12500.52', 'quantity':'80'} ]}))
     response = client.get("/v1/orders?state=PAID", headers={"Auth-Token": generate_token('normalUserID', False)})
     assert response.status_code == 401
     assert response.json() == {"detail": "You are not authorized to access this resource"}
@@ -350,9 +775,343 @@ def test_get_orders_by_state_DB_error(mock_env):
     response = client.get("/v1/orders?state=PAID", headers={"Auth-Token": generate_token('adminID', True)})
     assert response.status_code == 500
 
+@mock_dynamodb
+def test_get_orders_paginated(mock_env):
+    ddb = dynamodb_setup()
+    for i in range(5):
+        ddb.put_item(Item={'cart_id': f'id{i}', 'owner_id': 'id100', 'state': 'PAID', 'items': []})
+    headers = {"Auth-Token": generate_token('id100')}
+    seen, token = [], None
+    while True:
+        url = "/v1/orders?user=id100&limit=2" + (f"&next_token={token}" if token else "")
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        assert len(response.json()) <= 2
+        seen.extend(order['cart_id'] for order in response.json())
+        token = response.headers.get('X-Next-Token')
+        if token is None:
+            break
+    assert sorted(seen) == [f'id{i}' for i in range(5)]
+
+@mock_dynamodb
+def test_get_orders_by_state_across_shards(mock_env, monkeypatch):
+    monkeypatch.setenv("STATE_INDEX_SHARDS", "4")
+    ddb = dynamodb_setup()
+    for i in range(12):
+        ddb.put_item(Item=with_derived({'cart_id': f'cart{i}', 'owner_id': 'id100', 'state': 'PAID', 'items': []}))
+    assert len({ddb.get_item(Key={'cart_id': f'cart{i}'})['Item']['state_shard'] for i in range(12)}) > 1
+    headers = {"Auth-Token": generate_token('adminID', True)}
+    response = client.get("/v1/orders?state=PAID", headers=headers)
+    assert sorted(order['cart_id'] for order in response.json()) == sorted(f'cart{i}' for i in range(12))
+    seen, token = [], None
+    while True:
+        response = client.get("/v1/orders?state=PAID&limit=5" + (f"&next_token={token}" if token else ""), headers=headers)
+        assert response.status_code == 200
+        assert len(response.json()) <= 5
+        seen.extend(order['cart_id'] for order in response.json())
+        token = response.headers.get('X-Next-Token')
+        if token is None:
+            break
+    assert sorted(seen) == sorted(f'cart{i}' for i in range(12))
+
+@mock_dynamodb
+def test_create_and_checkout_write_state_shard(mock_env):
+    ddb = dynamodb_setup()
+    headers = {"Auth-Token": generate_token('id5')}
+    cart_id = client.post("/v1/orders", headers=headers).json()['cart_id']
+    # Open carts are left out of the sparse state index
+    assert 'state_shard' not in ddb.get_item(Key={'cart_id': cart_id})['Item']
+    client.post(f"/v1/orders/{cart_id}/checkout", headers=headers)
+    assert ddb.get_item(Key={'cart_id': cart_id})['Item']['state_shard'].startswith('PAID#')
+    response = client.get("/v1/orders?state=PAID", headers={"Auth-Token": generate_token('adminID', True)})
+    assert [order['cart_id'] for order in response.json()] == [cart_id]
+
+@mock_dynamodb
+def test_get_orders_reads_items_from_table(mock_env, counting_table):
+    ddb = dynamodb_setup()
+    for i in range(3):
+        ddb.put_item(Item=with_derived({'cart_id': f'id{i}', 'owner_id': 'id100', 'state': 'PAID', 'items': {'a': {'name': 'tv', 'price': 2, 'quantity': i + 1}}, 'subtotal': 2 * (i + 1), 'item_count': i + 1, 'line_count': 1}))
+    ddb.put_item(Item=with_derived({'cart_id': 'open', 'owner_id': 'id200', 'state': 'open', 'items': {}, 'subtotal': 0, 'item_count': 0, 'line_count': 0}))
+    table = counting_table(ddb)
+    admin = {"Auth-Token": generate_token('adminID', True)}
+
+    # The indexes only project keys and totals: the summary view is served by them alone...
+    response = client.get("/v1/orders?state=PAID&view=summary", headers=admin)
+    assert sorted(order['subtotal'] for order in response.json()) == [2, 4, 6]
+    assert all('items' not in order for order in response.json())
+    assert set(table.calls) == {'query'}
+    # ...and full carts are read from the table
+    response = client.get("/v1/orders?user=id100", headers={"Auth-Token": generate_token('id100')})
+    assert sorted(order['items'][0]['quantity'] for order in response.json()) == [1, 2, 3]
+
+    # Open carts are not in the sparse state index, they are found with a scan
+    table.calls.clear()
+    response = client.get("/v1/orders?state=open", headers=admin)
+    assert [order['cart_id'] for order in response.json()] == ['open']
+    assert table.calls == ['scan']
+
+@mock_dynamodb
+def test_writes_set_timestamps(mock_env):
+    ddb = dynamodb_setup()
+    headers = {"Auth-Token": generate_token('id100')}
+    cart = client.post("/v1/orders", headers=headers).json()
+    assert cart['created_at'] == cart['updated_at'] and cart['created_at'].endswith('Z')
+    updated = client.patch(f"/v1/orders/{cart['cart_id']}/items", headers=headers, json=[{'op': 'add', 'item': {'item_id': 'a', 'name': 'tv', 'price': '1', 'quantity': 1}}]).json()
+    assert updated['created_at'] == cart['created_at'] and updated['updated_at'] >= cart['updated_at']
+    checked_out = client.post(f"/v1/orders/{cart['cart_id']}/checkout", headers=headers).json()
+    assert checked_out['updated_at'] >= updated['updated_at']
+    assert ddb.get_item(Key={'cart_id': cart['cart_id']})['Item']['updated_at'] == checked_out['updated_at']
+
+@mock_dynamodb
+def test_get_orders_by_creation_time(mock_env, counting_table):
+    ddb = dynamodb_setup()
+    for day in range(1, 6):
+        ddb.put_item(Item=with_derived({'cart_id': f'day{day}', 'owner_id': 'id100', 'state': 'PAID' if day % 2 else 'open', 'items': {}, 'created_at': f'2024-01-0{day}T12:00:00.000Z'}))
+    # Created before timestamps existed: only in the state-ordered listing
+    ddb.put_item(Item=with_derived({'cart_id': 'old', 'owner_id': 'id100', 'state': 'open', 'items': {}}))
+    table = counting_table(ddb)
+    headers = {"Auth-Token": generate_token('id100')}
+
+    def cart_ids(query):
+        response = client.get(f"/v1/orders?user=id100&{query}", headers=headers)
+        assert response.status_code == 200
+        return [cart['cart_id'] for cart in response.json()]
+
+    # "My recent orders": one query reading only the requested number of index entries, and one
+    # BatchGetItem for those carts...
+    assert cart_ids("newest_first=true&limit=2") == ['day5', 'day4']
+    assert table.calls == ['query', 'batch_get_item']
+    # ...or just the query for summaries
+    table.calls.clear()
+    assert cart_ids("newest_first=true&limit=2&view=summary") == ['day5', 'day4']
+    assert table.calls == ['query']
+    assert cart_ids("since=2024-01-02T00:00:00Z&until=2024-01-04T23:00:00Z") == ['day2', 'day3', 'day4']
+    assert cart_ids("since=2024-01-04T00:00:00") == ['day4', 'day5']
+    assert cart_ids("until=2024-01-02T12:00:00Z&newest_first=true") == ['day2', 'day1']
+    assert cart_ids("state=PAID&newest_first=true") == ['day5', 'day3', 'day1']
+    assert len(cart_ids("state=open")) == 3
+
+    response = client.get("/v1/orders?state=PAID&newest_first=true", headers={"Auth-Token": generate_token('admin', True)})
+    assert response.status_code == 400
+    response = client.get("/v1/orders?user=id100&since=2024-01-03T00:00:00Z&until=2024-01-02T00:00:00Z", headers=headers)
+    assert response.status_code == 400
+    response = client.get("/v1/orders?user=id100&newest_first=true", headers={"Auth-Token": generate_token('other')})
+    assert response.status_code == 401
+
+@mock_dynamodb
+def test_get_orders_invalid_next_token(mock_env):
+    dynamodb_setup()
+    response = client.get("/v1/orders?user=id100&next_token=not-a-token", headers={"Auth-Token": generate_token('id100')})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid next_token."}
+
+@mock_dynamodb
+def test_get_orders_next_token_must_fit_the_query(mock_env):
+    from Database.pagination import encode_token, query_scope
+    from Database.schema import OWNER_INDEX
+    ddb = dynamodb_setup()
+    for i in range(3):
+        ddb.put_item(Item=with_derived({'cart_id': f'cart{i}', 'owner_id': 'id100', 'state': 'PAID'}))
+    headers = {"Auth-Token": generate_token('id100')}
+    token = client.get("/v1/orders?user=id100&limit=1", headers=headers).headers['X-Next-Token']
+    # Decodes, but is not a cursor of this API
+    response = client.get("/v1/orders?user=id100&next_token=eyIwIjp7ImEiOnsiUyI6IngifX19", headers=headers)
+    assert response.status_code == 400
+    # A token of another query
+    response = client.get(f"/v1/orders?user=id100&state=PAID&limit=1&next_token={token}", headers=headers)
+    assert (response.status_code, response.json()) == (400, {"detail": "next_token does not belong to this query."})
+    # Scoped to the query, but the key doesn't have the key attributes of the index
+    scope = query_scope([(OWNER_INDEX, None)], 'id100', None, None, None, False, 'full')
+    for key in ({'a': 'x'}, {'cart_id': 'cart0', 'owner_id': 'id100', 'state': 'PAID', 'a': 'x'}, {'cart_id': 'cart0', 'owner_id': 'id100', 'state': 1}):
+        response = client.get(f"/v1/orders?user=id100&limit=1&next_token={encode_token({0: key}, scope)}", headers=headers)
+        assert response.status_code == 400
+
+@mock_dynamodb
+def test_get_orders_stream(mock_env):
+    ddb = dynamodb_setup()
+    for i in range(3):
+        ddb.put_item(Item=with_derived({'cart_id': f'id{i}', 'owner_id': f'owner{i}', 'state': 'PAID', 'items': [{'item_id': 'a', 'name': 'tv', 'price': Decimal('1.5'), 'quantity': 2}]}))
+    response = client.get("/v1/orders?state=PAID&stream=true&limit=1", headers={"Auth-Token": generate_token('adminID', True)})
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    orders = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(order['cart_id'] for order in orders) == ['id0', 'id1', 'id2']
+    assert orders[0]['items'][0]['price'] == 1.5
+
+@mock_dynamodb
+def test_get_orders_stream_DB_error(mock_env):
+    dynamodb_setup().delete() # delete table to simulate DB error
+    response = client.get("/v1/orders?state=PAID&stream=true", headers={"Auth-Token": generate_token('adminID', True)})
+    assert response.status_code == 500
+
 @mock_dynamodb
 def test_get_orders_bad_request(mock_env):
     dynamodb_setup()
     response = client.get("/v1/orders", headers={"Auth-Token": generate_token('adminID', True)})
     assert response.status_code == 400
-    assert response.json() == {"detail": "Query parameter 'user' or 'state' is required."}
\ No newline at end of file
+    assert response.json() == {"detail": "Query parameter 'user' or 'state' is required."}
+@mock_dynamodb
+def test_open_carts_expire(mock_env, monkeypatch):
+    import time
+    ddb = dynamodb_setup()
+    headers = {"Auth-Token": generate_token('id5')}
+    before = int(time.time())
+    response = client.post("/v1/orders", headers=headers)
+    cart_id = response.json()['cart_id']
+    assert 'expires_at' not in response.json()
+    expires_at = ddb.get_item(Key={'cart_id': cart_id})['Item']['expires_at']
+    assert before + 30 * 86400 <= expires_at <= time.time() + 30 * 86400
+
+    # Every change moves the expiry; checkout removes it, so paid carts are kept
+    monkeypatch.setenv("CART_TTL_DAYS", "60")
+    client.patch(f"/v1/orders/{cart_id}/items", headers=headers, json=[{"op": "add", "item": {"item_id": "a", "name": "tv", "price": "1", "quantity": 1}}])
+    assert ddb.get_item(Key={'cart_id': cart_id})['Item']['expires_at'] >= before + 60 * 86400
+    client.post(f"/v1/orders/{cart_id}/checkout", headers=headers)
+    assert 'expires_at' not in ddb.get_item(Key={'cart_id': cart_id})['Item']
+    response = client.patch(f"/v1/orders/{cart_id}", headers=headers, json=[{"item_id": "a", "name": "tv", "price": "1", "quantity": 2}])
+    assert response.status_code == 200
+    assert 'expires_at' not in ddb.get_item(Key={'cart_id': cart_id})['Item']
+
+    monkeypatch.setenv("CART_TTL_DAYS", "0")
+    cart_id = client.post("/v1/orders", headers=headers).json()['cart_id']
+    assert 'expires_at' not in ddb.get_item(Key={'cart_id': cart_id})['Item']
+
+# Idempotency-Key: (POST /v1/orders, POST /v1/orders/uuid/checkout)
+@mock_dynamodb
+def test_create_shopping_cart_idempotency_key(mock_env, counting_table):
+    ddb = dynamodb_setup()
+    create_idempotency_table(boto3.resource('dynamodb', region_name='ap-southeast-2'))
+    table = counting_table(ddb)
+    headers = {"Auth-Token": generate_token('id5'), "Idempotency-Key": "key-1"}
+    first = client.post("/v1/orders", headers=headers)
+    assert first.status_code == 200
+    assert 'Idempotent-Replayed' not in first.headers
+
+    # The retry gets the same cart back without writing it again
+    retry = client.post("/v1/orders", headers=headers)
+    assert retry.status_code == 200
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.headers['ETag'] == first.headers['ETag'] == '"1"'
+    assert retry.json() == first.json()
+    assert table.calls == ['put_item']
+
+    # From another process: one read of the stored response
+    reset_idempotency_cache()
+    assert client.post("/v1/orders", headers=headers).json() == first.json()
+    assert len(ddb.scan()['Items']) == 1
+
+    # Keys are scoped to the user, and requests without a key are not deduplicated
+    other = client.post("/v1/orders", headers={**headers, "Auth-Token": generate_token('id6')})
+    assert other.json()['cart_id'] != first.json()['cart_id']
+    assert client.post("/v1/orders", headers={"Auth-Token": generate_token('id5')}).json()['cart_id'] != first.json()['cart_id']
+
+@mock_dynamodb
+def test_checkout_shopping_cart_idempotency_key(mock_env):
+    ddb = dynamodb_setup()
+    idempotency = create_idempotency_table(boto3.resource('dynamodb', region_name='ap-southeast-2'))
+    ddb.put_item(Item={'cart_id': 'CartID100', 'owner_id': 'OwnerID100', 'state': 'open'})
+    headers = {"Auth-Token": generate_token('OwnerID100'), "Idempotency-Key": "key-1"}
+
+    # Failed requests release their key
+    response = client.post("/v1/orders/CartID200/checkout", headers=headers)
+    assert response.status_code == 404
+    assert idempotency.scan()['Items'] == []
+
+    first = client.post("/v1/orders/CartID100/checkout", headers=headers)
+    assert first.status_code == 200
+    retry = client.post("/v1/orders/CartID100/checkout", headers=headers)
+    assert (retry.status_code, retry.json()) == (200, first.json())
+    # Without the key the retry is a second checkout
+    assert client.post("/v1/orders/CartID100/checkout", headers={"Auth-Token": generate_token('OwnerID100')}).status_code == 400
+
+@mock_dynamodb
+def test_idempotency_key_in_progress(mock_env):
+    import time
+    dynamodb_setup()
+    idempotency = create_idempotency_table(boto3.resource('dynamodb', region_name='ap-southeast-2'))
+    headers = {"Auth-Token": generate_token('id5'), "Idempotency-Key": "key-1"}
+    idempotency.put_item(Item={'idempotency_key': 'id5#create#key-1', 'status': 'pending', 'expires_at': int(time.time()) + 60})
+    response = client.post("/v1/orders", headers=headers)
+    assert response.status_code == 409
+    # A claim that expired (its request never finished) is taken over
+    idempotency.put_item(Item={'idempotency_key': 'id5#create#key-1', 'status': 'pending', 'expires_at': int(time.time()) - 1})
+    assert client.post("/v1/orders", headers=headers).status_code == 200
+    assert idempotency.get_item(Key={'idempotency_key': 'id5#create#key-1'})['Item']['status'] == 'completed'
+
+@mock_dynamodb
+def test_idempotency_release_keeps_a_taken_over_claim(mock_env):
+    import asyncio
+    import time
+    from Database.idempotency import IdempotencyStore
+    dynamodb_setup()
+    idempotency = create_idempotency_table(boto3.resource('dynamodb', region_name='ap-southeast-2'))
+    store = IdempotencyStore(idempotency)
+    first = asyncio.run(store.claim('key-1'))
+    # The first request ran past PENDING_SECONDS and another one took the key over
+    idempotency.update_item(Key={'idempotency_key': 'key-1'}, UpdateExpression="SET expires_at = :past", ExpressionAttributeValues={':past': int(time.time()) - 1})
+    second = asyncio.run(store.claim('key-1'))
+    assert second is not None and second != first
+    # The first request fails: releasing its claim leaves the second one in place
+    asyncio.run(store.release('key-1', first))
+    assert idempotency.get_item(Key={'idempotency_key': 'key-1'})['Item']['claim'] == second
+    assert asyncio.run(store.claim('key-1')) is None
+    asyncio.run(store.release('key-1', second))
+    assert 'Item' not in idempotency.get_item(Key={'idempotency_key': 'key-1'})
+
+# Versions and ETags: (If-None-Match on GET, If-Match on PATCH and checkout)
+@mock_dynamodb
+def test_cart_versions_and_etags(mock_env, counting_table):
+    ddb = dynamodb_setup()
+    headers = {"Auth-Token": generate_token('id5')}
+    created = client.post("/v1/orders", headers=headers)
+    cart_id = created.json()['cart_id']
+    assert (created.json()['version'], created.headers['ETag']) == (1, '"1"')
+
+    item = {"item_id": "a", "name": "tv", "price": "1", "quantity": 1}
+    updated = client.patch(f"/v1/orders/{cart_id}", headers={**headers, "If-Match": '"1"'}, json=[item])
+    assert (updated.status_code, updated.headers['ETag']) == (200, '"2"')
+    patched = client.patch(f"/v1/orders/{cart_id}/items", headers={**headers, "If-Match": '"2"'}, json=[{"op": "set_quantity", "item_id": "a", "quantity": 3}])
+    assert (patched.status_code, patched.json()['version']) == (200, 3)
+
+    # The other device still has version 2: its write is rejected instead of overwriting the change
+    stale = client.patch(f"/v1/orders/{cart_id}", headers={**headers, "If-Match": '"2"'}, json=[])
+    assert stale.status_code == 412
+    stale = client.patch(f"/v1/orders/{cart_id}/items", headers={**headers, "If-Match": '"1", "2"'}, json=[{"op": "remove", "item_id": "a"}])
+    assert stale.status_code == 412
+    assert client.post(f"/v1/orders/{cart_id}/checkout", headers={**headers, "If-Match": 'W/"3"'}).status_code == 412
+    assert ddb.get_item(Key={'cart_id': cart_id})['Item']['item_count'] == 3
+
+    # Conditional GET: 304 without the cart while the client's copy is current
+    table = counting_table(ddb)
+    response = client.get(f"/v1/orders/{cart_id}", headers={**headers, "If-None-Match": '"3"'})
+    assert (response.status_code, response.content, response.headers['ETag']) == (304, b'', '"3"')
+    assert table.calls == []
+    # Another version than the cached one is checked against DynamoDB
+    assert client.get(f"/v1/orders/{cart_id}", headers={**headers, "If-None-Match": '"2"'}).json()['version'] == 3
+    assert table.calls == ['get_item']
+
+    checkout = client.post(f"/v1/orders/{cart_id}/checkout", headers={**headers, "If-Match": '"3"'})
+    assert (checkout.status_code, checkout.headers['ETag']) == (200, '"4"')
+    assert table.calls == ['get_item', 'update_item']
+
+    # Written through another process: this process's cache still holds version 4
+    client.get(f"/v1/orders/{cart_id}", headers=headers)
+    ddb.update_item(Key={'cart_id': cart_id}, UpdateExpression="SET version = :version", ExpressionAttributeValues={':version': 5})
+    response = client.get(f"/v1/orders/{cart_id}", headers={**headers, "If-None-Match": '"5"'})
+    assert (response.status_code, response.headers['ETag']) == (304, '"5"')
+    response = client.get(f"/v1/orders/{cart_id}", headers={**headers, "If-None-Match": '"4"'})
+    assert (response.status_code, response.json()['version']) == (200, 5)
+
+@mock_dynamodb
+def test_if_match_on_cart_without_version(mock_env):
+    ddb = dynamodb_setup()
+    ddb.put_item(Item={'cart_id': 'CartID100', 'owner_id': 'OwnerID100', 'state': 'open', 'items': {}, 'subtotal': 0, 'item_count': 0, 'line_count': 0})
+    headers = {"Auth-Token": generate_token('OwnerID100')}
+    response = client.get("/v1/orders/CartID100", headers=headers)
+    assert (response.json()['version'], response.headers['ETag']) == (0, '"0"')
+    assert client.patch("/v1/orders/CartID100", headers={**headers, "If-Match": '"1"'}, json=[]).status_code == 412
+    response = client.patch("/v1/orders/CartID100", headers={**headers, "If-Match": '"0"'}, json=[])
+    assert (response.status_code, response.json()['version']) == (200, 1)
+    # Without If-Match (or with *) any version is written
+    assert client.patch("/v1/orders/CartID100", headers={**headers, "If-Match": '*'}, json=[]).json()['version'] == 2
+    assert client.post("/v1/orders/CartID100/checkout", headers=headers).json()['version'] == 3
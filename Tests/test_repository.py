@@ -0,0 +1,143 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from Database.repository import CartRepository
+
+class SlowTable:
+    def __init__(self, delay):
+        self.delay = delay
+        self.threads = set()
+
+    def get_item(self, Key):
+        self.threads.add(threading.current_thread().name)
+        time.sleep(self.delay)
+        return {"Item": {"cart_id": Key["cart_id"]}}
+
+def test_repository_overlaps_calls_on_its_executor():
+    table = SlowTable(0.2)
+    repo = CartRepository(table, ThreadPoolExecutor(max_workers=10, thread_name_prefix="test-ddb"))
+
+    async def fetch_all():
+        return await asyncio.gather(*(repo.get_cart(str(i)) for i in range(10)))
+
+    start = time.perf_counter()
+    carts = asyncio.run(fetch_all())
+    elapsed = time.perf_counter() - start
+    assert [cart["cart_id"] for cart in carts] == [str(i) for i in range(10)]
+    assert elapsed < 1
+    assert all(name.startswith("test-ddb") for name in table.threads)
+
+def test_repository_returns_none_for_missing_cart():
+    class EmptyTable:
+        def get_item(self, Key):
+            return {}
+    assert asyncio.run(CartRepository(EmptyTable()).get_cart("missing")) is None
+
+def test_query_carts_reads_every_page():
+    class PagedTable:
+        def __init__(self):
+            self.calls = []
+
+        def query(self, **kwargs):
+            self.calls.append(kwargs.get("ExclusiveStartKey"))
+            page = len(self.calls)
+            response = {"Items": [{"cart_id": f"{page}-{i}"} for i in range(2)]}
+            if page < 3:
+                response["LastEvaluatedKey"] = {"cart_id": f"{page}-1"}
+            return response
+
+    table = PagedTable()
+    carts = asyncio.run(CartRepository(table).query_carts([("state-index", None)]))
+    assert len(carts) == 6
+    assert table.calls == [None, {"cart_id": "1-1"}, {"cart_id": "2-1"}]
+
+def test_next_token_round_trip():
+    from decimal import Decimal
+    from Database.pagination import decode_token, encode_token
+    cursor = {0: {"cart_id": "abc", "owner_id": "u1", "created": Decimal("12")}, 3: None}
+    assert decode_token(encode_token(cursor)) == cursor
+
+def test_query_page_splits_limit_between_partitions():
+    class ShardTable:
+        def __init__(self):
+            self.limits = {}
+
+        def query(self, IndexName, KeyConditionExpression, Limit=None, ExclusiveStartKey=None):
+            self.limits[KeyConditionExpression] = Limit
+            return {"Items": [{"cart_id": f"{KeyConditionExpression}-{i}"} for i in range(Limit)], "LastEvaluatedKey": {"cart_id": "last"}}
+
+    table = ShardTable()
+    partitions = [("state-index", f"shard{n}") for n in range(4)]
+    items, cursor = asyncio.run(CartRepository(table).query_page(partitions, limit=6))
+    assert len(items) == 6
+    assert table.limits == {"shard0": 2, "shard1": 2, "shard2": 1, "shard3": 1}
+    assert cursor == {n: {"cart_id": "last"} for n in range(4)}
+    # With fewer items than shards, unread shards stay in the cursor for the next page
+    table.limits.clear()
+    items, cursor = asyncio.run(CartRepository(table).query_page(partitions, limit=2))
+    assert table.limits == {"shard0": 1, "shard1": 1}
+    assert cursor == {0: {"cart_id": "last"}, 1: {"cart_id": "last"}, 2: None, 3: None}
+
+def test_batch_get_retries_unprocessed_keys():
+    class Client:
+        def __init__(self):
+            self.calls = 0
+
+        def batch_get_item(self, RequestItems):
+            self.calls += 1
+            keys = RequestItems["e-commerce"]["Keys"]
+            # Serve one key per call and hand the rest back as unprocessed
+            response = {"Responses": {"e-commerce": [{"cart_id": keys[0]["cart_id"]}]}}
+            if len(keys) > 1:
+                response["UnprocessedKeys"] = {"e-commerce": {"Keys": keys[1:]}}
+            return response
+
+    class Table:
+        name = "e-commerce"
+
+        class meta:
+            client = Client()
+
+    repo = CartRepository(Table())
+    repo._backoff = lambda attempt: asyncio.sleep(0)
+    carts, unprocessed = asyncio.run(repo.batch_get_carts(["a", "b", "c"]))
+    assert sorted(carts) == ["a", "b", "c"]
+    assert unprocessed == []
+    assert Table.meta.client.calls == 3
+
+    repo.batch_retries = 1
+    carts, unprocessed = asyncio.run(repo.batch_get_carts(["a", "b", "c", "d"]))
+    assert sorted(carts) == ["a", "b"]
+    assert unprocessed == ["c", "d"]
+
+def test_complete_uses_eventually_consistent_reads():
+    class Client:
+        def __init__(self):
+            self.consistent = []
+
+        def batch_get_item(self, RequestItems):
+            request = RequestItems["e-commerce"]
+            self.consistent.append(request["ConsistentRead"])
+            return {"Responses": {"e-commerce": [{"cart_id": key["cart_id"], "items": []} for key in request["Keys"]]}}
+
+    class Table:
+        name = "e-commerce"
+
+        class meta:
+            client = Client()
+
+    repo = CartRepository(Table())
+    items = asyncio.run(repo._complete([{"cart_id": "a"}, {"cart_id": "b"}], ["a", "b"]))
+    assert items == [{"cart_id": "a", "items": []}, {"cart_id": "b", "items": []}]
+    asyncio.run(repo.batch_get_carts(["a"]))
+    assert Table.meta.client.consistent == [False, True]
+
+def test_items_attributes_totals_match_stored_items():
+    from Database.records import items_attributes
+    attributes = items_attributes([
+        {"item_id": "a", "name": "tv", "description": None, "price": 1, "quantity": 1},
+        {"item_id": "a", "name": "tv", "description": None, "price": 2, "quantity": 3},
+    ], version=1)
+    assert attributes["items"] == {"a": {"name": "tv", "description": None, "price": 2, "quantity": 3}}
+    assert (attributes["subtotal"], attributes["item_count"], attributes["line_count"]) == (6, 3, 1)
@@ -0,0 +1,102 @@
+import pytest
+from fastapi.testclient import TestClient
+from moto import mock_dynamodb
+from Auth.tokens import reset_token_cache
+from Database import repository
+from Database.connection import reset_connection
+from Metrics.middleware import reset_settings
+from Tests.test_orders import dynamodb_setup
+from main import app
+
+@pytest.fixture(autouse=True)
+def mock_env(monkeypatch):
+    monkeypatch.setenv("JWT_SECRET", "test_secret_key")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "ap-southeast-2")
+    monkeypatch.setenv("METRICS_SINK", "none")
+    reset_connection()
+    reset_token_cache()
+    reset_settings()
+    yield
+    reset_connection()
+    reset_token_cache()
+    reset_settings()
+
+def test_healthz():
+    response = TestClient(app).get("/healthz")
+    assert (response.status_code, response.json()) == (200, {"status": "ok"})
+
+@mock_dynamodb
+def test_readyz(monkeypatch):
+    client = TestClient(app)
+    # The table doesn't exist yet
+    assert client.get("/readyz").status_code == 503
+    dynamodb_setup()
+    assert client.get("/readyz").json() == {"status": "ready"}
+    monkeypatch.delenv("JWT_SECRET")
+    reset_token_cache()
+    response = client.get("/readyz")
+    assert (response.status_code, response.json()['detail']) == (503, "JWT_SECRET is not set")
+
+# Server mode: workers connect before the first request and stop the DynamoDB executor on shutdown
+@mock_dynamodb
+def test_lifespan():
+    dynamodb_setup()
+    with TestClient(app) as client:
+        executor = repository.get_executor()
+        assert client.get("/readyz").status_code == 200
+    assert repository._executor is None
+    assert executor._shutdown
+
+def free_port() -> int:
+    import socket
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+# Start a server process, wait for /healthz, then stop it with SIGTERM; returns its exit code
+def run_server(command, port):
+    import os
+    import signal
+    import subprocess
+    import sys
+    import time
+    import httpx
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "JWT_SECRET": "test_secret_key", "AWS_DEFAULT_REGION": "ap-southeast-2", "AWS_ACCESS_KEY_ID": "test",
+           "AWS_SECRET_ACCESS_KEY": "test", "METRICS_SINK": "none", "PORT": str(port), "HOST": "127.0.0.1", "GRACEFUL_TIMEOUT": "5"}
+    process = subprocess.Popen([sys.executable, *command], cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                response = httpx.get(f"http://127.0.0.1:{port}/healthz")
+                break
+            except httpx.TransportError:
+                assert process.poll() is None and time.time() < deadline, process.stderr.read().decode() if process.poll() is not None else "server did not start"
+                time.sleep(0.2)
+        assert (response.status_code, response.json()) == (200, {"status": "ok"})
+        process.send_signal(signal.SIGTERM)
+        return process.wait(timeout=20)
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+# The settings of server.py and gunicorn.conf.py are accepted by the pinned uvicorn and gunicorn
+# (requirements-server.txt), and both start workers and stop on SIGTERM
+def test_uvicorn_accepts_server_options():
+    uvicorn = pytest.importorskip("uvicorn")
+    from server import uvicorn_options
+    config = uvicorn.Config("main:app", workers=2, **uvicorn_options())
+    assert config.timeout_graceful_shutdown == 30 and config.timeout_keep_alive == 75
+
+def test_server_py_starts_and_stops():
+    pytest.importorskip("uvicorn")
+    port = free_port()
+    assert run_server(["server.py", "--host", "127.0.0.1", "--port", str(port), "--workers", "2"], port) == 0
+
+def test_gunicorn_conf_starts_and_stops():
+    pytest.importorskip("gunicorn")
+    pytest.importorskip("uvicorn")
+    port = free_port()
+    assert run_server(["-m", "gunicorn", "-c", "gunicorn.conf.py", "--workers", "2", "main:app"], port) == 0
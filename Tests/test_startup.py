@@ -0,0 +1,21 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def imported_modules(code, **env):
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT, env={**os.environ, **env}, capture_output=True, text=True, check=True,
+    )
+    return result.stdout.split()
+
+# boto3, python-jose and dotenv must stay out of the import path of the Lambda handler
+def test_handler_import_is_lazy():
+    code = "import sys, main; print(' '.join(m for m in ('boto3', 'botocore', 'jose', 'dotenv') if m in sys.modules))"
+    assert imported_modules(code, AWS_LAMBDA_FUNCTION_NAME="e-commerce-handler-dev-app") == []
+
+def test_openapi_can_be_disabled():
+    code = "import main; print(main.app.openapi_url, main.app.docs_url)"
+    assert imported_modules(code, OPENAPI_ENABLED="false") == ["None", "None"]
@@ -0,0 +1,149 @@
+import pytest
+from decimal import Decimal
+from moto import mock_dynamodb
+from Database.connection import reset_connection
+from Tests.test_orders import dynamodb_setup, with_derived
+from Tools.backfill import backfill
+from Tools.sweep import sweep
+
+@pytest.fixture(autouse=True)
+def mock_env(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "ap-southeast-2")
+    reset_connection()
+    yield
+    reset_connection()
+
+@mock_dynamodb
+def test_backfill_sets_state_shard(monkeypatch):
+    monkeypatch.setenv("STATE_INDEX_SHARDS", "4")
+    ddb = dynamodb_setup()
+    for i in range(10):
+        ddb.put_item(Item={'cart_id': f'cart{i}', 'owner_id': 'id100', 'state': 'PAID'})
+    ddb.put_item(Item={'cart_id': 'cart10', 'owner_id': 'id100', 'state': 'PAID', 'state_shard': 'PAID#wrong'})
+    # moto ignores Segment/TotalSegments and returns the whole table per segment, so scan with one
+
+    assert backfill(ddb, segments=1, dry_run=True) == {"updated": 11, "unchanged": 0, "skipped": 0}
+    assert 'state_shard' not in ddb.get_item(Key={'cart_id': 'cart0'})['Item']
+
+    assert backfill(ddb, segments=1) == {"updated": 11, "unchanged": 0, "skipped": 0}
+    shards = {ddb.get_item(Key={'cart_id': f'cart{i}'})['Item']['state_shard'] for i in range(11)}
+    assert shards <= {f'PAID#{n}' for n in range(4)}
+    assert backfill(ddb, segments=1) == {"updated": 0, "unchanged": 11, "skipped": 0}
+
+@mock_dynamodb
+def test_backfill_removes_shard_of_open_carts():
+    ddb = dynamodb_setup()
+    ddb.put_item(Item={'cart_id': 'cart0', 'owner_id': 'id100', 'state': 'open', 'state_shard': 'open#3'})
+    assert backfill(ddb, segments=1) == {"updated": 1, "unchanged": 0, "skipped": 0}
+    assert 'state_shard' not in ddb.get_item(Key={'cart_id': 'cart0'})['Item']
+    assert backfill(ddb, segments=1) == {"updated": 0, "unchanged": 1, "skipped": 0}
+
+@mock_dynamodb
+def test_backfill_compacts_items_and_sets_totals(monkeypatch):
+    monkeypatch.setenv("ITEMS_ENCODING", "compact")
+    ddb = dynamodb_setup()
+    item = {'name': 'tv', 'description': None, 'price': 10, 'quantity': 2}
+    ddb.put_item(Item=with_derived({'cart_id': 'map', 'owner_id': 'id100', 'state': 'open', 'items': {'a': item}}))
+    ddb.put_item(Item=with_derived({'cart_id': 'list', 'owner_id': 'id100', 'state': 'open', 'items': [{'item_id': 'a', **item}]}))
+    ddb.put_item(Item=with_derived({'cart_id': 'compact', 'owner_id': 'id100', 'state': 'open', 'iv': 2, 'items': {'a': {'n': 'tv', 'p': 10, 'q': 2}}}))
+
+    assert backfill(ddb, segments=1) == {"updated": 3, "unchanged": 0, "skipped": 0}
+    for cart_id in ('map', 'list', 'compact'):
+        stored = ddb.get_item(Key={'cart_id': cart_id})['Item']
+        assert stored['iv'] == 2 and stored['items'] == {'a': {'n': 'tv', 'p': 10, 'q': 2}}
+        assert (stored['subtotal'], stored['item_count'], stored['line_count']) == (20, 2, 1)
+    assert backfill(ddb, segments=1) == {"updated": 0, "unchanged": 3, "skipped": 0}
+
+@mock_dynamodb
+def test_sweep_archives_and_deletes_abandoned_carts():
+    import io, json
+    from Database.records import deserialize_record
+    ddb = dynamodb_setup()
+    now = 1700000000
+    ddb.put_item(Item={'cart_id': 'expired', 'owner_id': 'id100', 'state': 'open', 'expires_at': now - 10, 'items': {'a': {'name': 'tv', 'price': 10, 'quantity': 2}}})
+    ddb.put_item(Item={'cart_id': 'live', 'owner_id': 'id100', 'state': 'open', 'expires_at': now + 10})
+    ddb.put_item(Item={'cart_id': 'idle', 'owner_id': 'id100', 'state': 'open', 'updated_at': '2023-01-01T00:00:00.000Z'})
+    ddb.put_item(Item={'cart_id': 'recent', 'owner_id': 'id100', 'state': 'open', 'created_at': '2023-11-10T00:00:00.000Z'})
+    ddb.put_item(Item={'cart_id': 'undated', 'owner_id': 'id100', 'state': 'open'})
+    ddb.put_item(Item=with_derived({'cart_id': 'paid', 'owner_id': 'id100', 'state': 'PAID', 'updated_at': '2020-01-01T00:00:00.000Z'}))
+
+    archive = io.StringIO()
+    assert sweep(ddb, segments=1, archive=archive, dry_run=True, now=now) == {"scanned": 5, "abandoned": 2, "deleted": 0, "skipped": 0}
+    assert ddb.get_item(Key={'cart_id': 'expired'}).get('Item')
+
+    archive = io.StringIO()
+    assert sweep(ddb, segments=1, archive=archive, now=now)["deleted"] == 2
+    archived = {record['cart_id']: record for record in map(deserialize_record, map(json.loads, archive.getvalue().splitlines()))}
+    assert sorted(archived) == ['expired', 'idle']
+    assert archived['expired']['items'] == {'a': {'name': 'tv', 'price': 10, 'quantity': 2}}
+    remaining = sorted(item['cart_id'] for item in ddb.scan()['Items'])
+    assert remaining == ['live', 'paid', 'recent', 'undated']
+
+@mock_dynamodb
+def test_sweep_skips_carts_changed_since_the_scan(monkeypatch):
+    import Tools.sweep
+    ddb = dynamodb_setup()
+    now = 1700000000
+    for i in range(3):
+        ddb.put_item(Item={'cart_id': f'cart{i}', 'owner_id': 'id100', 'state': 'open', 'expires_at': now - 10})
+    delete_carts = Tools.sweep.delete_carts
+
+    # cart1 gets a new item (and expiry) after it was scanned, cart2 is checked out
+    def change_then_delete(table, carts):
+        table.update_item(Key={'cart_id': 'cart1'}, UpdateExpression="SET expires_at = :e", ExpressionAttributeValues={":e": now + 1000})
+        table.update_item(Key={'cart_id': 'cart2'}, UpdateExpression="SET #state = :paid REMOVE expires_at", ExpressionAttributeNames={"#state": "state"}, ExpressionAttributeValues={":paid": "PAID"})
+        return delete_carts(table, carts)
+    monkeypatch.setattr(Tools.sweep, "delete_carts", change_then_delete)
+
+    assert sweep(ddb, segments=1, now=now) == {"scanned": 3, "abandoned": 3, "deleted": 1, "skipped": 2}
+    assert sorted(item['cart_id'] for item in ddb.scan()['Items']) == ['cart1', 'cart2']
+
+@mock_dynamodb
+def test_export_carts_rows_and_report(tmp_path):
+    import json
+    from Tools.export_carts import Report, export, open_writer, CART_COLUMNS, ITEM_COLUMNS
+    ddb = dynamodb_setup()
+    tv, cable = {'name': 'tv', 'price': 100, 'quantity': 1}, {'name': 'cable', 'price': Decimal('2.5'), 'quantity': 4}
+    ddb.put_item(Item=with_derived({'cart_id': 'cart0', 'owner_id': 'id100', 'state': 'PAID', 'items': {'tv': tv, 'cable': cable}, 'subtotal': 110, 'item_count': 5, 'line_count': 2}))
+    # Written before the totals were stored
+    ddb.put_item(Item=with_derived({'cart_id': 'cart1', 'owner_id': 'id200', 'state': 'PAID', 'items': {'cable': {**cable, 'quantity': 2}}}))
+    ddb.put_item(Item={'cart_id': 'cart2', 'owner_id': 'id200', 'state': 'open', 'items': {'tv': tv}, 'subtotal': 100, 'item_count': 1, 'line_count': 1})
+
+    carts, items = open_writer(str(tmp_path / 'carts.jsonl'), CART_COLUMNS), open_writer(str(tmp_path / 'items.jsonl'), ITEM_COLUMNS)
+    report = Report(top=1)
+    assert export(ddb, segments=1, carts_writer=carts, items_writer=items, report=report) == 3
+    carts.close()
+    items.close()
+
+    rows = sorted((json.loads(line) for line in (tmp_path / 'carts.jsonl').read_text().splitlines()), key=lambda row: row['cart_id'])
+    assert [(row['cart_id'], row['subtotal'], row['item_count']) for row in rows] == [('cart0', 110, 5), ('cart1', 5, 2), ('cart2', 100, 1)]
+    assert len((tmp_path / 'items.jsonl').read_text().splitlines()) == 4
+    result = report.result()
+    assert result['states'] == {'PAID': {'carts': 2, 'revenue': 115, 'items': 7}, 'open': {'carts': 1, 'revenue': 100, 'items': 1}}
+    assert result['top_items_by_quantity'] == [{'item_id': 'cable', 'name': 'cable', 'quantity': 6}]
+    assert result['top_items_by_revenue'] == [{'item_id': 'tv', 'name': 'tv', 'revenue': 200}]
+
+    report = Report()
+    assert export(ddb, segments=1, report=report, state='PAID') == 2
+    assert list(report.result()['states']) == ['PAID']
+
+@mock_dynamodb
+def test_export_carts_parquet(tmp_path):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    from Tools.export_carts import export, open_writer, CART_COLUMNS
+    ddb = dynamodb_setup()
+    ddb.put_item(Item={'cart_id': 'cart0', 'owner_id': 'id100', 'state': 'open', 'items': {}, 'subtotal': Decimal('9.5'), 'item_count': 0, 'line_count': 0})
+    writer = open_writer(str(tmp_path / 'carts.parquet'), CART_COLUMNS)
+    export(ddb, segments=1, carts_writer=writer)
+    writer.close()
+    assert parquet.read_table(tmp_path / 'carts.parquet').to_pylist()[0]['subtotal'] == 9.5
+
+def test_rate_limiter_spaces_out_requests():
+    import time
+    from Tools.throttle import RateLimiter
+    limiter = RateLimiter(20)
+    start = time.perf_counter()
+    for _ in range(30):
+        limiter.acquire()
+    # The first 20 come from the full bucket, the next 10 take about half a second
+    assert 0.4 < time.perf_counter() - start < 1.5
@@ -0,0 +1,79 @@
+# Recompute the derived attributes of existing carts (see Database.records.derived_attributes),
+# e.g. the state index shard after the index was added or STATE_INDEX_SHARDS changed (removing it
+# from carts in unindexed states), and rewrite items that are not stored as a map in the
+# ITEMS_ENCODING format or have no totals (see items_current).
+#   python -m Tools.backfill --segments 4 --max-writes-per-second 50 [--dry-run]
+import argparse
+import threading
+from botocore.exceptions import ClientError
+from Database.connection import get_table
+from Database.scan import parallel_scan
+from Database.records import DERIVED_ATTRIBUTES, decode_items, derived_attributes, items_attributes, items_current, items_version
+from Tools.throttle import RateLimiter
+
+# Bring one cart up to date; returns "updated", "unchanged" or "skipped"
+def backfill_cart(table, cart: dict, limiter: RateLimiter, dry_run: bool) -> str:
+    derived = derived_attributes(cart)
+    updates = {name: value for name, value in derived.items() if cart.get(name) != value}
+    # e.g. the shard of open carts, which are left out of the sparse state index
+    removes = [name for name in DERIVED_ATTRIBUTES if name in cart and name not in derived]
+    if cart.get("items") is not None and not items_current(cart):
+        updates.update(items_attributes(decode_items(cart["items"], items_version(cart))))
+    outcome = "unchanged"
+    if (updates or removes) and dry_run:
+        outcome = "updated"
+    elif updates or removes:
+        limiter.acquire()
+        names = {f"#a{i}": name for i, name in enumerate([*updates, *removes])}
+        values = {f":v{i}": value for i, value in enumerate(updates.values())}
+        update = " ".join(part for part in (
+            "SET " + ", ".join(f"#a{i} = :v{i}" for i in range(len(updates))) if updates else "",
+            "REMOVE " + ", ".join(f"#a{i}" for i in range(len(updates), len(updates) + len(removes))) if removes else "",
+        ) if part)
+        # Skip carts that changed since they were scanned; the writer already set their attributes
+        condition = "#state = :state"
+        if "items" in updates:
+            condition += " AND #items = :items"
+            names["#items"] = "items"
+            values[":items"] = cart["items"]
+        try:
+            table.update_item(
+                Key={"cart_id": cart["cart_id"]},
+                UpdateExpression=update,
+                ConditionExpression=condition,
+                ExpressionAttributeNames={**names, "#state": "state"},
+                ExpressionAttributeValues={**values, ":state": cart.get("state")},
+            )
+            outcome = "updated"
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                raise
+            outcome = "skipped"
+    return outcome
+
+def backfill(table, segments: int = 1, max_writes_per_second: float | None = None, dry_run: bool = False) -> dict:
+    counts = {"updated": 0, "unchanged": 0, "skipped": 0}
+    lock = threading.Lock()
+    limiter = RateLimiter(max_writes_per_second)
+
+    def handle_page(carts: list[dict]):
+        for cart in carts:
+            if "cart_id" not in cart or "owner_id" not in cart:
+                continue
+            outcome = backfill_cart(table, cart, limiter, dry_run)
+            with lock:
+                counts[outcome] += 1
+
+    parallel_scan(table, segments, handle_page)
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--segments", type=int, default=4, help="parallel scan segments")
+    parser.add_argument("--max-writes-per-second", type=float, default=None)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    print(backfill(get_table(), args.segments, args.max_writes_per_second, args.dry_run))
+
+if __name__ == "__main__":
+    main()
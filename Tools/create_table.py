@@ -0,0 +1,28 @@
+# Create the orders table with its indexes and the idempotency table as defined in
+# Database/schema.py, or print their definitions (e.g. for aws dynamodb create-table
+# --cli-input-json) and the TTL specification both use (aws dynamodb update-time-to-live
+# --time-to-live-specification).
+#   python -m Tools.create_table [--table-name e-commerce] [--idempotency-table-name e-commerce-idempotency] [--print]
+import argparse
+import json
+from Database.connection import IDEMPOTENCY_TABLE_NAME, TABLE_NAME
+from Database.schema import create_idempotency_table, create_table, idempotency_table_definition, table_definition, ttl_specification
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--table-name", default=TABLE_NAME)
+    parser.add_argument("--idempotency-table-name", default=IDEMPOTENCY_TABLE_NAME)
+    parser.add_argument("--print", action="store_true", help="print the definitions instead of creating the tables")
+    args = parser.parse_args()
+    if args.print:
+        print(json.dumps(table_definition(args.table_name), indent=2))
+        print(json.dumps(idempotency_table_definition(args.idempotency_table_name), indent=2))
+        print(json.dumps(ttl_specification(), indent=2))
+        return
+    import boto3
+    dynamodb = boto3.resource("dynamodb")
+    for table in (create_table(dynamodb, args.table_name), create_idempotency_table(dynamodb, args.idempotency_table_name)):
+        print(f"created {table.name}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# Export every cart (or the carts in one state) with a parallel scan, for reporting outside the
+# API. Writes one row per cart and/or one row per item to JSON lines or, with the pyarrow package,
+# Parquet files (chosen by the .parquet extension), and/or prints a report of the carts, revenue
+# and items per state and the top items. --max-reads-per-second caps the read capacity used.
+#   python -m Tools.export_carts --segments 8 --max-reads-per-second 200 [--carts carts.parquet] [--items items.parquet] [--report] [--state PAID]
+import argparse
+import threading
+from collections import Counter
+from decimal import Decimal
+from Database.connection import get_table
+from Database.records import public_record
+from Database.scan import parallel_scan
+from Routes.responses import dumps
+from Tools.throttle import RateLimiter
+
+CART_COLUMNS = {"cart_id": "string", "owner_id": "string", "state": "string", "subtotal": "float", "item_count": "int", "line_count": "int", "created_at": "string", "updated_at": "string"}
+ITEM_COLUMNS = {"cart_id": "string", "state": "string", "item_id": "string", "name": "string", "price": "float", "quantity": "int"}
+
+def cart_row(cart: dict) -> dict:
+    return {name: cart.get(name) for name in CART_COLUMNS}
+
+def item_rows(cart: dict) -> list[dict]:
+    return [{"cart_id": cart["cart_id"], "state": cart.get("state"), **{name: item.get(name) for name in ("item_id", "name", "price", "quantity")}} for item in cart.get("items") or []]
+
+# Rows as JSON lines, with DynamoDB's Decimals as ints or floats (see Routes.responses.dumps)
+class JSONLinesWriter:
+    def __init__(self, path: str):
+        self.file = open(path, "wb")
+
+    def write(self, rows: list[dict]):
+        self.file.write(b"".join(dumps(row) + b"\n" for row in rows))
+
+    def close(self):
+        self.file.close()
+
+# Rows as a Parquet file, one row group per scanned page (needs the pyarrow package)
+class ParquetWriter:
+    def __init__(self, path: str, columns: dict):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise RuntimeError("Parquet export requires the 'pyarrow' package") from e
+        types = {"string": pyarrow.string(), "float": pyarrow.float64(), "int": pyarrow.int64()}
+        self.pyarrow = pyarrow
+        self.columns = columns
+        self.schema = pyarrow.schema([(name, types[kind]) for name, kind in columns.items()])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, rows: list[dict]):
+        if not rows:
+            return
+        convert = {"string": lambda value: value, "float": float, "int": int}
+        arrays = [
+            self.pyarrow.array([None if row[name] is None else convert[kind](row[name]) for row in rows], type=self.schema.field(name).type)
+            for name, kind in self.columns.items()
+        ]
+        self.writer.write_table(self.pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+def open_writer(path: str, columns: dict):
+    return ParquetWriter(path, columns) if path.endswith(".parquet") else JSONLinesWriter(path)
+
+# Totals per state and per item, summed per page and merged into the report
+class Report:
+    def __init__(self, top: int = 10):
+        self.top = top
+        self.states = {}
+        self.quantities = Counter()
+        self.revenue = Counter()
+        self.names = {}
+        self._lock = threading.Lock()
+
+    def add(self, carts: list[dict]):
+        states, quantities, revenue, names = {}, Counter(), Counter(), {}
+        for cart in carts:
+            totals = states.setdefault(cart.get("state"), {"carts": 0, "revenue": Decimal(0), "items": 0})
+            totals["carts"] += 1
+            totals["revenue"] += cart.get("subtotal") or 0
+            totals["items"] += cart.get("item_count") or 0
+            for item in cart.get("items") or []:
+                quantities[item["item_id"]] += int(item["quantity"])
+                revenue[item["item_id"]] += Decimal(item["price"]) * Decimal(item["quantity"])
+                names[item["item_id"]] = item.get("name")
+        with self._lock:
+            for state, totals in states.items():
+                merged = self.states.setdefault(state, {"carts": 0, "revenue": Decimal(0), "items": 0})
+                for name, value in totals.items():
+                    merged[name] += value
+            self.quantities.update(quantities)
+            self.revenue.update(revenue)
+            self.names.update(names)
+
+    def result(self) -> dict:
+        return {
+            "states": {state or "": totals for state, totals in sorted(self.states.items(), key=lambda entry: entry[0] or "")},
+            "top_items_by_quantity": [{"item_id": item_id, "name": self.names[item_id], "quantity": quantity} for item_id, quantity in self.quantities.most_common(self.top)],
+            "top_items_by_revenue": [{"item_id": item_id, "name": self.names[item_id], "revenue": revenue} for item_id, revenue in self.revenue.most_common(self.top)],
+        }
+
+# Scan the carts once and feed every page to the writers and the report. Returns the number of carts.
+def export(table, segments: int = 1, carts_writer=None, items_writer=None, report: Report | None = None,
+           max_reads_per_second: float | None = None, state: str | None = None) -> int:
+    lock = threading.Lock()
+    count = 0
+
+    def handle_page(records: list[dict]):
+        nonlocal count
+        # As the API returns them: items decoded and totals computed for carts written before them
+        carts = [public_record(record) for record in records if "cart_id" in record]
+        if report is not None:
+            report.add(carts)
+        with lock:
+            if carts_writer is not None:
+                carts_writer.write([cart_row(cart) for cart in carts])
+            if items_writer is not None:
+                items_writer.write([row for cart in carts for row in item_rows(cart)])
+            count += len(carts)
+
+    kwargs = {}
+    if state is not None:
+        kwargs = {"FilterExpression": "#state = :state", "ExpressionAttributeNames": {"#state": "state"}, "ExpressionAttributeValues": {":state": state}}
+    elif items_writer is None and report is None:
+        # Only the cart rows: leave the items out of the responses (the scan costs the same)
+        kwargs = {"ProjectionExpression": ", ".join(f"#a{i}" for i in range(len(CART_COLUMNS))), "ExpressionAttributeNames": {f"#a{i}": name for i, name in enumerate(CART_COLUMNS)}}
+    parallel_scan(table, segments, handle_page, RateLimiter(max_reads_per_second), **kwargs)
+    return count
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--segments", type=int, default=8, help="parallel scan segments")
+    parser.add_argument("--max-reads-per-second", type=float, default=None, help="read capacity units per second")
+    parser.add_argument("--state", default=None, help="only export carts in this state")
+    parser.add_argument("--carts", default=None, help="file of cart rows (.parquet or JSON lines)")
+    parser.add_argument("--items", default=None, help="file of item rows (.parquet or JSON lines)")
+    parser.add_argument("--report", action="store_true", help="print totals per state and the top items")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    carts_writer = open_writer(args.carts, CART_COLUMNS) if args.carts else None
+    items_writer = open_writer(args.items, ITEM_COLUMNS) if args.items else None
+    report = Report(args.top) if args.report else None
+    try:
+        count = export(get_table(), args.segments, carts_writer, items_writer, report, args.max_reads_per_second, args.state)
+    finally:
+        for writer in (carts_writer, items_writer):
+            if writer is not None:
+                writer.close()
+    print(f"exported {count} carts")
+    if report is not None:
+        print(dumps(report.result()).decode())
+
+if __name__ == "__main__":
+    main()
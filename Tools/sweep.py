@@ -0,0 +1,123 @@
+# Delete abandoned open carts that TTL hasn't removed: carts past their expires_at (DynamoDB
+# deletes expired items within a few days, not at once) and older carts without expires_at that
+# haven't changed for --idle-days. Carts are appended to --archive (one DynamoDB JSON record per
+# line, see Database.records.serialize_record) before they are deleted.
+#   python -m Tools.sweep --segments 4 --max-reads-per-second 100 --max-deletes-per-second 50 [--archive carts.jsonl] [--dry-run]
+import argparse
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from botocore.exceptions import ClientError
+from Database.connection import get_table
+from Database.records import EXPIRES_AT, serialize_record, timestamp
+from Database.repository import RETRYABLE_ERRORS, TRANSACTION_SIZE, chunked
+from Database.scan import parallel_scan
+from Tools.throttle import RateLimiter
+
+MAX_ATTEMPTS = 8
+
+# Whether a scanned open cart is abandoned: expired, or without expiry and idle since `idle_before`
+# (carts without any timestamp are left alone, their age is unknown)
+def abandoned(cart: dict, now: float, idle_before: str) -> bool:
+    if EXPIRES_AT in cart:
+        return cart[EXPIRES_AT] <= now
+    last_change = cart.get("updated_at") or cart.get("created_at")
+    return last_change is not None and last_change < idle_before
+
+# Deleted only if it is still open and unchanged since it was scanned
+def delete_condition(cart: dict) -> dict:
+    condition = "#state = :open"
+    values = {":open": "open"}
+    for i, name in enumerate((EXPIRES_AT, "updated_at")):
+        if name in cart:
+            condition += f" AND #c{i} = :c{i}"
+            values[f":c{i}"] = cart[name]
+        else:
+            condition += f" AND attribute_not_exists(#c{i})"
+    return {
+        "ConditionExpression": condition,
+        "ExpressionAttributeNames": {"#state": "state", "#c0": EXPIRES_AT, "#c1": "updated_at"},
+        "ExpressionAttributeValues": values,
+    }
+
+# Conditional deletes in one transaction; carts whose condition fails are dropped and the rest
+# committed again. Returns the number of carts deleted and skipped.
+def delete_carts(table, carts: list[dict]) -> tuple[int, int]:
+    pending, skipped = list(carts), 0
+    for attempt in range(MAX_ATTEMPTS):
+        if not pending:
+            break
+        try:
+            table.meta.client.transact_write_items(TransactItems=[
+                {"Delete": {"TableName": table.name, "Key": {"cart_id": cart["cart_id"]}, **delete_condition(cart)}}
+                for cart in pending
+            ])
+            return len(pending), skipped
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            reasons = e.response.get("CancellationReasons") or []
+            failed = {cart["cart_id"] for cart, reason in zip(pending, reasons) if reason.get("Code") == "ConditionalCheckFailed"}
+            if code == "TransactionCanceledException" and failed:
+                skipped += len(failed)
+                pending = [cart for cart in pending if cart["cart_id"] not in failed]
+                continue
+            if code != "TransactionCanceledException" and code not in RETRYABLE_ERRORS:
+                raise
+        time.sleep(min(0.05 * 2 ** attempt, 2))
+    raise RuntimeError(f"{len(pending)} carts were not deleted after {MAX_ATTEMPTS} attempts")
+
+def sweep(table, segments: int = 1, idle_days: float = 30, archive=None, max_reads_per_second: float | None = None,
+          max_deletes_per_second: float | None = None, dry_run: bool = False, now: float | None = None) -> dict:
+    now = now or time.time()
+    idle_before = timestamp(datetime.fromtimestamp(now, timezone.utc) - timedelta(days=idle_days))
+    counts = {"scanned": 0, "abandoned": 0, "deleted": 0, "skipped": 0}
+    lock = threading.Lock()
+    readers, deleters = RateLimiter(max_reads_per_second), RateLimiter(max_deletes_per_second)
+
+    def handle_page(carts: list[dict]):
+        found = [cart for cart in carts if "cart_id" in cart and abandoned(cart, now, idle_before)]
+        deleted = skipped = 0
+        if found and archive is not None:
+            lines = "".join(json.dumps(serialize_record(cart)) + "\n" for cart in found)
+            with lock:
+                archive.write(lines)
+                archive.flush()
+        if not dry_run:
+            for chunk in chunked(found, TRANSACTION_SIZE):
+                deleters.acquire(len(chunk))
+                done, failed = delete_carts(table, chunk)
+                deleted, skipped = deleted + done, skipped + failed
+        with lock:
+            counts["scanned"] += len(carts)
+            counts["abandoned"] += len(found)
+            counts["deleted"] += deleted
+            counts["skipped"] += skipped
+
+    # Open carts are not in the sparse state index, so they are found with a filtered scan
+    parallel_scan(
+        table, segments, handle_page, readers,
+        FilterExpression="#state = :open",
+        ExpressionAttributeNames={"#state": "state"},
+        ExpressionAttributeValues={":open": "open"},
+    )
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--segments", type=int, default=4, help="parallel scan segments")
+    parser.add_argument("--idle-days", type=float, default=30, help="age of the last change of carts without expires_at")
+    parser.add_argument("--archive", default=None, help="JSON lines file the carts are appended to before they are deleted")
+    parser.add_argument("--max-reads-per-second", type=float, default=None, help="read capacity units per second")
+    parser.add_argument("--max-deletes-per-second", type=float, default=None)
+    parser.add_argument("--dry-run", action="store_true", help="count (and archive) abandoned carts without deleting them")
+    args = parser.parse_args()
+    archive = open(args.archive, "a") if args.archive else None
+    try:
+        print(sweep(get_table(), args.segments, args.idle_days, archive, args.max_reads_per_second, args.max_deletes_per_second, args.dry_run))
+    finally:
+        if archive is not None:
+            archive.close()
+
+if __name__ == "__main__":
+    main()
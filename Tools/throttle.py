@@ -0,0 +1,26 @@
+import threading
+import time
+
+# Token bucket shared by the worker threads of a tool, so bulk jobs don't compete with live traffic
+class RateLimiter:
+    def __init__(self, rate: float | None):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._tokens = rate or 0
+        self._updated = time.monotonic()
+
+    # Block until `amount` units (writes, read capacity units, ...) are available
+    def acquire(self, amount: float = 1):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                # Requests larger than the bucket are let through once it is full, and go into debt
+                if self._tokens >= min(amount, self.rate):
+                    self._tokens -= amount
+                    return
+                wait = (min(amount, self.rate) - self._tokens) / self.rate
+            time.sleep(wait)
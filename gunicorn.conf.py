@@ -0,0 +1,12 @@
+# gunicorn -c gunicorn.conf.py main:app (see server.py)
+import os
+from server import default_workers, graceful_timeout, keepalive_timeout
+
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', '8000')}"
+workers = default_workers()
+worker_class = "uvicorn.workers.UvicornWorker"
+graceful_timeout = graceful_timeout()
+keepalive = keepalive_timeout()
+# Import the app once before forking: importing main opens no connections or threads, so the
+# workers share its memory and still create their own DynamoDB clients
+preload_app = True
@@ -1,7 +1,42 @@
+import os
+
+# Read a local .env file for development, before any module reads its settings. Skipped on Lambda
+# (or with LOAD_DOTENV=false), where the configuration comes from the function's environment and
+# the file system scan only slows cold starts.
+if os.environ.get("LOAD_DOTENV", "false" if os.environ.get("AWS_LAMBDA_FUNCTION_NAME") else "true").lower() == "true":
+    from dotenv import load_dotenv
+    load_dotenv()
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from Routes import orders
+from Auth.tokens import get_jwt_secret
+from Database.connection import get_table
+from Database.repository import shutdown_executor
+from Routes import health, orders
+from Metrics.middleware import MetricsMiddleware
 from mangum import Mangum
 
-app = FastAPI()
+# The OpenAPI schema is only built when /openapi.json or /docs is first requested. Set
+# OPENAPI_ENABLED=false to remove those routes entirely (e.g. in production).
+openapi_enabled = os.environ.get("OPENAPI_ENABLED", "true").lower() == "true"
+
+# Lifespan events only run in server mode (see server.py). Workers connect to DynamoDB and read
+# the JWT secret before they take requests, and let in-flight DynamoDB calls finish on shutdown.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_table()
+    get_jwt_secret()
+    yield
+    shutdown_executor()
+
+app = FastAPI(
+    lifespan=lifespan,
+    openapi_url="/openapi.json" if openapi_enabled else None,
+    docs_url="/docs" if openapi_enabled else None,
+    redoc_url="/redoc" if openapi_enabled else None,
+)
 app.include_router(orders.router)
-handler = Mangum(app)
+app.include_router(health.router)
+app.add_middleware(MetricsMiddleware)
+# No lifespan events on Lambda: nothing to start up, and each cold start would pay for the handshake
+handler = Mangum(app, lifespan="off")
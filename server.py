@@ -0,0 +1,46 @@
+# Long-running server mode, e.g. in a container, next to the Lambda handler (main.handler): the
+# same app served by uvicorn worker processes (needs requirements-server.txt).
+#   python server.py [--host 0.0.0.0] [--port 8000] [--workers 4]
+# or with gunicorn managing the workers (see gunicorn.conf.py):
+#   gunicorn -c gunicorn.conf.py main:app
+# Every worker has its own DynamoDB connection pool and executor, JWT cache and cart cache (use
+# CART_CACHE_BACKEND=redis to share carts between workers), created on first use after the fork.
+import argparse
+import os
+
+# One worker per CPU: a worker serves many requests at once, since DynamoDB calls wait on its
+# executor threads rather than on the event loop. WEB_CONCURRENCY overrides it.
+def default_workers() -> int:
+    return int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+
+# Seconds in-flight requests get to finish after SIGTERM before the worker is stopped
+def graceful_timeout() -> int:
+    return int(os.environ.get("GRACEFUL_TIMEOUT", "30"))
+
+# Idle keep-alive connections are kept longer than a load balancer keeps them (60s on an ALB), so
+# the server never closes a connection the balancer is about to reuse
+def keepalive_timeout() -> int:
+    return int(os.environ.get("KEEPALIVE_TIMEOUT", "75"))
+
+# uvicorn settings besides the address and the number of workers
+def uvicorn_options() -> dict:
+    return {
+        "lifespan": "on",
+        "timeout_keep_alive": keepalive_timeout(),
+        "timeout_graceful_shutdown": graceful_timeout(),
+        # Requests are already measured by Metrics.middleware
+        "access_log": False,
+        "proxy_headers": True,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    args = parser.parse_args()
+    import uvicorn
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers, **uvicorn_options())
+
+if __name__ == "__main__":
+    main()